@@ -0,0 +1,265 @@
+"""
+Counting accuracy and throughput benchmark against annotated videos.
+
+Every configuration from the manifest is replayed (see 'offline.replay')
+on every annotated video in a separate process. Count error, event timing
+error, FPS and peak RSS are saved into a JSON report, which can be compared
+between runs.
+
+Manifest format:
+    {
+        "videos": [
+            {
+                "name": "morning_peak",
+                "paths": ["video_2024-05-01_hour8_cam1.mp4"],
+                "count_in": 12,
+                "count_out": 9,
+                "events": [{"event": "enter", "time": 31.5}, ...]
+            }
+        ],
+        "configs": {
+            "baseline": {"config": "config/main.json"},
+            "low_conf": {"config": "config/main.json", "overrides": {"detect_conf": 0.3}}
+        }
+    }
+Event times are in seconds since the start of the first video file.
+
+Usage:
+    python -m benchmarks.accuracy manifest.json --out report.json
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+
+# Replay is run as a module from the repository root
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            stderr=subprocess.DEVNULL,
+            cwd=REPO_DIR,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_config(config: dict, directory: str) -> str:
+    """Write config with overrides into a temporary file."""
+    with open(config["config"], "r", encoding="utf-8") as config_file:
+        kwargs = json.load(config_file)
+    kwargs.update(config.get("overrides", {}))
+    # Keep production logs and videos clean
+    kwargs["logs_dir"] = os.path.join(directory, "logs")
+    kwargs["out_video_dir"] = os.path.join(directory, "videos")
+    kwargs["api_port"] = None
+    path = os.path.join(directory, "config.json")
+    with open(path, "w", encoding="utf-8") as config_file:
+        json.dump(kwargs, config_file)
+    return path
+
+
+def run_replay(config_path: str, paths: List[str], report_path: str) -> Tuple[dict, float]:
+    """
+    Run replay in a separate process, so models are loaded from scratch
+    and peak RSS belongs to this run only. Returns report and peak RSS (MB).
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "offline.replay",
+            *paths,
+            "--config", config_path,
+            "--report", report_path,
+        ],
+        stdout=subprocess.DEVNULL,
+        cwd=REPO_DIR,
+    )
+    # 'wait4' returns resource usage of this child only
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"Replay of {paths} exited with code {process.returncode}.")
+    with open(report_path, "r", encoding="utf-8") as report_file:
+        report = json.load(report_file)
+    # ru_maxrss is in kilobytes on Linux
+    return report, usage.ru_maxrss / 1024
+
+
+def get_events(report: dict) -> List[dict]:
+    """Get enter/exit events with time since the first video, applying cancellations."""
+    offsets = {}
+    offset = 0.0
+    for video in report["videos"]:
+        offsets[video["path"]] = offset
+        offset += video["duration"]
+    events: List[dict] = []
+    for event in report["events"]:
+        time = offsets[event["path"]] + event["video_time"]
+        if event["event"] in ("enter", "exit"):
+            events.append({"event": event["event"], "time": time})
+        elif event["event"] in ("cancel_enter", "cancel_exit"):
+            name = event["event"][len("cancel_"):]
+            for i in range(len(events) - 1, -1, -1):
+                if events[i]["event"] == name:
+                    events.pop(i)
+                    break
+    return events
+
+
+def match_events(
+    predicted: List[dict],
+    expected: List[dict],
+    tolerance: float
+) -> Dict[str, float]:
+    """Greedily match events of the same type, which are closer than 'tolerance'."""
+    errors = []
+    missed = 0
+    for name in ("enter", "exit"):
+        predicted_times = sorted(e["time"] for e in predicted if e["event"] == name)
+        for expected_time in sorted(e["time"] for e in expected if e["event"] == name):
+            candidates = [
+                (abs(time - expected_time), i)
+                for i, time in enumerate(predicted_times)
+                if abs(time - expected_time) <= tolerance
+            ]
+            if not candidates:
+                missed += 1
+                continue
+            error, i = min(candidates)
+            errors.append(error)
+            predicted_times.pop(i)
+    return {
+        "matched": len(errors),
+        "missed": missed,
+        "extra": len(predicted) - len(errors),
+        "timing_mae": sum(errors) / len(errors) if errors else None,
+        "timing_max": max(errors) if errors else None,
+    }
+
+
+def evaluate(video: dict, report: dict, peak_rss: float, tolerance: float) -> dict:
+    count_in = report["count_in"]
+    count_out = report["count_out"]
+    expected_total = video["count_in"] + video["count_out"]
+    count_error = abs(count_in - video["count_in"]) + abs(count_out - video["count_out"])
+    result = {
+        "count_in": count_in,
+        "count_out": count_out,
+        "expected_in": video["count_in"],
+        "expected_out": video["count_out"],
+        "count_error": count_error,
+        "count_rel_error": count_error / expected_total if expected_total else None,
+        "frames": report["frames"],
+        "fps": report["fps"],
+        "realtime_factor": report["realtime_factor"],
+        "stages_fps": {stage: stats["fps"] for stage, stats in report["stages"].items()},
+        "peak_rss_mb": peak_rss,
+    }
+    if "events" in video:
+        result.update(match_events(get_events(report), video["events"], tolerance))
+    return result
+
+
+def summarize(results: Dict[str, dict]) -> dict:
+    results = list(results.values())
+    expected = sum(r["expected_in"] + r["expected_out"] for r in results)
+    count_error = sum(r["count_error"] for r in results)
+    errors = [r["timing_mae"] for r in results if r.get("timing_mae") is not None]
+    frames = sum(r["frames"] for r in results)
+    seconds = sum(r["frames"] / r["fps"] for r in results if r["fps"])
+    return {
+        "count_error": count_error,
+        "count_rel_error": count_error / expected if expected else None,
+        "matched": sum(r.get("matched", 0) for r in results),
+        "missed": sum(r.get("missed", 0) for r in results),
+        "extra": sum(r.get("extra", 0) for r in results),
+        "timing_mae": sum(errors) / len(errors) if errors else None,
+        "fps": frames / seconds if seconds else None,
+        "peak_rss_mb": max(r["peak_rss_mb"] for r in results) if results else None,
+    }
+
+
+def resolve_paths(manifest: dict, base_dir: str) -> dict:
+    """Make paths in manifest absolute, relative to the manifest directory."""
+    for video in manifest["videos"]:
+        video["paths"] = [os.path.join(base_dir, path) for path in video["paths"]]
+    for config in manifest["configs"].values():
+        config["config"] = os.path.join(base_dir, config["config"])
+    return manifest
+
+
+def run_benchmark(manifest: dict, tolerance: float) -> dict:
+    report = {
+        "created": datetime.now().isoformat(),
+        "revision": git_revision(),
+        "tolerance": tolerance,
+        "configs": {},
+    }
+    for config_name, config in manifest["configs"].items():
+        results = {}
+        for video in manifest["videos"]:
+            with tempfile.TemporaryDirectory() as directory:
+                config_path = make_config(config, directory)
+                replay_report, peak_rss = run_replay(
+                    config_path,
+                    video["paths"],
+                    os.path.join(directory, "report.json"),
+                )
+            results[video["name"]] = evaluate(video, replay_report, peak_rss, tolerance)
+            print(f"{config_name}/{video['name']}: {json.dumps(results[video['name']])}")
+        report["configs"][config_name] = {
+            "config": config,
+            "videos": results,
+            "summary": summarize(results),
+        }
+    return report
+
+
+def print_summary(report: dict) -> None:
+    print(f"{'config':<20}{'count err':>10}{'rel err':>10}{'timing':>10}{'fps':>10}{'rss, MB':>10}")
+    for name, data in report["configs"].items():
+        summary = data["summary"]
+        values = [
+            summary["count_error"],
+            summary["count_rel_error"],
+            summary["timing_mae"],
+            summary["fps"],
+            summary["peak_rss_mb"],
+        ]
+        print(f"{name:<20}" + "".join(
+            f"{'-':>10}" if value is None else f"{value:>10.2f}" for value in values
+        ))
+    return
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("manifest", help="path to manifest with videos and configs")
+    parser.add_argument("--out", default="accuracy_report.json", help="path to save JSON report")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=2.0,
+        help="maximal time difference (in seconds) to match events",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.manifest, "r", encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    manifest = resolve_paths(manifest, os.path.dirname(os.path.abspath(args.manifest)))
+    report = run_benchmark(manifest, args.tolerance)
+    with open(args.out, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=4)
+    print_summary(report)
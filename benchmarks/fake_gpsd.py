@@ -0,0 +1,301 @@
+"""
+Fake gpsd for checks of the streaming GPS client without a receiver.
+
+The server speaks the part of gpsd protocol, used by GPSDClient: it accepts
+'?WATCH' and pushes VERSION, DEVICES and WATCH replies, followed by TPV
+reports of a bus, driving along a straight line at constant speed. SKY
+reports and TPV reports without a fix are mixed in, like a real receiver
+sends them, and the connection is dropped periodically to test reconnects.
+
+In check mode GPSStream is run against the server, and fixes in FixBuffer
+are compared with the sent reports: count, position, speed, interpolation
+at event time and delivery latency. Then counting events are produced by
+Tracker on frames, captured between the fixes, and written by Logger, so
+their geolocation is checked on the same path, as in a live session.
+Exits with non-zero code on failure.
+In serve mode the server just runs, so a full session can be pointed at it
+('gps_mode': "stream", 'gpsd_port': <port>).
+
+Usage:
+    python -m benchmarks.fake_gpsd                           # run the check
+    python -m benchmarks.fake_gpsd --rate 10 --drop-every 50 # faster, more reconnects
+    python -m benchmarks.fake_gpsd --serve --port 2947       # serve for a session
+"""
+import argparse
+from contextlib import redirect_stdout
+import json
+import math
+import os
+import queue
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Tuple
+
+from managers import Session
+from benchmarks.micro import make_detection_stream
+from gps import GPSStream
+from gps.buffer import haversine
+from loggers import Logger
+from tracker import Tracker
+
+
+# Start of the route and meters per degree of latitude
+START = (55.7558, 37.6173)
+METERS_PER_DEGREE = 111195
+
+
+class FakeGPSD:
+    """
+    TCP server, that streams synthetic reports to each connected client.
+    Sent TPV reports with a fix are kept as (send time, lat, lon, speed).
+    """
+
+    def __init__(
+        self,
+        host: str="127.0.0.1",
+        port: int=0,
+        rate: float=5,
+        speed: float=10.0,
+        drop_every: int=0
+    ):
+        self.rate = rate
+        self.speed = speed
+        self.drop_every = drop_every
+        self.sent: List[Tuple[float]] = []
+        self.n_connections = 0
+        self.n_reports = 0
+        self.stopped = threading.Event()
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.5)
+        self.host, self.port = self.server.getsockname()[:2]
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        return
+
+    def start(self) -> None:
+        self.thread.start()
+        return
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.server.close()
+        return
+
+    def serve(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                client, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            self.n_connections += 1
+            try:
+                self.stream(client)
+            except OSError:
+                pass
+            finally:
+                client.close()
+        return
+
+    def stream(self, client: socket.socket) -> None:
+        """Answer the watch request and push reports until the drop."""
+        client.settimeout(5)
+        client.recv(1024)
+        self.send(client, {"class": "VERSION", "release": "3.25", "proto_major": 3, "proto_minor": 15})
+        self.send(client, {"class": "DEVICES", "devices": [{"path": "/dev/fake"}]})
+        self.send(client, {"class": "WATCH", "enable": True, "json": True})
+        n_sent = 0
+        while not self.stopped.is_set():
+            time.sleep(1 / self.rate)
+            self.n_reports += 1
+            # Every 5th report is noise, which carries no position
+            if self.n_reports % 5 == 0:
+                self.send(client, {"class": "SKY", "satellites": []})
+                continue
+            if self.n_reports % 7 == 0:
+                self.send(client, {"class": "TPV", "mode": 1})
+                continue
+            latitude, longitude = self.position(self.n_reports / self.rate)
+            self.sent.append((time.time(), latitude, longitude, self.speed))
+            self.send(client, {
+                "class": "TPV",
+                "mode": 3,
+                "lat": latitude,
+                "lon": longitude,
+                "speed": self.speed,
+            })
+            n_sent += 1
+            if self.drop_every and n_sent % self.drop_every == 0:
+                return
+        return
+
+    def send(self, client: socket.socket, report: dict) -> None:
+        client.sendall((json.dumps(report) + "\n").encode("utf-8"))
+        return
+
+    def position(self, elapsed: float) -> Tuple[float]:
+        # Driving north, so distance maps to latitude only
+        return START[0] + self.speed * elapsed / METERS_PER_DEGREE, START[1]
+
+
+def make_session(port: int) -> Session:
+    # Weights are never loaded: only GPSStream uses the session
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return Session(
+            detect_weights="unused.pt",
+            cls_weights="unused.pt",
+            cls_shape=(224, 224),
+            streams=["synthetic"],
+            n_cameras=1,
+            device="cpu",
+            gps_mode="stream",
+            gpsd_port=port,
+        )
+
+
+def run_stream(gps_stream: GPSStream, stopped: threading.Event) -> None:
+    # Connection errors are printed as debug info, which isn't needed here
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        while not stopped.is_set():
+            gps_stream.run()
+    return
+
+
+def check(args: argparse.Namespace) -> List[str]:
+    """Run GPSStream against the fake server and get a list of failures."""
+    server = FakeGPSD(rate=args.rate, speed=args.speed, drop_every=args.drop_every)
+    server.start()
+    session = make_session(server.port)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        gps_stream = GPSStream(session)
+    # Reconnect quickly, so dropped connections don't dominate the check
+    gps_stream.cooldown = 0.1
+    stopped = threading.Event()
+    thread = threading.Thread(target=run_stream, args=(gps_stream, stopped), daemon=True)
+    thread.start()
+    time.sleep(args.duration)
+    stopped.set()
+    server.stop()
+    thread.join(timeout=10)
+
+    fixes = session.fixes.fixes()
+    # Fixes are matched with the reports by latitude, which grows along the route
+    reports = {report[1]: report for report in server.sent}
+    pairs = [(fix, reports[fix[1]]) for fix in fixes if fix[1] in reports]
+    failures = []
+    # Report in flight, when the server was stopped, may be lost
+    if len(server.sent) - len(fixes) > 1:
+        failures.append(f"received {len(fixes)} of {len(server.sent)} fixes")
+    if len(pairs) < len(fixes):
+        failures.append(f"{len(fixes) - len(pairs)} fixes don't match any report")
+    if args.drop_every and len(server.sent) > args.drop_every and server.n_connections < 2:
+        failures.append("client didn't reconnect after the connection was dropped")
+    if any(fix[3] != report[3] for fix, report in pairs):
+        failures.append("speed differs from the report")
+    latencies = [fix[0] - report[0] for fix, report in pairs]
+
+    # Position between two fixes is interpolated along the route
+    interpolation_errors = []
+    for before, after in zip(fixes, fixes[1:]):
+        timestamp = (before[0] + after[0]) / 2
+        location = session.fixes.interpolate(timestamp, session.patience)
+        if location is None:
+            continue
+        expected = ((before[1] + after[1]) / 2, (before[2] + after[2]) / 2)
+        interpolation_errors.append(haversine(*location, *expected))
+    if interpolation_errors and max(interpolation_errors) > 0.01:
+        failures.append(f"interpolation error is {max(interpolation_errors):.3f} m")
+    speed = session.fixes.speed(fixes[-1][0], session.patience) if fixes else None
+    if speed is None or not math.isclose(speed, args.speed):
+        failures.append(f"buffer speed is {speed}, expected {args.speed}")
+
+    event_errors = check_events(session, fixes)
+    if not event_errors:
+        failures.append("tracker didn't produce any located events")
+    elif max(event_errors) > 0.01:
+        failures.append(f"event geolocation error is {max(event_errors):.3f} m")
+
+    print(f"{'connections':<20}{server.n_connections:>10}")
+    print(f"{'reports':<20}{server.n_reports:>10}")
+    print(f"{'fixes sent':<20}{len(server.sent):>10}")
+    print(f"{'fixes received':<20}{len(fixes):>10}")
+    if latencies:
+        print(f"{'latency p50, ms':<20}{statistics.median(latencies) * 1000:>10.2f}")
+        print(f"{'latency max, ms':<20}{max(latencies) * 1000:>10.2f}")
+    print(f"{'events located':<20}{len(event_errors):>10}")
+    return failures
+
+
+def check_events(session: Session, fixes: List[Tuple[float]]) -> List[float]:
+    """
+    Feed Tracker with frames, captured evenly between the first and the last
+    fix, write its events with Logger and get errors of their geolocation
+    against positions, interpolated by hand at capture time of the frames.
+    """
+    if len(fixes) < 2:
+        return []
+    manager = session.managers[0]
+    manager.logs_storage = queue.Queue()
+    stream = make_detection_stream(5, n_frames=600)
+    first, last = fixes[0][0], fixes[-1][0]
+    step = (last - first) / len(stream)
+    with tempfile.TemporaryDirectory() as directory:
+        session.event_log_path = os.path.join(directory, "log.json")
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            tracker = Tracker(manager)
+            logger = Logger(session)
+            for i, boxes in enumerate(stream):
+                tracker.update(boxes, 1, first + i * step)
+            logs = []
+            while not manager.logs_storage.empty():
+                logs.append(manager.logs_storage.get())
+            for log in logs:
+                # All the fixes have arrived, so nothing waits
+                if not logger.is_ready(log):
+                    return [float("inf")]
+                logger.write_log(log)
+    errors = []
+    for log in logs:
+        timestamp = log.timestamp.timestamp()
+        for before, after in zip(fixes, fixes[1:]):
+            if before[0] <= timestamp <= after[0]:
+                break
+        ratio = (timestamp - before[0]) / (after[0] - before[0])
+        expected = (
+            before[1] + ratio * (after[1] - before[1]),
+            before[2] + ratio * (after[2] - before[2]),
+        )
+        errors.append(haversine(log.latitude, log.longitude, *expected))
+    return errors
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--serve", action="store_true", help="only run the server")
+    parser.add_argument("--port", type=int, default=2947, help="port to serve on (serve mode)")
+    parser.add_argument("--rate", type=float, default=5, help="reports per second")
+    parser.add_argument("--speed", type=float, default=10.0, help="bus speed, m/s")
+    parser.add_argument("--drop-every", type=int, default=20, help="drop connection after N fixes (0 to never drop)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run the check")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.serve:
+        server = FakeGPSD(port=args.port, rate=args.rate, speed=args.speed, drop_every=args.drop_every)
+        server.start()
+        print(f"Fake gpsd is listening on {server.host}:{server.port}.")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+        sys.exit(0)
+
+    failures = check(args)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    sys.exit(1 if failures else 0)
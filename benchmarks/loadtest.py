@@ -0,0 +1,312 @@
+"""
+Load test of a full session with simulated camera streams.
+
+For every camera count the regular session ('main.py') is started against
+N simulated cameras, warmed up and observed for a while through the status
+API. Sustained FPS, drops and end-to-end latency of every stage, as well as
+CPU usage and RSS of all session processes, are saved into a JSON report,
+which gives a capacity curve of the hardware.
+
+Cameras are simulated either in process by VideoReader (see
+'frame_processing.sources': "synthetic://" or "paced://" streams) or by
+ffmpeg processes, that stream MPEG-TS over local UDP at real-time pace,
+so network demuxing and decoding are loaded too.
+
+Usage:
+    python -m benchmarks.loadtest --config config/main.json --cameras 1 2 4 6 8
+    python -m benchmarks.loadtest --config config/main.json --video bus.mp4 --transport ffmpeg
+    python -m benchmarks.loadtest --config config/main.json --cameras 8 16 --mock
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from benchmarks.accuracy import REPO_DIR, git_revision
+
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+UDP_BASE_PORT = 23000
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_streams(args: argparse.Namespace, n_cameras: int) -> Tuple[List[str], List[List[str]]]:
+    """Get streams for the session and commands of ffmpeg servers (if any)."""
+    if args.transport == "paced":
+        if args.video is not None:
+            stream = f"paced://{os.path.abspath(args.video)}@{args.fps}"
+        else:
+            stream = f"synthetic://{args.size}@{args.fps}"
+        return [stream] * n_cameras, []
+    streams = []
+    commands = []
+    for camera in range(n_cameras):
+        url = f"udp://127.0.0.1:{UDP_BASE_PORT + camera}"
+        if args.video is not None:
+            source = ["-re", "-stream_loop", "-1", "-i", os.path.abspath(args.video), "-c", "copy"]
+        else:
+            source = [
+                "-re", "-f", "lavfi", "-i", f"testsrc2=size={args.size}:rate={args.fps}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency",
+            ]
+        commands.append([
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            *source,
+            "-f", "mpegts", f"{url}?pkt_size=1316",
+        ])
+        streams.append(f"{url}?overrun_nonfatal=1&fifo_size=50000000")
+    return streams, commands
+
+
+def make_config(
+    config_path: str,
+    streams: List[str],
+    port: int,
+    directory: str,
+    overrides: dict=None
+) -> str:
+    """Write config for N simulated cameras into a temporary directory."""
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        kwargs = json.load(config_file)
+    kwargs.update(overrides or {})
+    kwargs["streams"] = streams
+    kwargs["n_cameras"] = len(streams)
+    # Keep production logs and videos clean
+    kwargs["logs_dir"] = os.path.join(directory, "logs")
+    kwargs["out_video_dir"] = os.path.join(directory, "videos")
+    kwargs["api_host"] = "127.0.0.1"
+    kwargs["api_port"] = port
+    # Session is stopped by the load test, not by clock
+    kwargs["stop_hour"] = None
+    # Publish latency often enough for short observation windows
+    kwargs["latency_interval"] = min(kwargs.get("latency_interval", 60), 5)
+    os.makedirs(kwargs["logs_dir"], exist_ok=True)
+    os.makedirs(kwargs["out_video_dir"], exist_ok=True)
+    path = os.path.join(directory, "config.json")
+    with open(path, "w", encoding="utf-8") as config_file:
+        json.dump(kwargs, config_file)
+    return path
+
+
+def get_status(port: int) -> dict:
+    with urlopen(f"http://127.0.0.1:{port}/status", timeout=5) as response:
+        return json.load(response)
+
+
+def get_group_usage(pgid: int) -> Tuple[float, int]:
+    """Get CPU time (in seconds) and RSS (in bytes) of all processes of the group."""
+    cpu = 0.0
+    rss = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "r") as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+        # Fields after the executable name, which can contain spaces
+        fields = stat[stat.rindex(")") + 2:].split()
+        if int(fields[2]) != pgid:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_SIZE
+    return cpu, rss
+
+
+def wait_for_status(port: int, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Session exited with code {process.returncode}.")
+        try:
+            # Empty snapshot is served until the first update by supervisor
+            if "cameras" in get_status(port):
+                return
+        except (URLError, OSError):
+            pass
+        time.sleep(1)
+    raise RuntimeError(f"Status API didn't start in {timeout}s.")
+
+
+def stop_group(process: subprocess.Popen) -> None:
+    """Stop the session with all its workers (they share the process group)."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+    # Workers may outlive the supervisor
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    return
+
+
+def summarize_camera(first: dict, last: dict, elapsed: float) -> dict:
+    """Get FPS and drops of every stage between two snapshots of a camera."""
+    stages = {}
+    for stage, metrics in last["stages"].items():
+        previous = first["stages"][stage]
+        stages[stage] = {
+            "fps": (metrics["processed"] - previous["processed"]) / elapsed,
+            "dropped": metrics["dropped"] - previous["dropped"],
+            "e2e": metrics["latency"]["e2e"],
+        }
+    return {"stages": stages, "queues": last["queues"]}
+
+
+def run_load(args: argparse.Namespace, n_cameras: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        streams, commands = make_streams(args, n_cameras)
+        port = get_free_port()
+        # Mock models measure the overhead of the pipeline itself
+        overrides = {"inference_backend": "mock"} if args.mock else {}
+        config_path = make_config(args.config, streams, port, directory, overrides)
+        servers = [
+            subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for command in commands
+        ]
+        # Session and all of its workers get their own process group
+        process = subprocess.Popen(
+            [sys.executable, "main.py"],
+            stdout=subprocess.DEVNULL,
+            cwd=REPO_DIR,
+            env=dict(os.environ, IEC_CONFIG=config_path),
+            start_new_session=True,
+        )
+        try:
+            wait_for_status(port, process, args.startup_timeout)
+            time.sleep(args.warmup)
+            first = get_status(port)
+            first_cpu, _ = get_group_usage(process.pid)
+            started = time.monotonic()
+            peak_rss = 0
+            while time.monotonic() - started < args.duration:
+                time.sleep(1)
+                if process.poll() is not None:
+                    raise RuntimeError(f"Session exited with code {process.returncode}.")
+                _, rss = get_group_usage(process.pid)
+                peak_rss = max(peak_rss, rss)
+            last = get_status(port)
+            last_cpu, rss = get_group_usage(process.pid)
+            cpu_elapsed = time.monotonic() - started
+        finally:
+            stop_group(process)
+            for server in servers:
+                server.terminate()
+                server.wait()
+
+    # Snapshots are rebuilt about once per second, so counters are divided
+    # by the time between the snapshots, not by the time of the requests
+    elapsed = last["timestamp"] - first["timestamp"]
+    cameras = {
+        camera: summarize_camera(first["cameras"][camera], data, elapsed)
+        for camera, data in last["cameras"].items()
+    }
+    return summarize(cameras, elapsed, (last_cpu - first_cpu) / cpu_elapsed, rss, peak_rss, args.fps)
+
+
+def summarize(
+    cameras: Dict[str, dict],
+    elapsed: float,
+    cpu_cores: float,
+    rss: int,
+    peak_rss: int,
+    target_fps: float
+) -> dict:
+    reader_fps = [camera["stages"]["reader"]["fps"] for camera in cameras.values()]
+    detector_fps = [camera["stages"]["detector"]["fps"] for camera in cameras.values()]
+    e2e = {}
+    for quantile in ("0.5", "0.95", "0.99"):
+        e2e[quantile] = max(
+            camera["stages"]["tracker"]["e2e"][quantile] for camera in cameras.values()
+        )
+    return {
+        "elapsed": elapsed,
+        "reader_fps_min": min(reader_fps),
+        "detector_fps_mean": sum(detector_fps) / len(detector_fps),
+        "dropped": sum(
+            stage["dropped"]
+            for camera in cameras.values() for stage in camera["stages"].values()
+        ),
+        "tracker_e2e_max": e2e,
+        "cpu_cores": cpu_cores,
+        "rss_mb": rss / 2 ** 20,
+        "peak_rss_mb": peak_rss / 2 ** 20,
+        # Readers keep up with cameras
+        "sustained": min(reader_fps) >= 0.95 * target_fps,
+        "cameras": cameras,
+    }
+
+
+def print_summary(results: Dict[str, dict]) -> None:
+    print(
+        f"{'cameras':<10}{'reader fps':>12}{'detect fps':>12}{'dropped':>10}"
+        f"{'e2e p95':>10}{'cpu':>8}{'rss, MB':>10}{'ok':>5}"
+    )
+    for n_cameras, result in results.items():
+        print(
+            f"{n_cameras:<10}{result['reader_fps_min']:>12.1f}{result['detector_fps_mean']:>12.1f}"
+            f"{result['dropped']:>10}{result['tracker_e2e_max']['0.95']:>10.3f}"
+            f"{result['cpu_cores']:>8.2f}{result['peak_rss_mb']:>10.0f}"
+            f"{'yes' if result['sustained'] else 'no':>5}"
+        )
+    return
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--config", default=os.environ.get("IEC_CONFIG"), help="path to base config")
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 2, 4], help="camera counts to test")
+    parser.add_argument("--video", default=None, help="video to loop (synthetic frames if not set)")
+    parser.add_argument("--size", default="640x480", help="size of synthetic frames")
+    parser.add_argument("--fps", type=float, default=30, help="FPS of simulated cameras (native FPS of the video for ffmpeg)")
+    parser.add_argument("--transport", choices=("paced", "ffmpeg"), default="paced", help="how cameras are simulated")
+    parser.add_argument("--mock", action="store_true", help="use mock inference backend")
+    parser.add_argument("--warmup", type=float, default=30, help="seconds to wait before measuring")
+    parser.add_argument("--duration", type=float, default=120, help="seconds to measure")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="seconds to wait for status API")
+    parser.add_argument("--out", default="loadtest_report.json", help="path to save JSON report")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = {}
+    for n_cameras in args.cameras:
+        print(f"Running {n_cameras} cameras for {args.warmup + args.duration:.0f}s...")
+        results[str(n_cameras)] = run_load(args, n_cameras)
+    with open(args.out, "w", encoding="utf-8") as report_file:
+        json.dump(
+            {
+                "created": datetime.now().isoformat(),
+                "revision": git_revision(),
+                "host": os.uname().nodename,
+                "cpu_count": os.cpu_count(),
+                "args": vars(args),
+                "results": results,
+            },
+            report_file,
+            indent=4,
+        )
+    print_summary(results)
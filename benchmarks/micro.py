@@ -0,0 +1,239 @@
+"""
+Micro-benchmarks of per-frame hot paths: IoU, detection association,
+SORT update, counting and frame preprocessing (helpers and the whole
+Preprocessor.preprocess step with its storages).
+
+Functions are run on synthetic detection streams (people walking through
+the door line) for crowd sizes from 0 to 50 boxes and on synthetic frames
+of several sizes, so neither model weights nor cameras are needed.
+Per-call time and peak allocations are compared against stored baselines.
+Missing baselines are a failure, unless '--allow-missing-baseline' is set.
+
+Usage:
+    python -m benchmarks.micro                           # compare with baselines
+    python -m benchmarks.micro --update-baseline         # store current results
+    python -m benchmarks.micro --allow-missing-baseline  # first run on a new host
+"""
+import argparse
+from contextlib import redirect_stdout
+import json
+import os
+import queue
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from managers import Session
+from frame_processing import Preprocessor
+from utils.packet import Packet
+from tracker import Tracker
+from tracker.sort import Sort, associate_detections_to_trackers, iou_batch
+
+
+CROWD_SIZES = (0, 1, 5, 10, 20, 50)
+FRAME_SIZES = ((640, 480), (1280, 720), (1920, 1080))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "micro.json")
+
+
+def make_detection_stream(
+    n_boxes: int,
+    n_frames: int=200,
+    width: int=640,
+    height: int=640,
+    seed: int=0
+) -> List[np.ndarray]:
+    """
+    Make detections of 'n_boxes' people, walking up and down through
+    the frame with jitter, like passengers crossing the door line.
+    """
+    rng = np.random.default_rng(seed)
+    box_w = rng.uniform(0.08, 0.15, n_boxes) * width
+    box_h = rng.uniform(0.2, 0.35, n_boxes) * height
+    x = rng.uniform(0, width - box_w)
+    y = rng.uniform(0, height - box_h)
+    velocity = rng.uniform(-0.01, 0.01, n_boxes) * height
+    stream = []
+    for _ in range(n_frames):
+        y = y + velocity + rng.normal(0, 1, n_boxes)
+        # Turn back at the frame borders
+        velocity = np.where((y < 0) | (y + box_h > height), -velocity, velocity)
+        y = np.clip(y, 0, height - box_h)
+        jitter = rng.normal(0, 1, (n_boxes, 4))
+        boxes = np.stack([x, y, x + box_w, y + box_h], axis=1) + jitter
+        stream.append(boxes.astype(np.float64))
+    return stream
+
+
+def make_session() -> Session:
+    # Weights are never loaded: only Tracker and Preprocessor are created
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        session = Session(
+            detect_weights="unused.pt",
+            cls_weights="unused.pt",
+            cls_shape=(224, 224),
+            streams=["synthetic"],
+            n_cameras=1,
+            device="cpu",
+        )
+    manager = session.managers[0]
+    # Events are not consumed by Logger here
+    manager.logs_storage = queue.Queue()
+    # Preprocessor storages are drained by the benchmark itself
+    manager.read_storage = queue.Queue()
+    manager.preprocess_storage = queue.Queue()
+    manager.preprocess_door_storage = queue.Queue()
+    manager.write_storage = queue.Queue()
+    return session
+
+
+def measure(func: Callable, n_calls: int, repeat: int) -> Dict[str, float]:
+    """Measure median per-call time and peak allocations of 'func'."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) / n_calls)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "time_us": statistics.median(timings) * 1e6,
+        "alloc_peak_kb": peak / 1024,
+    }
+
+
+def bench_tracking(session: Session, repeat: int) -> Dict[str, dict]:
+    manager = session.managers[0]
+    results = {}
+    for n_boxes in CROWD_SIZES:
+        stream = make_detection_stream(n_boxes)
+        previous = stream[:-1]
+        current = stream[1:]
+
+        def run_iou():
+            for detections, trackers in zip(current, previous):
+                iou_batch(detections, trackers)
+
+        def run_associate():
+            for detections, trackers in zip(current, previous):
+                associate_detections_to_trackers(detections, trackers, 0.02)
+
+        def run_sort():
+            sort = Sort(max_age=60, min_hits=1, iou_threshold=0.02)
+            for detections in stream:
+                sort.update(detections)
+
+        def run_tracker():
+            tracker = Tracker(manager)
+            for detections in stream:
+                tracker.update(detections, 1)
+            # Drop events, so the queue doesn't grow between runs
+            while not manager.logs_storage.empty():
+                manager.logs_storage.get()
+
+        results[f"iou_batch/boxes={n_boxes}"] = measure(run_iou, len(current), repeat)
+        results[f"associate/boxes={n_boxes}"] = measure(run_associate, len(current), repeat)
+        results[f"sort_update/boxes={n_boxes}"] = measure(run_sort, len(stream), repeat)
+        results[f"tracker_update/boxes={n_boxes}"] = measure(run_tracker, len(stream), repeat)
+    return results
+
+
+def bench_preprocessing(session: Session, repeat: int, n_frames: int=50) -> Dict[str, dict]:
+    manager = session.managers[0]
+    preprocessor = Preprocessor(manager)
+    results = {}
+    for width, height in FRAME_SIZES:
+        rng = np.random.default_rng(0)
+        frames = [
+            rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+            for _ in range(n_frames)
+        ]
+
+        def run_preprocess():
+            for frame in frames:
+                preprocessor.gate.update(frame)
+                preprocessor.get_detect_frame(frame)
+                preprocessor.get_cls_frame(frame)
+
+        def run_preprocess_step():
+            for frame_id, frame in enumerate(frames):
+                manager.read_storage.put(Packet(frame_id, time.time(), frame))
+                preprocessor.preprocess()
+                # NN stages take the frames, so the next one isn't dropped
+                for storage in (
+                    manager.preprocess_storage,
+                    manager.preprocess_door_storage,
+                    manager.write_storage,
+                ):
+                    while not storage.empty():
+                        storage.get()
+
+        results[f"preprocess/{width}x{height}"] = measure(run_preprocess, n_frames, repeat)
+        results[f"preprocess_step/{width}x{height}"] = measure(run_preprocess_step, n_frames, repeat)
+    return results
+
+
+def compare(
+    results: Dict[str, dict],
+    baselines: Dict[str, dict],
+    time_tolerance: float,
+    alloc_tolerance: float
+) -> List[str]:
+    """Get descriptions of cases, which regressed past baselines."""
+    regressions = []
+    for case, result in results.items():
+        baseline = baselines.get(case)
+        if baseline is None:
+            continue
+        for key, tolerance in (("time_us", time_tolerance), ("alloc_peak_kb", alloc_tolerance)):
+            limit = baseline[key] * (1 + tolerance)
+            if result[key] > limit:
+                regressions.append(
+                    f"{case}: {key}={result[key]:.1f} > {limit:.1f} "
+                    f"(baseline {baseline[key]:.1f})"
+                )
+    return regressions
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="path to baselines JSON")
+    parser.add_argument("--update-baseline", action="store_true", help="store results as baselines")
+    parser.add_argument("--allow-missing-baseline", action="store_true", help="don't fail without baselines")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed runs per case")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.10, help="allowed relative allocation growth")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    session = make_session()
+    # Stages print debug info on every event, which isn't needed here
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        results = bench_tracking(session, args.repeat)
+        results.update(bench_preprocessing(session, args.repeat))
+    for case, result in results.items():
+        print(f"{case:<30}{result['time_us']:>12.1f} us{result['alloc_peak_kb']:>12.1f} KB")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+        print(f"Baselines saved to {args.baseline}.")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baselines at {args.baseline}. Run with --update-baseline first.")
+        sys.exit(0 if args.allow_missing_baseline else 1)
+    with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+        baselines = json.load(baseline_file)
+    regressions = compare(results, baselines, args.time_tolerance, args.alloc_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
@@ -1,3 +1,5 @@
+from .archiver import StreamArchiver
+from .clip_writer import ClipWriter
 from .preprocessor import Preprocessor
 from .reader import VideoReader
 from .writer import VideoWriter
\ No newline at end of file
@@ -0,0 +1,180 @@
+from datetime import datetime
+import json
+import os
+import signal
+import subprocess
+import time
+from typing import List
+
+from loggers import create_log
+from storage import register_file, register_segment_list
+from utils.debug import (
+    debug_archiver_init,
+    debug_archiver_restart,
+    debug_archiver_start,
+)
+from utils.types import StreamManager
+
+
+class StreamArchiver:
+    """
+    Archives the camera stream without decoding or re-encoding it.
+    ffmpeg remuxes the incoming elementary stream into hourly segments,
+    while the metadata, that VideoWriter draws on frames, goes into
+    a JSON sidecar file, written on each (re)start of ffmpeg.
+    """
+
+    def __init__(self, manager: StreamManager):
+        # Store a reference to StreamManager as an attribute
+        self.manager = manager
+
+        # Unpack parameters
+        (stream,) = self.manager.reader_tuple
+
+        # Set required attributes
+        self.type = "archiver"
+        self.stream = stream
+        self.ext = ".mkv"
+        self.cooldown = 5
+        self.out_path = None
+        self.segment_list = None
+        self.process = None
+
+        # ffmpeg is not aware of the parent termination, so stop it explicitly
+        signal.signal(signal.SIGTERM, self._terminate)
+
+        # Start archiving
+        self.create()
+
+        # Print debug info
+        debug_archiver_init(self)
+        return
+
+    def create(self) -> None:
+        """Starts ffmpeg and writes the sidecar file for this run."""
+        self.out_path = self._make_out_path()
+        self.segment_list = os.path.join(
+            os.path.dirname(self.out_path),
+            f".archive_cam{self.manager.camera}_segments.csv"
+        )
+        register_segment_list(self.manager.session, self.segment_list)
+        self.process = subprocess.Popen(
+            self._make_command(),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self._write_sidecar()
+        debug_archiver_start(self)
+        return
+
+    def _make_out_path(self) -> str:
+        """
+        Generates strftime pattern for segments, based on 'out_video_dir'.
+        Matroska container is used, as it stays readable,
+        even if the segment was not finalized (e.g. on power loss).
+        """
+        directory = os.environ.get("out_video_dir", "/tmp")
+        filename = f"archive_%Y-%m-%d_hour%H_cam{self.manager.camera}_%M-%S{self.ext}"
+        return os.path.join(directory, filename)
+
+    def _make_command(self) -> List[str]:
+        session = self.manager.session
+        command = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y"]
+        if self.stream.startswith("rtsp://"):
+            command += ["-rtsp_transport", "tcp"]
+        command += [
+            "-i", self.stream,
+            "-map", "0:v",
+            "-c", "copy",
+            "-metadata", f"title=bus {session.bus_id} route {session.route_id} cam {self.manager.camera}",
+            "-f", "segment",
+            "-segment_format", "matroska",
+            "-segment_time", "3600",
+            "-segment_atclocktime", "1",
+            "-reset_timestamps", "1",
+            "-strftime", "1",
+            "-segment_list", self.segment_list,
+            "-segment_list_type", "csv",
+            self.out_path,
+        ]
+        return command
+
+    def _write_sidecar(self) -> None:
+        """
+        Writes metadata for segments of the current ffmpeg run.
+        Segment names contain the wall-clock time of their start,
+        so together with this file they replace the datetime overlay.
+        """
+        now = datetime.now()
+        session = self.manager.session
+        data = {
+            "timestamp": now.timestamp(),
+            "date": str(now.date()),
+            "time": str(now.time()),
+            "camera": self.manager.camera,
+            "route_id": session.route_id,
+            "bus_id": session.bus_id,
+            "session_id": session.session_id,
+            "stream": self.stream,
+            "segments": self.out_path,
+        }
+        directory = os.path.dirname(self.out_path)
+        filename = f"archive_{now.date()}_{now:%H-%M-%S}_cam{self.manager.camera}.json"
+        sidecar_path = os.path.join(directory, filename)
+        with open(sidecar_path, "w", encoding="utf-8") as sidecar:
+            json.dump(data, sidecar, indent=4)
+        register_file(self.manager.session, sidecar_path)
+        return
+
+    def archive(self) -> None:
+        """
+        Wrapper around '_archive' method, that stops ffmpeg
+        on any exception, like KeyboardInterrupt.
+        """
+        try:
+            return self._archive()
+        except:
+            self.release()
+            raise
+
+    def _archive(self) -> None:
+        # ffmpeg does all the work, so just check it from time to time
+        if self.process.poll() is None:
+            time.sleep(1)
+            return
+
+        # Stream was lost: report and restart after cooldown
+        debug_archiver_restart(self, self.process.returncode)
+        log = create_log(
+            self.manager,
+            "archiver_restart",
+            f"ffmpeg exited with code {self.process.returncode}"
+        )
+        try:
+            self.manager.logs_storage.put(log)
+        except Exception:
+            pass
+        time.sleep(self.cooldown)
+        self.create()
+        return
+
+    def _terminate(self, signum, frame) -> None:
+        raise SystemExit(0)
+
+    def release(self) -> None:
+        """Stops ffmpeg, letting it finalize the current segment."""
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        return
+
+    def run(self, *args, **kwargs) -> None:
+        return self.archive(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs) -> None:
+        return self.archive(*args, **kwargs)
\ No newline at end of file
@@ -0,0 +1,161 @@
+from collections import deque
+from datetime import datetime
+import os
+import time
+
+import cv2
+import numpy as np
+
+from frame_processing.writer import VideoWriter
+from loggers import create_log
+from utils.debug import (
+    debug_clip_finish,
+    debug_clip_start,
+    debug_fail_write_frame,
+    debug_write_frame,
+)
+from utils.types import StreamManager
+
+
+class ClipWriter(VideoWriter):
+    """
+    Event-triggered alternative to VideoWriter.
+    Keeps a short pre-roll of JPEG-compressed frames in memory and
+    writes a clip only around counting events and door openings.
+    """
+
+    # Each clip is written into a separate file
+    segmented = False
+
+    def __init__(self, manager: StreamManager):
+        # Unpack parameters
+        (
+            pre_seconds,
+            post_seconds,
+            jpeg_quality,
+        ) = manager.clip_tuple
+
+        # Initialize clip parameters.
+        # Note, that they must be set before VideoWriter initialization,
+        # as it calls 'create' method, which depends on them.
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.pre_roll = deque()
+        self._last_trigger = manager.clip_trigger.value
+        self._clip_end = None
+
+        # Initialize the rest of writer attributes
+        super().__init__(manager)
+        self.type = "clip_writer"
+        return
+
+    def create(self) -> None:
+        # Clip files are created on demand, when an event is triggered
+        if self._clip_end is None:
+            return
+        return super().create()
+
+    def _make_out_path(self) -> str:
+        """
+        Generates output path for a clip, based on current datetime.
+        Clips are short, so we use the time of the clip start for filename.
+        """
+        now = datetime.now()
+        self._start_hour = now.time().hour
+        filename = f"clip_{now.date()}_{now:%H-%M-%S}_cam{self.manager.camera}{self.ext}"
+        directory = os.environ.get("out_video_dir", "/tmp")
+        out_path = os.path.join(directory, filename)
+        return out_path
+
+    def write(self) -> None:
+        """
+        Writes a frame into the current clip (if any)
+        and stores it into the pre-roll buffer.
+        """
+        try:
+            self.write_frame()
+            return
+        except:
+            self.release()
+            raise
+
+    def write_frame(self) -> None:
+        if self.manager.write_storage.empty():
+            time.sleep(0.01)
+            return
+
+        # Get next frame and the moment it was captured
+        packet = self.manager.write_storage.get()
+        frame = packet.data
+        timestamp = packet.captured
+        started = time.perf_counter()
+
+        # Write datetime and other overlay items on a frame
+        self._write_overlay(frame)
+
+        # Start (or prolong) the clip, if there is a new event
+        self._check_trigger()
+
+        # Write the frame, if the clip is being recorded
+        if self.writer is not None:
+            try:
+                self.writer.write(frame)
+                self.manager.metrics.observe("writer", time.perf_counter() - started)
+                self.latency.record(packet)
+                debug_write_frame(self)
+            except Exception as e:
+                self.manager.metrics.drop("writer")
+                debug_fail_write_frame(self, e)
+                log = create_log(self.manager, "writer_write_error", e)
+                try:
+                    self.manager.logs_storage.put(log)
+                except Exception:
+                    pass
+
+        # Store compressed frame for the future clips
+        self._buffer_frame(frame, timestamp)
+
+        # Report, whether encoding falls behind
+        self._check_backlog()
+
+        # Finish the clip, if there were no events for a while
+        if self.writer is not None and timestamp > self._clip_end:
+            self.finish()
+        return
+
+    def _check_trigger(self) -> None:
+        """
+        Checks, whether Tracker has registered a new event since the last frame.
+        Starts a new clip with pre-roll frames or prolongs the current one.
+        """
+        trigger = self.manager.clip_trigger.value
+        if trigger <= self._last_trigger:
+            return
+        self._last_trigger = trigger
+        self._clip_end = trigger + self.post_seconds
+        if self.writer is not None:
+            return
+        self.create()
+        debug_clip_start(self)
+        for _, buffer in self.pre_roll:
+            self.writer.write(cv2.imdecode(buffer, cv2.IMREAD_COLOR))
+        return
+
+    def _buffer_frame(self, frame: np.ndarray, timestamp: float) -> None:
+        """Compress the frame and keep only last 'pre_seconds' in buffer."""
+        ret, buffer = cv2.imencode(".jpg", frame, self.jpeg_params)
+        if not ret:
+            return
+        self.pre_roll.append((timestamp, buffer))
+        while timestamp - self.pre_roll[0][0] > self.pre_seconds:
+            self.pre_roll.popleft()
+        return
+
+    def finish(self) -> None:
+        """Releases the current clip and waits for the next event."""
+        self.release()
+        debug_clip_finish(self)
+        self.writer = None
+        self._clip_end = None
+        return
\ No newline at end of file
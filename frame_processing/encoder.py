@@ -0,0 +1,150 @@
+import queue
+import subprocess
+import threading
+from typing import List, Tuple
+
+import numpy as np
+
+
+class FFmpegEncoder:
+    """
+    Drop-in replacement for cv2.VideoWriter, that pipes raw BGR frames
+    into an ffmpeg subprocess. Frames are handed over to a feeder thread
+    through a bounded queue, so encoding runs outside of the writer loop
+    and can use several threads inside ffmpeg.
+    '-preset' and '-crf' are passed only to encoders, that accept them,
+    so hardware (e.g. h264_nvenc) and other codecs (e.g. mjpeg) work too.
+    """
+
+    # Software encoders with x264-style named presets
+    preset_codecs = ("libx264", "libx264rgb", "libx265")
+    # Encoders with constant rate factor mode
+    crf_codecs = ("libx264", "libx264rgb", "libx265", "libvpx", "libvpx-vp9", "libaom-av1", "libsvtav1")
+    # Containers, which need fragmenting to survive an unclean stop
+    mp4_extensions = (".mp4", ".mov", ".m4v")
+
+    def __init__(
+        self,
+        out_path: str,
+        fps: int,
+        size: Tuple[int],
+        codec: str="libx264",
+        preset: str="veryfast",
+        crf: int=23,
+        threads: int=0,
+        segment_time: int=None,
+        segment_list: str=None,
+        queue_size: int=60,
+    ):
+        # Initialize encoding parameters
+        self.out_path = out_path
+        self.fps = fps
+        self.size = size
+        self.codec = codec
+        self.preset = preset
+        self.crf = crf
+        self.threads = threads
+        self.segment_time = segment_time
+        self.segment_list = segment_list
+
+        # Start ffmpeg subprocess and the thread, that feeds it with frames
+        self.process = subprocess.Popen(
+            self._make_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._feed, daemon=True)
+        self.thread.start()
+        return
+
+    def _make_command(self) -> List[str]:
+        width, height = self.size
+        command = [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel", "error",
+            "-y",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}",
+            "-r", str(self.fps),
+            "-i", "pipe:0",
+            "-c:v", self.codec,
+        ]
+        if self.codec in self.preset_codecs:
+            command += ["-preset", self.preset]
+        if self.codec in self.crf_codecs:
+            command += ["-crf", str(self.crf)]
+        command += [
+            "-threads", str(self.threads),
+            "-pix_fmt", "yuv420p",
+        ]
+        # Let ffmpeg rotate output files at clock time boundaries.
+        # In this case output path is a strftime pattern.
+        if self.segment_time is not None:
+            command += [
+                "-f", "segment",
+                "-segment_time", str(self.segment_time),
+                "-segment_atclocktime", "1",
+                "-reset_timestamps", "1",
+                "-strftime", "1",
+            ]
+            # Plain mp4 is readable only after the moov atom is written at
+            # the end, so segments are fragmented to stay playable, if ffmpeg
+            # is killed in the middle of an hour
+            if self.out_path.lower().endswith(self.mp4_extensions):
+                command += [
+                    "-segment_format", "mp4",
+                    "-segment_format_options", "movflags=+frag_keyframe+empty_moov",
+                ]
+            # Completed segments are listed in csv file (see RetentionManager)
+            if self.segment_list is not None:
+                command += [
+                    "-segment_list", self.segment_list,
+                    "-segment_list_type", "csv",
+                ]
+        command.append(self.out_path)
+        return command
+
+    def _feed(self) -> None:
+        """Write frames from the queue into ffmpeg stdin until release."""
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            try:
+                self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+            except (BrokenPipeError, ValueError):
+                break
+        return
+
+    def write(self, frame: np.ndarray) -> None:
+        if not self.isOpened():
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+        self.queue.put(frame, timeout=5)
+        return
+
+    def isOpened(self) -> bool:
+        return self.process.poll() is None and self.thread.is_alive()
+
+    def release(self) -> None:
+        """Flush the remaining frames and wait for ffmpeg to finalize the file."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        return
+
+    @property
+    def backlog(self) -> int:
+        """Number of frames, which are waiting to be piped into ffmpeg."""
+        return self.queue.qsize()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import time
+
+import cv2
+import numpy as np
+
+from utils.types import StreamManager
+
+
+class MotionGate:
+    """
+    Decides, whether a frame should be sent to Detector and Classifier.
+    Passengers can only board or alight while the bus is stopped,
+    so while it's moving, only every 'moving_stride'-th frame is processed.
+    Bus motion is obtained from GPS speed. If there is no recent fix,
+    ego-motion is estimated by the difference between consecutive frames.
+    """
+
+    def __init__(self, manager: StreamManager):
+        # Store a reference to StreamManager as an attribute
+        self.manager = manager
+
+        # Unpack parameters
+        (
+            enabled,
+            speed_threshold,
+            moving_stride,
+            motion_threshold,
+            fix_patience,
+        ) = self.manager.gate_tuple
+
+        # Set gating parameters
+        self.enabled = enabled
+        self.speed_threshold = speed_threshold
+        self.moving_stride = max(1, moving_stride)
+        self.motion_threshold = motion_threshold
+        self.fix_patience = fix_patience
+
+        # Initialize ego-motion estimation attributes
+        self.thumbnail_shape = (64, 64)
+        self.grid = 4
+        self.alpha = 0.2
+        self.previous = None
+        self.motion = 0.0
+
+        # Initialize gating state
+        self.moving = False
+        self.counter = 0
+        return
+
+    def update(self, frame: np.ndarray) -> bool:
+        """Returns True, if the frame should be processed by NN stages."""
+        if not self.enabled:
+            return True
+        return self.decide(self.is_moving(frame))
+
+    def decide(self, moving: bool) -> bool:
+        """Apply the stride to a known motion state (e.g. from detection cache)."""
+        self.moving = moving
+        if not self.moving:
+            self.counter = 0
+            return True
+        self.counter += 1
+        return self.counter % self.moving_stride == 0
+
+    def is_moving(self, frame: np.ndarray) -> bool:
+        speed = self.manager.session.fixes.speed(time.time(), self.fix_patience)
+        if speed is not None:
+            # Drop the thumbnail, so it's not compared with a much later frame
+            self.previous = None
+            return speed > self.speed_threshold
+        return self.estimate_motion(frame) > self.motion_threshold
+
+    def estimate_motion(self, frame: np.ndarray) -> float:
+        """
+        Estimate ego-motion as a median of mean absolute differences
+        over a grid of cells on a small grayscale thumbnail.
+        Median ignores local motion (e.g. passengers near the door),
+        while vibration and scenery in windows affect most of the cells.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, self.thumbnail_shape, interpolation=cv2.INTER_AREA)
+        thumbnail = thumbnail.astype(np.int16)
+        if self.previous is None:
+            self.previous = thumbnail
+            return self.motion
+        diff = np.abs(thumbnail - self.previous)
+        self.previous = thumbnail
+        height, width = diff.shape
+        cells = diff.reshape(
+            self.grid,
+            height // self.grid,
+            self.grid,
+            width // self.grid
+        ).mean(axis=(1, 3))
+        value = float(np.median(cells))
+        self.motion = self.alpha * value + (1 - self.alpha) * self.motion
+        return self.motion
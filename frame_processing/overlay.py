@@ -0,0 +1,123 @@
+import time
+from typing import Callable, Dict, Tuple
+
+import cv2
+import numpy as np
+
+from utils.types import StreamManager
+
+
+class Overlay:
+    """
+    Draws text items (datetime, camera id, counters, etc.) on frames.
+    Each item is rendered into a small cached BGR patch with a mask only
+    when its text changes, so the per-frame cost is a vectorized copy.
+    """
+
+    def __init__(self, manager: StreamManager):
+        # Store a reference to StreamManager as an attribute
+        self.manager = manager
+
+        # Unpack parameters
+        (items,) = self.manager.overlay_tuple
+
+        # Initialize text parameters
+        self.font = cv2.FONT_HERSHEY_SIMPLEX
+        self.text_size = 0.7
+        self.text_color = (255, 255, 255)  # White
+        self.thickness = 2
+        self.margin = 10
+
+        # Initialize text sources. Datetime is placed in top-right corner,
+        # the rest of items are stacked in top-left corner.
+        self._sources: Dict[str, Callable[[], str]] = {
+            "datetime": self._datetime_text,
+            "camera": self._camera_text,
+            "counts": self._counts_text,
+            "route": self._route_text,
+        }
+        for item in items:
+            if item not in self._sources:
+                raise ValueError(f"Unknown overlay item: {item}.")
+        self.items = list(items)
+        self._lines = {
+            item: line for line, item in enumerate(
+                item for item in self.items if item != "datetime"
+            )
+        }
+
+        # Initialize cache: item -> (text, patch, mask, (x, y))
+        self._cache = {}
+        self._second = None
+        self._datetime_str = None
+        return
+
+    def apply(self, frame: np.ndarray) -> None:
+        """Blend all the overlay items into the frame (inplace)."""
+        for item in self.items:
+            text = self._sources[item]()
+            cached = self._cache.get(item)
+            if cached is None or cached[0] != text:
+                cached = self._render(item, text, frame.shape)
+                self._cache[item] = cached
+            _, patch, mask, (x, y) = cached
+            self._blend(frame, patch, mask, x, y)
+        return
+
+    def _render(self, item: str, text: str, shape: Tuple[int]) -> tuple:
+        """Render text into a patch and compute its position on the frame."""
+        (text_width, text_height), baseline = cv2.getTextSize(
+            text,
+            self.font,
+            self.text_size,
+            self.thickness
+        )
+        pad = self.thickness
+        patch = np.zeros(
+            (text_height + baseline + 2 * pad, text_width + 2 * pad, 3),
+            dtype=np.uint8
+        )
+        mask = np.zeros(patch.shape[:2], dtype=np.uint8)
+        origin = (pad, text_height + pad)
+        cv2.putText(patch, text, origin, self.font, self.text_size, self.text_color, self.thickness)
+        cv2.putText(mask, text, origin, self.font, self.text_size, 255, self.thickness)
+        mask = (mask > 0)[..., None]
+
+        # Keep the datetime where it was always written: top-right corner
+        if item == "datetime":
+            x = shape[1] - text_width - self.margin - pad
+            y = shape[1] // 20 - text_height - pad
+        else:
+            x = self.margin - pad
+            y = self.margin + self._lines[item] * patch.shape[0]
+        return (text, patch, mask, (max(x, 0), max(y, 0)))
+
+    def _blend(self, frame: np.ndarray, patch: np.ndarray, mask: np.ndarray, x: int, y: int) -> None:
+        # Crop the patch, if it doesn't fit into the frame
+        height = min(patch.shape[0], frame.shape[0] - y)
+        width = min(patch.shape[1], frame.shape[1] - x)
+        if height <= 0 or width <= 0:
+            return
+        np.copyto(
+            frame[y:y + height, x:x + width],
+            patch[:height, :width],
+            where=mask[:height, :width]
+        )
+        return
+
+    def _datetime_text(self) -> str:
+        # Format datetime only once a second
+        second = int(time.time())
+        if second != self._second:
+            self._second = second
+            self._datetime_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        return self._datetime_str
+
+    def _camera_text(self) -> str:
+        return f"CAM{self.manager.camera}"
+
+    def _counts_text(self) -> str:
+        return f"IN {self.manager.count_in.value} OUT {self.manager.count_out.value}"
+
+    def _route_text(self) -> str:
+        return f"BUS {self.manager.session.bus_id} ROUTE {self.manager.session.route_id}"
\ No newline at end of file
@@ -3,12 +3,14 @@ import time
 import cv2
 import numpy as np
 
+from frame_processing.gating import MotionGate
 from loggers import Log, create_log
 from utils.debug import (
     debug_preprocessor_init,
     debug_preprocess_frame,
     debug_fail_preprocess_frame,
 )
+from utils.metrics import LatencyRecorder
 from utils.types import StreamManager
 
 
@@ -19,12 +21,15 @@ class Preprocessor:
         self.manager = manager
 
         # Unpack parameters
-        (detect_shape, cls_shape) = self.manager.preprocessor_tuple
+        (detect_shape, cls_shape, write_frames) = self.manager.preprocessor_tuple
 
         # Set required attributes
         self.type = "preprocessor"
         self.detect_shape = detect_shape
         self.cls_shape = cls_shape
+        self.write_frames = write_frames
+        self.gate = MotionGate(self.manager)
+        self.latency = LatencyRecorder(self.manager, "preprocessor")
 
         # Print debug info
         debug_preprocessor_init(self)
@@ -37,33 +42,40 @@ class Preprocessor:
             return
 
         # Get the frame for preprocessing
-        frame = self.manager.read_storage.get()
+        packet = self.manager.read_storage.get()
+        frame = packet.data
         if frame is None:
             return
+        started = time.perf_counter()
 
-        # Preprocess the frame (classification)
-        # Crop parts of the image, which contain the door 
-        height, width, _ = frame.shape
-        third_width = width // 3
-        left_door = frame[:, :third_width]
-        right_door = frame[:, -third_width:]
-        image = np.hstack([left_door, right_door])
-        cls_frame = cv2.resize(image, self.cls_shape)
+        # Check, whether NN stages should process the frame.
+        # While the bus is moving, most of the frames are skipped.
+        process = self.gate.update(frame)
 
         # Preprocess the frame (detection)
-        detect_frame = cv2.resize(frame, self.detect_shape)
+        detect_frame = self.get_detect_frame(frame)
 
         # Put preprocessed frames into shared storages (or report an issue)
         try:
             if (
-                self.manager.preprocess_storage.empty()
+                process
+                and self.manager.preprocess_storage.empty()
                 and self.manager.preprocess_door_storage.empty()
             ):
-                self.manager.preprocess_storage.put(detect_frame)
-                self.manager.preprocess_door_storage.put(cls_frame)
-            self.manager.write_storage.put(detect_frame)
+                cls_frame = self.get_cls_frame(frame)
+                self.manager.preprocess_storage.put(packet.forward(detect_frame))
+                self.manager.preprocess_door_storage.put(packet.forward(cls_frame))
+            elif process:
+                # NN stages are still busy with the previous frame
+                self.manager.metrics.drop("preprocessor")
+            # Frames are not re-encoded in stream copy mode
+            if self.write_frames:
+                self.manager.write_storage.put(packet.forward(detect_frame))
+            self.manager.metrics.observe("preprocessor", time.perf_counter() - started)
+            self.latency.record(packet)
             debug_preprocess_frame(self)
         except Exception as e:
+            self.manager.metrics.drop("preprocessor")
             debug_fail_preprocess_frame(self, e)
             log = create_log(self.manager, "preprocessor_put_error", e)
             try:
@@ -72,6 +84,21 @@ class Preprocessor:
                 pass
         return
 
+    def get_detect_frame(self, frame: np.ndarray) -> np.ndarray:
+        """Preprocess the frame for detection."""
+        return cv2.resize(frame, self.detect_shape)
+
+    def get_cls_frame(self, frame: np.ndarray) -> np.ndarray:
+        """Preprocess the frame for door classification."""
+        # Crop parts of the image, which contain the door 
+        height, width, _ = frame.shape
+        third_width = width // 3
+        left_door = frame[:, :third_width]
+        right_door = frame[:, -third_width:]
+        image = np.hstack([left_door, right_door])
+        cls_frame = cv2.resize(image, self.cls_shape)
+        return cls_frame
+
     def run(self, *args, **kwargs) -> None:
         return self.preprocess(*args, **kwargs)
 
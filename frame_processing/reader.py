@@ -4,12 +4,15 @@ from typing import Iterable
 import cv2
 import numpy as np
 
+from frame_processing.sources import open_capture
 from loggers import Log, create_log
 from utils.debug import (
     debug_reader_init,
     debug_read_frame,
     debug_fail_read_frame,
 )
+from utils.metrics import LatencyRecorder
+from utils.packet import Packet
 from utils.types import StreamManager
 
 
@@ -24,7 +27,14 @@ class VideoReader:
 
         # Set required attributes
         self.type = "reader"
-        self.cap = cv2.VideoCapture(stream)
+        self.cap = open_capture(stream)
+
+        # Initialize frame identification attributes.
+        # Frame ids continue after reader restarts.
+        self.frame_id = self.manager.metrics.processed("reader")
+        self.captured = None
+        self._pts_offset = None
+        self.latency = LatencyRecorder(self.manager, "reader")
 
         # Print debug info
         debug_reader_init(self)
@@ -43,6 +53,7 @@ class VideoReader:
 
     def _read(self) -> None:
         # Get next frame
+        started = time.perf_counter()
         frame = self.get_frame()
 
         # # If shared storage is not empty, simply wait
@@ -55,10 +66,15 @@ class VideoReader:
 
         # Put the frame into shared storage (or report an issue)
         try:
-            self.manager.read_storage.put(frame)
+            packet = Packet(self.frame_id, self.captured, frame)
+            self.manager.read_storage.put(packet)
+            self.frame_id += 1
             self.manager.read_timestamp.value = time.time()
+            self.manager.metrics.observe("reader", time.perf_counter() - started)
+            self.latency.record(packet)
             debug_read_frame(self)
         except Exception as e:
+            self.manager.metrics.drop("reader")
             debug_fail_read_frame(self, e)
             log = create_log(self.manager, "reader_put_error", e)
             try:
@@ -69,8 +85,25 @@ class VideoReader:
 
     def get_frame(self) -> np.ndarray:
         ret, frame = self.cap.read()
+        self.captured = self._get_capture_time()
         return frame
 
+    def _get_capture_time(self) -> float:
+        """
+        Estimate capture time of the last frame from stream PTS.
+        PTS is mapped to wall-clock time with the smallest offset seen so far,
+        so buffering in network and decoder is accounted as latency.
+        Falls back to the current time, if PTS is not available.
+        """
+        now = time.time()
+        pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if pts <= 0:
+            return now
+        offset = now - pts
+        if self._pts_offset is None or offset < self._pts_offset:
+            self._pts_offset = offset
+        return self._pts_offset + pts
+
     def close(self) -> None:
         # Release all reader resources
         self.cap.release()
@@ -0,0 +1,154 @@
+import re
+import time
+from typing import Tuple, Union
+
+import cv2
+import numpy as np
+
+
+SYNTHETIC_PATTERN = re.compile(r"^synthetic://(\d+)x(\d+)(?:@(\d+(?:\.\d+)?))?$")
+PACED_PATTERN = re.compile(r"^paced://(.+?)(?:@(\d+(?:\.\d+)?))?$")
+
+
+class SyntheticCapture:
+    """
+    Drop-in replacement for cv2.VideoCapture, that generates frames
+    at real-time pace: a few bright "passengers" walking up and down
+    over a static background. Used for load tests, so neither cameras
+    nor recorded videos are needed.
+    """
+
+    def __init__(self, size: Tuple[int], fps: float=30, n_objects: int=5, seed: int=0):
+        # Initialize frame parameters
+        self.size = size
+        self.fps = fps
+        self.n_objects = n_objects
+
+        # Background is rendered once, objects are drawn on its copy
+        width, height = size
+        rng = np.random.default_rng(seed)
+        self.background = np.empty((height, width, 3), dtype=np.uint8)
+        self.background[:] = rng.integers(40, 120, 3, dtype=np.uint8)
+        self.box_size = (width // 10, height // 4)
+        self.x = rng.uniform(0, width - self.box_size[0], n_objects)
+        self.y = rng.uniform(0, height - self.box_size[1], n_objects)
+        self.velocity = rng.uniform(-0.01, 0.01, n_objects) * height
+
+        # Initialize pacing attributes
+        self.started = None
+        self.n_frames = 0
+        self.opened = True
+        return
+
+    def read(self) -> Tuple[bool, np.ndarray]:
+        if not self.opened:
+            return False, None
+        _pace(self)
+        frame = self.background.copy()
+        width, height = self.size
+        box_w, box_h = self.box_size
+        self.y += self.velocity
+        # Turn back at the frame borders
+        self.velocity = np.where(
+            (self.y < 0) | (self.y + box_h > height), -self.velocity, self.velocity
+        )
+        self.y = np.clip(self.y, 0, height - box_h)
+        for x, y in zip(self.x.astype(int), self.y.astype(int)):
+            cv2.rectangle(frame, (x, y), (x + box_w, y + box_h), (220, 220, 220), -1)
+        self.n_frames += 1
+        return True, frame
+
+    def get(self, prop: int) -> float:
+        return _get(self, prop)
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def release(self) -> None:
+        self.opened = False
+        return
+
+
+class PacedCapture:
+    """
+    Drop-in replacement for cv2.VideoCapture, that plays a recorded video
+    in a loop at its own (or given) frame rate, like a live camera would.
+    """
+
+    def __init__(self, path: str, fps: float=None):
+        # Open the video and get its parameters
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.size = (
+            int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+
+        # Initialize pacing attributes
+        self.started = None
+        self.n_frames = 0
+        return
+
+    def read(self) -> Tuple[bool, np.ndarray]:
+        _pace(self)
+        ret, frame = self.cap.read()
+        if not ret:
+            # Start the video over
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if ret:
+            self.n_frames += 1
+        return ret, frame
+
+    def get(self, prop: int) -> float:
+        return _get(self, prop)
+
+    def isOpened(self) -> bool:
+        return self.cap.isOpened()
+
+    def release(self) -> None:
+        self.cap.release()
+        return
+
+
+def _pace(capture: Union[SyntheticCapture, PacedCapture]) -> None:
+    """Sleep until the next frame is due, so frames come at real-time pace."""
+    if capture.started is None:
+        capture.started = time.monotonic()
+        return
+    delay = capture.started + capture.n_frames / capture.fps - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+    return
+
+
+def _get(capture: Union[SyntheticCapture, PacedCapture], prop: int) -> float:
+    # PTS of looped videos keeps growing, like the one of a live stream
+    if prop == cv2.CAP_PROP_POS_MSEC:
+        return capture.n_frames / capture.fps * 1000
+    if prop == cv2.CAP_PROP_FPS:
+        return capture.fps
+    if prop == cv2.CAP_PROP_FRAME_WIDTH:
+        return capture.size[0]
+    if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+        return capture.size[1]
+    return 0.0
+
+
+def open_capture(stream: str) -> Union[cv2.VideoCapture, SyntheticCapture, PacedCapture]:
+    """
+    Open a stream. Besides anything cv2.VideoCapture accepts, simulated
+    cameras are supported:
+        synthetic://640x480@30 - generated frames of given size and FPS;
+        paced://video.mp4@25   - looped video at real-time pace (FPS is optional).
+    """
+    match = SYNTHETIC_PATTERN.match(stream)
+    if match is not None:
+        width, height, fps = match.groups()
+        return SyntheticCapture((int(width), int(height)), float(fps or 30))
+    match = PACED_PATTERN.match(stream)
+    if match is not None:
+        path, fps = match.groups()
+        return PacedCapture(path, float(fps) if fps else None)
+    return cv2.VideoCapture(stream)
@@ -7,24 +7,40 @@ import uuid
 import cv2
 import numpy as np
 
+from frame_processing.encoder import FFmpegEncoder
+from frame_processing.overlay import Overlay
 from loggers import create_log
+from storage import register_file, register_segment_list
 from utils.debug import (
     debug_writer_init,
+    debug_writer_backlog,
     debug_writer_create,
     debug_write_frame,
     debug_fail_write_frame,
 )
+from utils.metrics import LatencyRecorder
 from utils.types import StreamManager
 
 
 class VideoWriter:
 
+    # Hourly videos are rotated by ffmpeg segment muxer, if possible
+    segmented = True
+
     def __init__(self, manager: StreamManager):
         # Store a reference to StreamManager as an attribute
         self.manager = manager
 
         # Unpack parameters
         (_fourcc,fps, width, height) = self.manager.writer_tuple
+        (
+            backend,
+            ffmpeg_codec,
+            ffmpeg_preset,
+            ffmpeg_crf,
+            ffmpeg_threads,
+            backlog_interval,
+        ) = self.manager.encoder_tuple
 
         # Initialize extensions dictionary
         self._extensions = {
@@ -45,6 +61,19 @@ class VideoWriter:
         self.writer = None
         self._start_hour = None
 
+        # Set encoder backend attributes
+        self.backend = backend
+        self.ffmpeg_codec = ffmpeg_codec
+        self.ffmpeg_preset = ffmpeg_preset
+        self.ffmpeg_crf = ffmpeg_crf
+        self.ffmpeg_threads = ffmpeg_threads
+        self.backlog_interval = backlog_interval
+        self._backlog_timestamp = time.time()
+
+        # Initialize overlay with datetime and other text items
+        self.overlay = Overlay(self.manager)
+        self.latency = LatencyRecorder(self.manager, "writer")
+
         # Initialize cv2 objects for writing the video
         self.create()
 
@@ -57,12 +86,31 @@ class VideoWriter:
         self.out_path = self._make_out_path()
 
         # Initialize new writer
-        self.writer = cv2.VideoWriter(
-            self.out_path,
-            self.fourcc,
-            self.fps,
-            self.size,
-        )
+        if self.is_ffmpeg:
+            self.writer = FFmpegEncoder(
+                self.out_path,
+                self.fps,
+                self.size,
+                codec=self.ffmpeg_codec,
+                preset=self.ffmpeg_preset,
+                crf=self.ffmpeg_crf,
+                threads=self.ffmpeg_threads,
+                segment_time=3600 if self.segmented else None,
+                segment_list=self.segment_list if self.segmented else None,
+            )
+        else:
+            self.writer = cv2.VideoWriter(
+                self.out_path,
+                self.fourcc,
+                self.fps,
+                self.size,
+            )
+
+        # Register the output for retention
+        if self.is_ffmpeg and self.segmented:
+            register_segment_list(self.manager.session, self.segment_list)
+        else:
+            register_file(self.manager.session, self.out_path)
 
         # Print debug info
         debug_writer_create(self)
@@ -83,10 +131,16 @@ class VideoWriter:
         # The 'out_video_dir' environment variable contains
         # the abspath to directory with output videos.
         directory = os.environ.get("out_video_dir", "/tmp")
+        # ffmpeg names hourly segments itself, using strftime pattern.
+        # Minutes and seconds keep the first (partial) segment unique.
+        if self.is_ffmpeg and self.segmented:
+            filename = f"video_%Y-%m-%d_hour%H_cam{self.manager.camera}_%M-%S{self.ext}"
+            return os.path.join(directory, filename)
         # If file already exists, change the name
-        if filename in os.listdir(directory):
-            filename = f"video_{now.date()}_hour{self._start_hour:02d}_cam{self.manager.camera}_{uuid.uuid4()}{self.ext}"
         out_path = os.path.join(directory, filename)
+        if os.path.exists(out_path):
+            filename = f"video_{now.date()}_hour{self._start_hour:02d}_cam{self.manager.camera}_{uuid.uuid4()}{self.ext}"
+            out_path = os.path.join(directory, filename)
         return out_path
 
     def write(self) -> None:
@@ -112,51 +166,60 @@ class VideoWriter:
             return
 
         # Get next frame
-        frame = self.manager.write_storage.get()
+        packet = self.manager.write_storage.get()
+        frame = packet.data
+        started = time.perf_counter()
 
-        # Write datetime on a frame
-        self._write_datetime(frame)
+        # Write datetime and other overlay items on a frame
+        self._write_overlay(frame)
 
         # Write the frame
         try:
             self.writer.write(frame)
+            self.manager.metrics.observe("writer", time.perf_counter() - started)
+            self.latency.record(packet)
             debug_write_frame(self)
         except Exception as e:
+            self.manager.metrics.drop("writer")
             debug_fail_write_frame(self, e)
             log = create_log(self.manager, "writer_write_error", e)
             try:
                 self.manager.logs_storage.put(log)
             except Exception:
                 pass
+
+        # Report, whether encoding falls behind
+        self._check_backlog()
         return
 
-    def _write_datetime(self, frame: np.ndarray) -> None:
-        """Write current datetime in top-right corner of the frame."""
-        # Obtain current datetime
-        now = datetime.now()
-        date_time_str = now.strftime('%Y-%m-%d %H:%M:%S')
-
-        # Get text parameters
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        text_size = 0.7
-        text_color = (255, 255, 255)  # White
-        thickness = 2
-        text_y = frame.shape[1] // 20
-
-        # Calculate text x coordinate
-        (text_width, text_height), _ = cv2.getTextSize(date_time_str, font, text_size, thickness)
-        text_x = frame.shape[1] - text_width - 10  # Top-right corner
-
-        # Put text on a frame
-        cv2.putText(
-            frame,
-            date_time_str,
-            (text_x, text_y),
-            font,
-            text_size,
-            text_color,
-            thickness
-        )
+    def _check_backlog(self) -> None:
+        """
+        Periodically reports the number of frames waiting to be encoded.
+        If there is more than a second of video in the backlog,
+        writer_backlog event is logged as well.
+        """
+        now = time.time()
+        if now - self._backlog_timestamp < self.backlog_interval:
+            return
+        self._backlog_timestamp = now
+        backlog = self.backlog
+        debug_writer_backlog(self, backlog)
+        if backlog <= self.fps:
+            return
+        log = create_log(self.manager, "writer_backlog", f"{backlog} frames")
+        try:
+            self.manager.logs_storage.put(log)
+        except Exception:
+            pass
+        return
+
+    def _write_overlay(self, frame: np.ndarray) -> None:
+        """
+        Write current datetime in top-right corner of the frame
+        and other configured items in top-left corner.
+        Text is rendered only when it changes (see Overlay for details).
+        """
+        self.overlay.apply(frame)
         return
 
     def _is_valid(self) -> bool:
@@ -165,7 +228,10 @@ class VideoWriter:
         Basically, output path is set for 1 hour.
         So, we want to generate a new output path each hour,
         in order to limit the size of a single output video. 
+        ffmpeg rotates files itself, so it's only restarted on failure.
         """
+        if self.is_ffmpeg and self.segmented:
+            return self.writer.isOpened()
         return self._start_hour == datetime.now().time().hour
 
     def restart(self) -> None:
@@ -192,8 +258,28 @@ class VideoWriter:
 
     @property
     def ext(self) -> str:
+        if self.is_ffmpeg:
+            return ".mp4"
         return self._extensions.get(self._fourcc, ".avi")
 
+    @property
+    def segment_list(self) -> str:
+        directory = os.environ.get("out_video_dir", "/tmp")
+        return os.path.join(directory, f".video_cam{self.manager.camera}_segments.csv")
+
+    @property
+    def is_ffmpeg(self) -> bool:
+        return self.backend == "ffmpeg"
+
+    @property
+    def backlog(self) -> int:
+        """Number of frames, which are waiting in storage and encoder."""
+        try:
+            backlog = self.manager.write_storage.qsize()
+        except NotImplementedError:
+            backlog = 0
+        return backlog + getattr(self.writer, "backlog", 0)
+
     def run(self) -> None:
         return self.write()
 
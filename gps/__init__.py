@@ -1 +1,4 @@
-from .gps import GPS
\ No newline at end of file
+from .buffer import FixBuffer
+from .cache import GeolocationCache
+from .gps import GPS
+from .stream import GPSDClient, GPSStream
\ No newline at end of file
@@ -0,0 +1,115 @@
+import math
+from typing import List, Tuple
+
+
+class FixBuffer:
+    """
+    Ring buffer of timestamped GPS fixes, stored in shared memory.
+    It is written by GPSStream and read by any process, that creates logs,
+    so event geolocation can be interpolated at the exact event time.
+    """
+
+    # Each fix is stored as (timestamp, latitude, longitude, speed)
+    fields = 4
+
+    def __init__(self, ctx, size: int=600):
+        self.size = size
+        self.data = ctx.Array("d", size * self.fields)
+        self.count = ctx.Value("L", 0, lock=False)
+        return
+
+    def append(self, timestamp: float, latitude: float, longitude: float, speed: float) -> None:
+        with self.data.get_lock():
+            start = (self.count.value % self.size) * self.fields
+            self.data[start:start + self.fields] = [timestamp, latitude, longitude, speed]
+            self.count.value += 1
+        return
+
+    def fixes(self) -> List[Tuple[float]]:
+        """Get a copy of stored fixes, ordered by time."""
+        with self.data.get_lock():
+            count = self.count.value
+            data = self.data[:]
+        n = min(count, self.size)
+        first = count - n
+        fixes = []
+        for i in range(first, count):
+            start = (i % self.size) * self.fields
+            fixes.append(tuple(data[start:start + self.fields]))
+        return fixes
+
+    def latest(self) -> Tuple[float]:
+        """Get the latest fix or None, if there were no fixes yet."""
+        with self.data.get_lock():
+            count = self.count.value
+            if not count:
+                return None
+            return self._get(count - 1)
+
+    def speed(self, timestamp: float, patience: float) -> float:
+        """
+        Get current speed in m/s or None, if there is no recent fix.
+        Speed, reported by receiver, is used if present.
+        Otherwise it's calculated from the two latest fixes.
+        """
+        with self.data.get_lock():
+            count = self.count.value
+            last = self._get(count - 1) if count >= 1 else None
+            previous = self._get(count - 2) if count >= 2 else None
+        if last is None or timestamp - last[0] > patience:
+            return None
+        if not math.isnan(last[3]):
+            return last[3]
+        if previous is None:
+            return None
+        dt = last[0] - previous[0]
+        if dt <= 0 or dt > patience:
+            return None
+        return haversine(previous[1], previous[2], last[1], last[2]) / dt
+
+    def _get(self, i: int) -> Tuple[float]:
+        start = (i % self.size) * self.fields
+        return tuple(self.data[start:start + self.fields])
+
+    def interpolate(self, timestamp: float, patience: float) -> Tuple[float]:
+        """
+        Get (latitude, longitude) at given timestamp.
+        Position is interpolated linearly between the surrounding fixes.
+        If timestamp is outside of the buffer, the nearest fix is used,
+        unless it is more than 'patience' seconds away. Returns None otherwise.
+        """
+        fixes = self.fixes()
+        if not fixes:
+            return None
+        # Timestamp is outside of the buffer
+        if timestamp <= fixes[0][0]:
+            nearest = fixes[0]
+        elif timestamp >= fixes[-1][0]:
+            nearest = fixes[-1]
+        else:
+            nearest = None
+        if nearest is not None:
+            if abs(timestamp - nearest[0]) > patience:
+                return None
+            return (nearest[1], nearest[2])
+        # Find the surrounding fixes (buffer is small, so linear search is fine)
+        for before, after in zip(fixes, fixes[1:]):
+            if before[0] <= timestamp <= after[0]:
+                break
+        span = after[0] - before[0]
+        if span > patience:
+            return None
+        ratio = (timestamp - before[0]) / span if span else 0
+        latitude = before[1] + ratio * (after[1] - before[1])
+        longitude = before[2] + ratio * (after[2] - before[2])
+        return (latitude, longitude)
+
+def haversine(latitude1: float, longitude1: float, latitude2: float, longitude2: float) -> float:
+    """Distance between two points on Earth in meters."""
+    radius = 6371000
+    phi1 = math.radians(latitude1)
+    phi2 = math.radians(latitude2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * radius * math.asin(math.sqrt(a))
\ No newline at end of file
@@ -0,0 +1,138 @@
+from collections import OrderedDict
+import json
+import os
+import time
+from typing import Dict, Iterable, Set
+
+
+class GeolocationCache:
+    """
+    Persistent LRU cache of Wi-Fi geolocation answers, keyed by BSSID set.
+    Buses drive the same routes every day, so most of the access points
+    are seen again and again. Expired entries are not returned by 'get',
+    but may still be used by 'nearest', when the API is unreachable.
+    New entries are saved at most once per 'save_interval' seconds.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int=10000,
+        ttl_days: float=30,
+        save_interval: float=600
+    ):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl_days * 24 * 3600
+        self.save_interval = save_interval
+        self.dirty = False
+        self.saved = time.monotonic()
+        # key -> {"latitude": ..., "longitude": ..., "timestamp": ...}
+        self.entries = OrderedDict()
+        # BSSID -> keys, which contain it (for 'nearest' lookup)
+        self._index: Dict[str, Set[str]] = {}
+        self.load()
+        return
+
+    @staticmethod
+    def make_key(bssids: Iterable[str]) -> str:
+        return ",".join(sorted(set(bssid.lower() for bssid in bssids)))
+
+    def get(self, bssids: Iterable[str]) -> dict:
+        """Get cached location for exactly this BSSID set, if it's not expired."""
+        key = self.make_key(bssids)
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry["timestamp"] > self.ttl:
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def nearest(self, bssids: Iterable[str]) -> dict:
+        """Get location of the entry, that shares most BSSIDs with given ones."""
+        overlaps = {}
+        for bssid in set(bssid.lower() for bssid in bssids):
+            for key in self._index.get(bssid, ()):
+                overlaps[key] = overlaps.get(key, 0) + 1
+        if not overlaps:
+            return None
+        key = max(overlaps, key=overlaps.get)
+        return self.entries[key]
+
+    def put(self, bssids: Iterable[str], latitude: float, longitude: float) -> None:
+        key = self.make_key(bssids)
+        if not key:
+            return
+        self.entries[key] = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "timestamp": time.time(),
+        }
+        self.entries.move_to_end(key)
+        for bssid in key.split(","):
+            self._index.setdefault(bssid, set()).add(key)
+        # Evict least recently used entries
+        while len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            self._unindex(evicted)
+        self.dirty = True
+        self.flush()
+        return
+
+    def _unindex(self, key: str) -> None:
+        for bssid in key.split(","):
+            keys = self._index.get(bssid)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                self._index.pop(bssid)
+        return
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                entries = json.load(cache_file)
+            # Entries are stored from least to most recently used
+            if not isinstance(entries, list):
+                raise ValueError("Cache is not a list of entries")
+            loaded = OrderedDict()
+            for key, entry in entries:
+                if not isinstance(key, str) or not all(
+                    isinstance(entry[field], (int, float))
+                    for field in ("latitude", "longitude", "timestamp")
+                ):
+                    raise ValueError(f"Invalid cache entry: {key}")
+                loaded[key] = entry
+        except (OSError, ValueError, TypeError, KeyError):
+            # Damaged or foreign file is discarded and overwritten on save
+            return
+        for key, entry in loaded.items():
+            self.entries[key] = entry
+            for bssid in key.split(","):
+                self._index.setdefault(bssid, set()).add(key)
+        return
+
+    def flush(self, force: bool=False) -> None:
+        """Save new entries, if 'save_interval' has passed since the last save."""
+        if not self.dirty:
+            return
+        if not force and time.monotonic() - self.saved < self.save_interval:
+            return
+        self.save()
+        return
+
+    def save(self) -> None:
+        """Save cache atomically, so it's never corrupted on power loss."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(list(self.entries.items()), cache_file)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        self.saved = time.monotonic()
+        return
+
+    def __len__(self) -> int:
+        return len(self.entries)
\ No newline at end of file
@@ -7,6 +7,7 @@ import time
 import gpsd
 import requests
 
+from gps.cache import GeolocationCache
 from utils.debug import (
     debug_gps_fail_get_location,
     debug_gps_get_geolocation,
@@ -24,22 +25,37 @@ class GPS:
         self.api_key = self.session.gps_api_key
         self.url = "http://api.lbs.yandex.net/geolocation"
         self.networks = []
+        # Keep connection to API alive between requests
+        self.http = requests.Session()
+        # Initialize cache of previous API answers
+        (cache_path, cache_size, cache_ttl_days, cache_save_interval) = self.session.gps_cache_tuple
+        self.cache = GeolocationCache(cache_path, cache_size, cache_ttl_days, cache_save_interval)
         # Set attributes for local GPS receiver
         self.socket = socket
         self.packet = None
         # Set request cooldown
         self.cooldown = 60
+        # In stream mode local receiver is read by GPSStream
+        self.stream_mode = self.session.gps_mode == "stream"
         # Connect to GPS
         os.environ["GPSD_SOCKET"] = self.socket
-        try:
-            gpsd.connect()
-            self._gpsd_connected = True
-        except Exception:
-            self._gpsd_connected = False
+        self._gpsd_connected = False
+        if not self.stream_mode:
+            try:
+                gpsd.connect()
+                self._gpsd_connected = True
+            except Exception:
+                pass
         debug_gps_init(self)
         return
 
     def get_location(self) -> None:
+        # Save new cache entries, which were batched since the last save
+        self.cache.flush()
+        # Wi-Fi geolocation is not required, while GPSStream has fresh fixes
+        if self.stream_mode and self._has_fresh_fix():
+            time.sleep(self.cooldown)
+            return
         # Yandex API
         try:
             location = self._get_location_yandex()
@@ -69,16 +85,19 @@ class GPS:
     def _get_location_yandex(self) -> dict:
         """Get current device geolocation store it into session."""
         nmcli_output = subprocess.check_output(
-            "nmcli -f BSSID,SSID,SIGNAL dev wifi",
+            ["nmcli", "-f", "BSSID,SSID,SIGNAL", "dev", "wifi"],
             encoding="utf-8",
-            shell=True
         )
         self.networks = self._parse_nmcli_output(nmcli_output)
         location = self._request_geolocation()
         return location
 
     def _request_geolocation(self) -> dict:
-        """Request current geolocation based on networks"""
+        """
+        Request current geolocation based on networks.
+        Previous answers for the same networks are taken from cache.
+        If API is unreachable, the closest cached location is used.
+        """
         location = self._get_location_template()
         # Connection is lost
         if not self.networks:
@@ -87,16 +106,31 @@ class GPS:
             self.networks,
             key=lambda x: x["signal_strength"]
         )
+        wifi_networks = [strongest_network]
+        bssids = [network["mac"] for network in wifi_networks]
+        cached = self.cache.get(bssids)
+        if cached is not None:
+            location["latitude"] = cached["latitude"]
+            location["longitude"] = cached["longitude"]
+            return location
         data = {
             "common": {
                 "version": "1.0",
                 "api_key": self.api_key
             },
-            "wifi_networks": [strongest_network]
+            "wifi_networks": wifi_networks
         }
         json_str = json.dumps(data)
         payload = {"json": json_str}
-        response = requests.post(self.url, data=payload, timeout=5)
+        try:
+            response = self.http.post(self.url, data=payload, timeout=5)
+        except requests.RequestException:
+            cached = self.cache.nearest(network["mac"] for network in self.networks)
+            if cached is None:
+                raise
+            location["latitude"] = cached["latitude"]
+            location["longitude"] = cached["longitude"]
+            return location
         try:
             geolocation = response.json()
         except Exception as e:
@@ -110,6 +144,8 @@ class GPS:
         location["latitude"] = position.get("latitude")
         location["longitude"] = position.get("longitude")
         location["error"] = geolocation.get("error")
+        if not self._is_invalid(location):
+            self.cache.put(bssids, location["latitude"], location["longitude"])
         return location
 
     def _parse_nmcli_output(self, output: str) -> list:
@@ -127,9 +163,16 @@ class GPS:
 
         return wifi_networks 
 
+    def _has_fresh_fix(self) -> bool:
+        """Check, whether GPSStream has received a fix recently."""
+        fix = self.session.fixes.latest()
+        return fix is not None and time.time() - fix[0] < self.session.patience
+
     def _get_location_gps(self) -> dict:
         """Get location from local GPS receiver."""
         location = self._get_location_template()
+        if self.stream_mode:
+            return location
         if not self._gpsd_connected:
             try:
                 gpsd.connect()
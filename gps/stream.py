@@ -0,0 +1,112 @@
+import json
+import socket
+import time
+
+from utils.debug import (
+    debug_gps_stream_connect,
+    debug_gps_stream_fail,
+    debug_gps_stream_init,
+)
+from utils.types import Session
+
+
+class GPSDClient:
+    """
+    Minimal gpsd client, that uses streaming watch mode.
+    gpsd pushes JSON reports itself, so there is no polling.
+    """
+
+    def __init__(self, host: str="127.0.0.1", port: int=2947, timeout: float=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+        return
+
+    def connect(self) -> None:
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.sendall(b'?WATCH={"enable":true,"json":true};\n')
+        self.file = self.sock.makefile("r", encoding="utf-8")
+        return
+
+    def read(self) -> dict:
+        """Read the next report. Blocks until gpsd sends it or timeout expires."""
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("gpsd closed the connection")
+        return json.loads(line)
+
+    def close(self) -> None:
+        for resource in (self.file, self.sock):
+            try:
+                if resource is not None:
+                    resource.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.file = None
+        return
+
+    @property
+    def connected(self) -> bool:
+        return self.sock is not None
+
+
+class GPSStream:
+    """
+    Subscribes to gpsd and stores each fix into shared FixBuffer.
+    Also keeps session geolocation up to date for the rest of the pipeline.
+    """
+
+    def __init__(self, session: Session):
+        # Store reference to session as an attribute
+        self.session = session
+
+        # Unpack parameters
+        (host, port) = self.session.gpsd_tuple
+
+        # Set required attributes
+        self.type = "gps_stream"
+        self.client = GPSDClient(host, port)
+        self.cooldown = 5
+
+        # Print debug info
+        debug_gps_stream_init(self)
+        return
+
+    def listen(self) -> None:
+        # (Re)connect to gpsd if necessary
+        try:
+            if not self.client.connected:
+                self.client.connect()
+                debug_gps_stream_connect(self)
+            report = self.client.read()
+        except (OSError, ValueError) as e:
+            debug_gps_stream_fail(self, e)
+            self.client.close()
+            time.sleep(self.cooldown)
+            return
+
+        # Only TPV reports with 2D/3D fix contain position
+        if report.get("class") != "TPV" or report.get("mode", 0) < 2:
+            return
+        latitude = report.get("lat")
+        longitude = report.get("lon")
+        if latitude is None or longitude is None:
+            return
+
+        # System time is used, as all the events are timestamped with it
+        timestamp = time.time()
+        speed = report.get("speed", float("nan"))
+        self.session.fixes.append(timestamp, latitude, longitude, speed)
+        self.session.latitude.value = latitude
+        self.session.longitude.value = longitude
+        self.session.timestamp.value = timestamp
+        return
+
+    def run(self, *args, **kwargs) -> None:
+        return self.listen(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs) -> None:
+        return self.listen(*args, **kwargs)
\ No newline at end of file
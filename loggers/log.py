@@ -73,14 +73,25 @@ class Log:
         return data
 
 
-def create_log(manager: StreamManager, event: str, error: Exception=None) -> Log:
+def create_log(
+    manager: StreamManager,
+    event: str,
+    error: Exception=None,
+    captured: float=None
+) -> Log:
+    """
+    Create a log of an event, that happened at 'captured' (e.g. capture time
+    of the frame) or now. Geolocation is resolved later by Logger, when
+    a GPS fix after the event is available (see 'Logger.is_ready').
+    """
+    timestamp = datetime.now() if captured is None else datetime.fromtimestamp(captured)
     log = Log(
+        timestamp=timestamp,
         camera=manager.camera,
         route_id=manager.session.route_id,
         bus_id=manager.session.bus_id,
         session_id=manager.session.session_id,
         event=event,
         error=error,
-        geolocation=manager.session.geolocation
     )
     return log
\ No newline at end of file
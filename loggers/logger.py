@@ -1,6 +1,8 @@
+from collections import deque
 import json
 import time
 
+from storage import register_file
 from utils.debug import debug_logger_init
 from utils.types import Session, Log
 
@@ -13,12 +15,32 @@ class Logger:
 
         # Initialize required attributes
         self.log_path = self.session.event_log_path
+        # Log file is created on the first write, so it's registered then
+        self.registered = False
+        # Logs, waiting for a GPS fix after the event to be located
+        self.pending = deque()
+        self.delay = self.session.geolocation_delay
 
         # Print debug info
         debug_logger_init(self)
         return
 
+    def is_ready(self, log: Log) -> bool:
+        """
+        Check, whether the log can be located: a GPS fix after the event has
+        arrived, there are no fixes at all (e.g. 'poll' GPS mode) or the log
+        has waited for 'delay' seconds already.
+        """
+        timestamp = log.timestamp.timestamp()
+        fix = self.session.fixes.latest()
+        return fix is None or fix[0] >= timestamp or time.time() - timestamp > self.delay
+
     def write_log(self, log: Log) -> None:
+        # Position is interpolated at the event time
+        if log.geolocation == (None, None):
+            geolocation = self.session.geolocation_at(log.timestamp.timestamp())
+            if geolocation is not None:
+                log.geolocation = geolocation
         data = log.to_json()
         with open(self.log_path, "a", encoding="utf-8") as log_file:
             if log_file.tell():
@@ -26,15 +48,30 @@ class Logger:
             else:
                 data_str = json.dumps(data, indent=4)
             log_file.write(data_str)
+        if not self.registered:
+            register_file(self.session, self.log_path)
+            self.registered = True
         return
 
     def log(self) -> None:
         for manager in self.session.managers:
-            if manager.logs_storage.empty():
-                time.sleep(0.01)
-                continue
-            log = manager.logs_storage.get()
+            while not manager.logs_storage.empty():
+                self.pending.append(manager.logs_storage.get())
+        # Logs are written in order, as soon as they can be located
+        if not self.pending or not self.is_ready(self.pending[0]):
+            time.sleep(0.01)
+            return
+        while self.pending and self.is_ready(self.pending[0]):
+            log = self.pending.popleft()
+            started = time.perf_counter()
             self.write_log(log)
+            self.session.metrics.observe("logger", time.perf_counter() - started)
+        return
+
+    def flush(self) -> None:
+        """Write pending logs without waiting for GPS fixes (e.g. on stop)."""
+        while self.pending:
+            self.write_log(self.pending.popleft())
         return
 
     def run(self, *args, **kwargs) -> None:
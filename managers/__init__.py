@@ -1 +1,2 @@
-from .session import Session
\ No newline at end of file
+from .session import Session
+from .status import StatusServer
\ No newline at end of file
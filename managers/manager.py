@@ -1,6 +1,7 @@
 import time
 
 from utils.debug import debug_manager_init
+from utils.metrics import StageMetrics, queue_size
 from utils.types import Session
 
 
@@ -29,6 +30,11 @@ class StreamManager:
             detect_conf,
             detect_iou,
             detect_half,
+            gate_enabled,
+            gate_speed_threshold,
+            gate_moving_stride,
+            gate_motion_threshold,
+            gate_fix_patience,
             min_detection_square,
             max_bbox_sides_relation,
             line_height,
@@ -40,11 +46,29 @@ class StreamManager:
             max_tracked_objects,
             fourcc,
             fps,
+            writer_backend,
+            ffmpeg_codec,
+            ffmpeg_preset,
+            ffmpeg_crf,
+            ffmpeg_threads,
+            backlog_interval,
+            overlay_items,
+            record_mode,
+            clip_pre_seconds,
+            clip_post_seconds,
+            clip_jpeg_quality,
             cls_weights,
             cls_threshold,
             cls_half,
             cls_mode,
             cls_shape,
+            inference_backend,
+            mock_script,
+            mock_detect_latency,
+            mock_cls_latency,
+            mock_n_boxes,
+            warmup_iterations,
+            compile_cache,
         ) = session.stream_tuple
 
         # Make shape for detector
@@ -52,7 +76,15 @@ class StreamManager:
 
         # Initialize attributes to store workers' data
         self.reader_tuple = (stream,)
-        self.preprocessor_tuple = (detect_shape, cls_shape)
+        write_frames = record_mode != "copy"
+        self.preprocessor_tuple = (detect_shape, cls_shape, write_frames)
+        self.gate_tuple = (
+            gate_enabled,
+            gate_speed_threshold,
+            gate_moving_stride,
+            gate_motion_threshold,
+            gate_fix_patience,
+        )
         self.detector_tuple = (
             detect_weights,
             detect_conf,
@@ -61,6 +93,12 @@ class StreamManager:
             device,
             min_detection_square,
             max_bbox_sides_relation,
+            inference_backend,
+            mock_script,
+            mock_detect_latency,
+            mock_n_boxes,
+            warmup_iterations,
+            compile_cache,
         )
         self.classifier_tuple = (
             cls_weights,
@@ -69,6 +107,11 @@ class StreamManager:
             cls_mode,
             cls_shape,
             device,
+            inference_backend,
+            mock_script,
+            mock_cls_latency,
+            warmup_iterations,
+            compile_cache,
         )
         self.tracker_tuple = (
             width,
@@ -82,14 +125,34 @@ class StreamManager:
             max_tracked_objects,
         )
         self.writer_tuple = (fourcc, fps, width, height)
+        self.encoder_tuple = (
+            writer_backend,
+            ffmpeg_codec,
+            ffmpeg_preset,
+            ffmpeg_crf,
+            ffmpeg_threads,
+            backlog_interval,
+        )
+        self.overlay_tuple = (overlay_items,)
+        self.clip_tuple = (
+            clip_pre_seconds,
+            clip_post_seconds,
+            clip_jpeg_quality,
+        )
+        self.record_mode = record_mode
 
         # Initialize counters
         self.count_in = self.session.ctx.Value("I", 0)
         self.count_out = self.session.ctx.Value("I", 0)
 
+        # Initialize timestamp of the last event to record a clip around
+        self.clip_trigger = self.session.ctx.Value("d", 0)
+
         # Initialize storages
         self.read_storage = self.ctx.Queue()
         self.read_timestamp = self.ctx.Value("d", time.time())
+        self.detector_ready = self.ctx.Value("b", 0)
+        self.classifier_ready = self.ctx.Value("b", 0)
         self.preprocess_storage = self.ctx.Queue()
         self.preprocess_door_storage = self.ctx.Queue()
         self.detect_storage = self.ctx.Queue()
@@ -97,10 +160,46 @@ class StreamManager:
         self.logs_storage = self.ctx.Queue()
         self.write_storage = self.ctx.Queue()
 
+        # Initialize stage counters
+        self.metrics = StageMetrics(
+            self.ctx,
+            (
+                "reader",
+                "preprocessor",
+                "detector",
+                "classifier",
+                "tracker",
+                "writer",
+            )
+        )
+
         # Print debug info
         debug_manager_init(self)
         return
 
+    @property
+    def queues(self) -> dict:
+        return {
+            "read_storage": self.read_storage,
+            "preprocess_storage": self.preprocess_storage,
+            "preprocess_door_storage": self.preprocess_door_storage,
+            "detect_storage": self.detect_storage,
+            "door_storage": self.door_storage,
+            "logs_storage": self.logs_storage,
+            "write_storage": self.write_storage,
+        }
+
+    def snapshot(self) -> dict:
+        """Collect current state of the stream pipeline."""
+        return {
+            "count_in": self.count_in.value,
+            "count_out": self.count_out.value,
+            "stages": self.metrics.snapshot(),
+            "queues": {
+                name: queue_size(queue) for name, queue in self.queues.items()
+            },
+        }
+
     def validate_reader(self) -> bool:
         """Validate VideoReader activity status."""
         return time.time() - self.read_timestamp.value < self.patience
\ No newline at end of file
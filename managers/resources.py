@@ -0,0 +1,190 @@
+import os
+from typing import Dict, List, Tuple, Union
+
+import cv2
+
+from utils.debug import (
+    debug_resources_apply,
+    debug_fail_resources_apply,
+    debug_fail_resources_pinning,
+)
+from utils.types import Session
+
+
+class ResourcePlanner:
+    """
+    Plans CPU affinity, compute threads (torch and OpenCV) and nice level
+    of every worker process, so workers don't oversubscribe the cores.
+    Each process applies its own part of the plan on start (see 'apply').
+
+    In "auto" mode, NN stages on CPU get disjoint slices of the available
+    cores (detector gets twice as many as classifier), while other stages
+    get a single thread. If there are less cores than NN stages, they
+    aren't pinned and use a single thread each. Background stages get
+    lower priority, so readers are never starved. Entries of the profile override the automatic plan
+    ("auto" mode) or are the only ones to be applied ("profile" mode):
+        {"detector": {"cores": "2-5", "threads": 4, "nice": 0}, "log": {"nice": 10}}
+    """
+
+    # Process names, as in session processes (see 'utils._make_processes')
+    names = (
+        "reader",
+        "preprocessor",
+        "detector",
+        "classifier",
+        "tracker",
+        "writer",
+        "archiver",
+        "log",
+        "gps",
+        "gps_stream",
+        "retention",
+    )
+
+    # Nice levels in "auto" mode (NN stages on CPU get 'nn_nice')
+    nice = {
+        "writer": 5,
+        "archiver": 5,
+        "log": 10,
+        "gps": 10,
+        "gps_stream": 10,
+        "retention": 15,
+    }
+    nn_nice = 5
+
+    def __init__(self, session: Session):
+        # Unpack parameters
+        (mode, profile, device, inference_backend) = session.resource_tuple
+
+        # Set planning attributes
+        self.mode = mode
+        self.profile = profile
+        self.inference_backend = inference_backend
+        self.cores = sorted(os.sched_getaffinity(0))
+        self.cpu_inference = inference_backend == "ultralytics" and device.startswith("cpu")
+
+        # Make the plan: (group, name) -> (cores, threads, nice)
+        self.processes = self.get_processes(session)
+        self.plan: Dict[Tuple, Tuple] = {}
+        if self.mode == "auto":
+            self.plan.update(self.make_auto_plan())
+        if self.mode in ("auto", "profile"):
+            self.plan.update(self.make_profile_plan())
+        return
+
+    def get_processes(self, session: Session) -> List[Tuple]:
+        processes = []
+        for manager in session.managers:
+            for name in ("reader", "preprocessor", "detector", "classifier", "tracker"):
+                processes.append((manager.camera, name))
+            processes.append((manager.camera, "archiver" if manager.record_mode == "copy" else "writer"))
+        processes.append(("logger", "log"))
+        processes.append(("gps", "gps"))
+        if session.gps_mode == "stream":
+            processes.append(("gps", "gps_stream"))
+        processes.append(("storage", "retention"))
+        return processes
+
+    def make_auto_plan(self) -> Dict[Tuple, Tuple]:
+        plan = {
+            (group, name): (None, 1, self.nice.get(name, 0))
+            for group, name in self.processes
+        }
+        if not self.cpu_inference:
+            return plan
+        # Split the cores between NN stages: 2 shares for detector, 1 for classifier
+        nn_processes = [
+            (group, name) for group, name in self.processes
+            if name in ("detector", "classifier")
+        ]
+        n_shares = sum(2 if name == "detector" else 1 for _, name in nn_processes)
+        # Slices can't be disjoint, if there are less cores than NN stages
+        if len(nn_processes) > len(self.cores):
+            debug_fail_resources_pinning(self, len(nn_processes))
+            for group, name in nn_processes:
+                plan[(group, name)] = (None, 1, self.nn_nice)
+            return plan
+        exact = [
+            len(self.cores) * (2 if name == "detector" else 1) / n_shares
+            for _, name in nn_processes
+        ]
+        threads = [max(1, int(share)) for share in exact]
+        # Every stage keeps at least 1 core, the largest slices give up the rest
+        while sum(threads) > len(self.cores):
+            threads[threads.index(max(threads))] -= 1
+        # Spare cores go to the stages, which got the most below their share
+        spare = len(self.cores) - sum(threads)
+        for i in sorted(range(len(threads)), key=lambda i: threads[i] - exact[i])[:spare]:
+            threads[i] += 1
+        position = 0
+        for (group, name), n_threads in zip(nn_processes, threads):
+            cores = tuple(self.cores[position:position + n_threads])
+            position += n_threads
+            plan[(group, name)] = (cores, n_threads, self.nn_nice)
+        return plan
+
+    def make_profile_plan(self) -> Dict[Tuple, Tuple]:
+        plan = {}
+        for group, name in self.processes:
+            if name not in self.profile:
+                continue
+            entry = self.profile[name]
+            cores, threads, nice = self.plan.get((group, name), (None, None, None))
+            if "cores" in entry:
+                cores = parse_cores(entry["cores"])
+            plan[(group, name)] = (
+                cores,
+                entry.get("threads", threads),
+                entry.get("nice", nice),
+            )
+        return plan
+
+    def apply(self, group: Union[int, str], name: str) -> None:
+        """Apply the plan to the current process. Called by the process itself."""
+        spec = self.plan.get((group, name))
+        if spec is None:
+            return
+        cores, threads, nice = spec
+        try:
+            if cores is not None:
+                os.sched_setaffinity(0, cores)
+            if threads is not None:
+                cv2.setNumThreads(threads)
+                # torch is imported by the real NN backend only
+                if name in ("detector", "classifier") and self.inference_backend == "ultralytics":
+                    import torch
+                    torch.set_num_threads(threads)
+            if nice is not None:
+                os.setpriority(os.PRIO_PROCESS, 0, nice)
+            debug_resources_apply(self, group, name)
+        except (OSError, RuntimeError) as e:
+            debug_fail_resources_apply(self, group, name, e)
+        return
+
+    def layout(self) -> List[str]:
+        """Get human-readable lines of the plan."""
+        lines = []
+        for group, name in self.processes:
+            spec = self.plan.get((group, name))
+            if spec is None:
+                continue
+            cores, threads, nice = spec
+            lines.append(
+                f"{group}/{name}: cores={format_cores(cores)}, threads={threads}, nice={nice}"
+            )
+        return lines
+
+
+def parse_cores(cores: Union[str, List[int]]) -> Tuple[int]:
+    """Parse cores from a list or a string like "0-3,6"."""
+    if not isinstance(cores, str):
+        return tuple(int(core) for core in cores)
+    parsed = []
+    for part in cores.split(","):
+        first, _, last = part.strip().partition("-")
+        parsed.extend(range(int(first), int(last or first) + 1))
+    return tuple(parsed)
+
+
+def format_cores(cores: Tuple[int]) -> str:
+    return "all" if cores is None else ",".join(map(str, cores))
@@ -4,14 +4,26 @@ import multiprocessing as mp
 import os
 import time
 
-import torch
-
 from managers.manager import StreamManager
+from managers.resources import ResourcePlanner
 from utils.debug import debug_session_init
+from utils.metrics import StageMetrics, queue_size
+from gps.buffer import FixBuffer
 
 
 class Session:
 
+    # Worker loops, which can be traced and profiled
+    stages = (
+        "reader",
+        "preprocessor",
+        "detector",
+        "classifier",
+        "tracker",
+        "writer",
+        "logger",
+    )
+
     def __init__(self, **kwargs):
         # Unpack arguments
         bus_id = kwargs.get("bus_id", None)
@@ -24,9 +36,14 @@ class Session:
         detect_conf = kwargs.get("detect_conf", 0.45)
         detect_iou = kwargs.get("detect_iou", 0.01)
         detect_half = kwargs.get("detect_half", True)
+        gate_enabled = kwargs.get("gate_enabled", False)
+        gate_speed_threshold = kwargs.get("gate_speed_threshold", 1.5)
+        gate_moving_stride = kwargs.get("gate_moving_stride", 10)
+        gate_motion_threshold = kwargs.get("gate_motion_threshold", 6.0)
+        gate_fix_patience = kwargs.get("gate_fix_patience", 5)
         min_detection_square = kwargs.get("min_detection_square", 0)
         max_bbox_sides_relation = kwargs.get("max_bbox_sides_relation", float("inf"))
-        device = kwargs.get("device", "cuda" if torch.cuda.is_available() else "cpu")
+        device = kwargs.get("device", None)
         line_height = kwargs.get("line_height", 130)
         tracker_max_age = kwargs.get("tracker_max_age", 60)
         tracker_min_hits = kwargs.get("tracker_min_hits", 1)
@@ -35,24 +52,106 @@ class Session:
         min_frames_to_count = kwargs.get("min_frames_to_count", 500)
         max_tracked_objects = kwargs.get("max_tracked_objects", 100)
         patience = kwargs.get("patience", 120)
+        geolocation_delay = kwargs.get("geolocation_delay", 3)
         fourcc = kwargs.get("fourcc", "mp4v")
         fps = kwargs.get("fps", 30)
+        writer_backend = kwargs.get("writer_backend", "opencv")
+        ffmpeg_codec = kwargs.get("ffmpeg_codec", "libx264")
+        ffmpeg_preset = kwargs.get("ffmpeg_preset", "veryfast")
+        ffmpeg_crf = kwargs.get("ffmpeg_crf", 23)
+        ffmpeg_threads = kwargs.get("ffmpeg_threads", 0)
+        backlog_interval = kwargs.get("backlog_interval", 60)
+        overlay_items = kwargs.get("overlay_items", ["datetime"])
+        record_mode = kwargs.get("record_mode", "hourly")
+        clip_pre_seconds = kwargs.get("clip_pre_seconds", 5)
+        clip_post_seconds = kwargs.get("clip_post_seconds", 10)
+        clip_jpeg_quality = kwargs.get("clip_jpeg_quality", 90)
         stop_hour = kwargs.get("stop_hour", 2)
         cls_weights = kwargs.get("cls_weights", None)
         cls_threshold = kwargs.get("cls_threshold", 0.25)
         cls_half = kwargs.get("cls_half", True)
         cls_mode = kwargs.get("cls_mode", "torch")
         cls_shape = kwargs.get("cls_shape", None)
+        inference_backend = kwargs.get("inference_backend", "ultralytics")
+        mock_script = kwargs.get("mock_script", None)
+        mock_detect_latency = kwargs.get("mock_detect_latency", 0.02)
+        mock_cls_latency = kwargs.get("mock_cls_latency", 0.005)
+        mock_n_boxes = kwargs.get("mock_n_boxes", 5)
+        share_models = kwargs.get("share_models", False)
+        warmup_iterations = kwargs.get("warmup_iterations", 3)
+        compile_cache = kwargs.get("compile_cache", False)
+        ready_timeout = kwargs.get("ready_timeout", 300)
+        start_method = kwargs.get("start_method", "spawn")
+        preload_modules = kwargs.get("preload_modules", [])
+        video_quota_gb = kwargs.get("video_quota_gb", None)
+        video_max_age_days = kwargs.get("video_max_age_days", None)
+        logs_quota_gb = kwargs.get("logs_quota_gb", None)
+        logs_max_age_days = kwargs.get("logs_max_age_days", None)
+        retention_interval = kwargs.get("retention_interval", 60)
+        gps_mode = kwargs.get("gps_mode", "poll")
+        gpsd_host = kwargs.get("gpsd_host", "127.0.0.1")
+        gpsd_port = kwargs.get("gpsd_port", 2947)
+        gps_buffer_size = kwargs.get("gps_buffer_size", 600)
+        gps_cache_path = kwargs.get(
+            "gps_cache_path",
+            os.path.join(os.environ.get("logs_dir", "/tmp"), ".geolocation_cache.json")
+        )
+        gps_cache_size = kwargs.get("gps_cache_size", 10000)
+        gps_cache_ttl_days = kwargs.get("gps_cache_ttl_days", 30)
+        gps_cache_save_interval = kwargs.get("gps_cache_save_interval", 600)
+        latency_interval = kwargs.get("latency_interval", 60)
+        trace = kwargs.get("trace", False)
+        profile_stages = kwargs.get("profile_stages", [])
+        profile_mode = kwargs.get("profile_mode", "sample")
+        profile_interval = kwargs.get("profile_interval", 300)
+        profile_window = kwargs.get("profile_window", 10)
+        profile_sample_interval = kwargs.get("profile_sample_interval", 0.005)
+        resource_mode = kwargs.get("resource_mode", "off")
+        resource_profile = kwargs.get("resource_profile", {})
+        api_host = kwargs.get("api_host", "127.0.0.1")
+        api_port = kwargs.get("api_port", None)
         gps_api_key = kwargs.get("gps_api_key", os.environ.get("GPS_API_KEY"))
 
+        # Environment overrides config, so stages can be profiled in place
+        if os.environ.get("IEC_PROFILE"):
+            profile_stages = [
+                stage.strip() for stage in os.environ["IEC_PROFILE"].split(",")
+                if stage.strip()
+            ]
+        profile_mode = os.environ.get("IEC_PROFILE_MODE", profile_mode)
+
         # Check for wrong input
-        if detect_weights is None or cls_weights is None:
+        if inference_backend not in ("ultralytics", "mock"):
+            raise ValueError(f"Unknown inference backend: {inference_backend}.")
+        if inference_backend == "ultralytics" and (detect_weights is None or cls_weights is None):
             raise ValueError(
                 "Keyword arguments 'detect_weights'and 'cls_weights' ",
                 "should be not None."
             )
         if len(streams) != n_cameras:
             raise ValueError(f"Provided {len(streams)} streams for {n_cameras} cameras.")
+        if writer_backend not in ("opencv", "ffmpeg"):
+            raise ValueError(f"Unknown writer backend: {writer_backend}.")
+        if gps_mode not in ("poll", "stream"):
+            raise ValueError(f"Unknown GPS mode: {gps_mode}.")
+        if record_mode not in ("hourly", "events", "copy"):
+            raise ValueError(f"Unknown record mode: {record_mode}.")
+        if profile_mode not in ("sample", "cprofile"):
+            raise ValueError(f"Unknown profile mode: {profile_mode}.")
+        unknown_stages = set(profile_stages) - set(self.stages)
+        if unknown_stages:
+            raise ValueError(f"Unknown stages to profile: {sorted(unknown_stages)}.")
+        if start_method not in ("spawn", "forkserver"):
+            raise ValueError(f"Unknown start method: {start_method}.")
+        if resource_mode not in ("off", "auto", "profile"):
+            raise ValueError(f"Unknown resource mode: {resource_mode}.")
+        unknown_processes = set(resource_profile) - set(ResourcePlanner.names)
+        if unknown_processes:
+            raise ValueError(f"Unknown processes in resource profile: {sorted(unknown_processes)}.")
+
+        # Torch is only needed (and imported) by the real inference backend
+        if device is None:
+            device = self.get_default_device(inference_backend)
 
         # Initialize session identifiers: bus id, route id and session id
         self.bus_id = bus_id
@@ -64,18 +163,61 @@ class Session:
         
         # Initialize GPS parameters
         self.gps_api_key = gps_api_key
+        self.gps_mode = gps_mode
+        self.gpsd_tuple = (gpsd_host, gpsd_port)
+        self.gps_cache_tuple = (
+            gps_cache_path,
+            gps_cache_size,
+            gps_cache_ttl_days,
+            gps_cache_save_interval,
+        )
 
         # Initialize logging path for this session
         self.event_log_path = self.make_event_log_path()
 
+        # Initialize timeline tracing paths (tracing is opt-in)
+        self.trace_dir = self.make_trace_dir() if trace else None
+        self.trace_path = self.make_trace_path()
+
+        # Initialize profiling parameters (only listed stages are profiled)
+        self.profile_tuple = (
+            tuple(profile_stages),
+            profile_mode,
+            profile_interval,
+            profile_window,
+            profile_sample_interval,
+        )
+        self.profile_dir = os.path.join(os.environ.get("logs_dir", "/tmp"), "profiles")
+
         # Initialize shared geolocation storages as attributes
-        self.ctx = mp.get_context("spawn")
+        self.ctx = mp.get_context(start_method)
+        # Fork server imports heavy modules once, workers are forked from it
+        if start_method == "forkserver":
+            self.ctx.set_forkserver_preload(preload_modules)
         self.latitude = self.ctx.Value("d", 0)
         self.longitude = self.ctx.Value("d", 0)
         self.timestamp = self.ctx.Value("d", time.time())
+        self.fixes = FixBuffer(self.ctx, gps_buffer_size)
 
         # Initialize geolocation abscence patience
         self.patience = patience
+        # Maximal wait for a GPS fix after an event to locate it (see Logger)
+        self.geolocation_delay = geolocation_delay
+
+        # Initialize storage limits and a storage for newly created files
+        self.retention_tuple = (
+            video_quota_gb,
+            video_max_age_days,
+            logs_quota_gb,
+            logs_max_age_days,
+            retention_interval,
+        )
+        self.retention_storage = self.ctx.Queue()
+
+        # Initialize local status API parameters and session-wide stage counters
+        self.api_tuple = (api_host, api_port)
+        self.metrics = StageMetrics(self.ctx, ("logger",))
+        self.latency_interval = latency_interval
 
         # Initialize attribute for stream data storage
         self.stream_tuple = (
@@ -86,6 +228,11 @@ class Session:
             detect_conf,
             detect_iou,
             detect_half,
+            gate_enabled,
+            gate_speed_threshold,
+            gate_moving_stride,
+            gate_motion_threshold,
+            gate_fix_patience,
             min_detection_square,
             max_bbox_sides_relation,
             line_height,
@@ -97,11 +244,29 @@ class Session:
             max_tracked_objects,
             fourcc,
             fps,
+            writer_backend,
+            ffmpeg_codec,
+            ffmpeg_preset,
+            ffmpeg_crf,
+            ffmpeg_threads,
+            backlog_interval,
+            overlay_items,
+            record_mode,
+            clip_pre_seconds,
+            clip_post_seconds,
+            clip_jpeg_quality,
             cls_weights,
             cls_threshold,
             cls_half,
             cls_mode,
             cls_shape,
+            inference_backend,
+            mock_script,
+            mock_detect_latency,
+            mock_cls_latency,
+            mock_n_boxes,
+            warmup_iterations,
+            compile_cache,
         )
 
         # Initialize stream managers
@@ -110,10 +275,25 @@ class Session:
                 for camera, stream in enumerate(streams, 1)
         ]
 
+        # Initialize parameters of models, shared by NN processes of all cameras
+        self.model_tuple = (share_models, inference_backend, detect_weights, cls_weights)
+        # Readers are started, when NN stages are warmed up (or on timeout)
+        self.ready_timeout = ready_timeout
+
+        # Plan CPU affinity, threads and priority of worker processes
+        self.resource_tuple = (resource_mode, resource_profile, device, inference_backend)
+        self.resources = ResourcePlanner(self)
+
         # Print debug info
         debug_session_init(self)
         return
 
+    def get_default_device(self, inference_backend: str) -> str:
+        if inference_backend != "ultralytics":
+            return "cpu"
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
     def make_session_id(self) -> str:
         # Make session_id based on bus_id, route_id and current date
         now = datetime.now()
@@ -121,6 +301,16 @@ class Session:
         session_id = f"{date_str}_{self.bus_id}_{self.route_id}"
         return session_id
 
+    def make_trace_dir(self) -> str:
+        # Per-process trace files are merged at the end of the session
+        directory = os.environ.get("logs_dir", "/tmp")
+        return os.path.join(directory, f".trace_{self.session_id}")
+
+    def make_trace_path(self) -> str:
+        filename = f"trace_{self.session_id}.json"
+        directory = os.environ.get("logs_dir", "/tmp")
+        return os.path.join(directory, filename)
+
     def make_event_log_path(self) -> str:
         # Make path for file with logs based on 
         # session_id and "logs_dir" environment variable.
@@ -139,6 +329,44 @@ class Session:
         # Return stored geolocation otherwise
         return (self.latitude.value, self.longitude.value)
 
+    def geolocation_at(self, timestamp: float) -> Tuple[float]:
+        """
+        Get geolocation at given timestamp, interpolated between GPS fixes.
+        Falls back to the latest stored geolocation, if there are no fixes
+        close enough to the timestamp (e.g. in 'poll' GPS mode).
+        """
+        geolocation = self.fixes.interpolate(timestamp, self.patience)
+        if geolocation is None:
+            return self.geolocation
+        return geolocation
+
+    def snapshot(self) -> dict:
+        """Collect current session state (see StatusServer)."""
+        geolocation = self.geolocation
+        if geolocation is not None:
+            geolocation = {"latitude": geolocation[0], "longitude": geolocation[1]}
+        cameras = {
+            str(manager.camera): manager.snapshot() for manager in self.managers
+        }
+        snapshot = {
+            "timestamp": time.time(),
+            "session_id": self.session_id,
+            "bus_id": self.bus_id,
+            "route_id": self.route_id,
+            "count_in": sum(camera["count_in"] for camera in cameras.values()),
+            "count_out": sum(camera["count_out"] for camera in cameras.values()),
+            "geolocation": geolocation,
+            "cameras": cameras,
+            "session": {
+                "stages": self.metrics.snapshot(),
+                "queues": {
+                    "retention_storage": queue_size(self.retention_storage),
+                },
+            },
+        }
+        snapshot["count_total"] = snapshot["count_in"] - snapshot["count_out"]
+        return snapshot
+
     @property
     def count_in(self) -> int:
         return sum([manager.count_in.value for manager in self.managers])
@@ -0,0 +1,106 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+from utils.debug import debug_status_server_init
+from utils.metrics import render_prometheus
+from utils.types import Session
+
+
+class StatusServer:
+    """
+    Local HTTP server in the session supervisor, that returns current counts,
+    geolocation, stage FPS and queue depths as JSON (on '/status')
+    and stage metrics in Prometheus text format (on '/metrics').
+    The snapshot is rebuilt by supervisor loop (see 'update'), so requests
+    are served from memory and never touch workers' shared counters.
+    """
+
+    def __init__(self, session: Session):
+        # Store reference to session as an attribute
+        self.session = session
+
+        # Unpack parameters
+        (host, port) = self.session.api_tuple
+
+        # Initialize snapshot storage and FPS calculation attributes
+        self._body = b"{}"
+        self._metrics = b""
+        self._previous = None
+        self._previous_timestamp = None
+
+        # Start HTTP server in a daemon thread
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        # Print debug info
+        debug_status_server_init(self)
+        return
+
+    def _make_handler(self) -> type:
+        status_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                path = self.path.rstrip("/")
+                if path in ("", "/status"):
+                    body = status_server._body
+                    content_type = "application/json"
+                elif path == "/metrics":
+                    body = status_server._metrics
+                    content_type = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            def log_message(self, *args, **kwargs):
+                # Requests are polled frequently, so don't spam stdout
+                return
+
+        return Handler
+
+    def update(self) -> None:
+        """Rebuild the snapshot. Called periodically by supervisor."""
+        timestamp = time.time()
+        snapshot = self.session.snapshot()
+
+        # Calculate stage FPS from processed counters since the last update
+        pipelines = dict(snapshot["cameras"], session=snapshot["session"])
+        for pipeline, data in pipelines.items():
+            for stage, metrics in data["stages"].items():
+                metrics["fps"] = self._fps(pipeline, stage, metrics["processed"], timestamp)
+        self._previous = {
+            pipeline: {
+                stage: metrics["processed"]
+                for stage, metrics in data["stages"].items()
+            } for pipeline, data in pipelines.items()
+        }
+        self._previous_timestamp = timestamp
+
+        self._body = json.dumps(snapshot).encode("utf-8")
+        self._metrics = render_prometheus(snapshot).encode("utf-8")
+        return
+
+    def _fps(self, pipeline: str, stage: str, processed: int, timestamp: float) -> float:
+        if self._previous is None:
+            return None
+        previous = self._previous.get(pipeline, {}).get(stage)
+        elapsed = timestamp - self._previous_timestamp
+        if previous is None or elapsed <= 0:
+            return None
+        return (processed - previous) / elapsed
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        return
\ No newline at end of file
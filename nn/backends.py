@@ -0,0 +1,321 @@
+import fcntl
+import json
+import os
+import time
+from typing import Tuple
+
+import numpy as np
+
+from utils.debug import debug_model_compiled, debug_fail_compile_model
+
+
+class UltralyticsDetectModel:
+    """
+    YOLO person detector. torch and ultralytics are imported on load only.
+    Already loaded model (see 'load_shared_model') is used, if provided.
+    """
+
+    def __init__(
+        self,
+        weights: str,
+        conf: float,
+        iou: float,
+        device: str,
+        model: object=None,
+        compile_cache: bool=False,
+        imgsz: Tuple[int]=None
+    ):
+        # Compiled model accepts only the input size, it was exported for
+        self.imgsz = None
+        if model is None and compile_cache:
+            model = load_compiled_model(weights, "detect", imgsz, False, device)
+            self.imgsz = None if model is None else imgsz
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(weights, task="detect")
+        self.model = model
+        self.conf = conf
+        self.iou = iou
+        self.device = device
+        return
+
+    def predict(self, frame: np.ndarray) -> np.ndarray:
+        """Get detections in xyxy format."""
+        import torch
+        kwargs = {} if self.imgsz is None else {"imgsz": self.imgsz}
+        with torch.no_grad():
+            results = self.model(
+                frame,
+                conf=self.conf,
+                device=self.device,
+                iou=self.iou,
+                verbose=False,
+                **kwargs,
+            )
+            # Results is a list with 1 element
+            r = results[0]
+        return r.boxes.xyxy.cpu().numpy()
+
+    def warmup(self, frame: np.ndarray, iterations: int) -> None:
+        # Predictor is built and kernels are selected on the first calls
+        for _ in range(iterations):
+            self.predict(frame)
+        return
+
+
+class UltralyticsClsModel:
+    """
+    YOLO door classifier. torch and ultralytics are imported on load only.
+    Already loaded model (see 'load_shared_model') is used, if provided.
+    """
+
+    def __init__(
+        self,
+        weights: str,
+        half: bool,
+        mode: str,
+        model: object=None,
+        compile_cache: bool=False,
+        imgsz: Tuple[int]=None,
+        device: str=None
+    ):
+        if model is None and compile_cache:
+            model = load_compiled_model(weights, "classify", imgsz, half, device)
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(weights, task="classify")
+        self.model = model
+        self.half = half
+        self.mode = mode
+        return
+
+    def predict(self, frame: np.ndarray) -> float:
+        """Get probability of the door being closed."""
+        import torch
+        # Get frame shape (h, w)
+        imgsz = frame.shape[:2]
+        # Convert to torch.tensor if necessary
+        if self.mode == "torch":
+            frame = (
+                torch.from_numpy(frame)
+                .permute((2, 0, 1))
+                .unsqueeze(0)
+                .cuda()
+                .type(torch.float16)/255
+            )
+        # Run classification on image
+        res = self.model(
+            frame,
+            verbose=False,
+            half=self.half,
+            imgsz=imgsz
+        )
+        r = res[0]
+        return float(r.probs.data[0])
+
+    def warmup(self, frame: np.ndarray, iterations: int) -> None:
+        # Predictor is built and kernels are selected on the first calls
+        for _ in range(iterations):
+            self.predict(frame)
+        return
+
+
+class MockDetectModel:
+    """
+    Fake detector for performance tests of the pipeline itself.
+    Returns scripted boxes (cycled by the number of calls) or boxes
+    of 'n_boxes' synthetic passengers, walking up and down through
+    the frame, after sleeping for 'latency' seconds like a GPU would.
+    """
+
+    def __init__(self, script: str=None, latency: float=0.0, n_boxes: int=5, seed: int=0):
+        self.latency = latency
+        self.n_boxes = n_boxes
+        self.boxes = _load_script(script).get("boxes")
+        self.rng = np.random.default_rng(seed)
+        self.n_calls = 0
+        self.state = None
+        return
+
+    def predict(self, frame: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        if self.boxes is not None:
+            boxes = np.array(self.boxes[self.n_calls % len(self.boxes)], dtype=np.float32)
+            boxes = boxes.reshape(-1, 4)
+        else:
+            boxes = self._walk(frame.shape[:2])
+        self.n_calls += 1
+        _sleep_until(started + self.latency)
+        return boxes
+
+    def warmup(self, frame: np.ndarray, iterations: int) -> None:
+        # Nothing to warm up, and scripted outputs shouldn't be shifted
+        return
+
+    def _walk(self, shape: Tuple[int]) -> np.ndarray:
+        height, width = shape
+        if self.state is None:
+            box_w = self.rng.uniform(0.08, 0.15, self.n_boxes) * width
+            box_h = self.rng.uniform(0.2, 0.35, self.n_boxes) * height
+            x = self.rng.uniform(0, width - box_w)
+            y = self.rng.uniform(0, height - box_h)
+            velocity = self.rng.uniform(-0.01, 0.01, self.n_boxes) * height
+            self.state = [box_w, box_h, x, y, velocity]
+        box_w, box_h, x, y, velocity = self.state
+        y = y + velocity + self.rng.normal(0, 1, self.n_boxes)
+        # Turn back at the frame borders
+        velocity = np.where((y < 0) | (y + box_h > height), -velocity, velocity)
+        y = np.clip(y, 0, height - box_h)
+        self.state = [box_w, box_h, x, y, velocity]
+        return np.stack([x, y, x + box_w, y + box_h], axis=1).astype(np.float32)
+
+
+class MockClsModel:
+    """
+    Fake door classifier for performance tests of the pipeline itself.
+    Returns scripted probabilities of the door being closed (cycled
+    by the number of calls) or a synthetic schedule: closed for
+    'closed_calls' calls, then open for 'open_calls' calls.
+    """
+
+    def __init__(
+        self,
+        script: str=None,
+        latency: float=0.0,
+        closed_calls: int=600,
+        open_calls: int=300
+    ):
+        self.latency = latency
+        self.door = _load_script(script).get("door")
+        self.closed_calls = closed_calls
+        self.open_calls = open_calls
+        self.n_calls = 0
+        return
+
+    def predict(self, frame: np.ndarray) -> float:
+        started = time.perf_counter()
+        if self.door is not None:
+            closed_prob = float(self.door[self.n_calls % len(self.door)])
+        elif self.n_calls % (self.closed_calls + self.open_calls) < self.closed_calls:
+            closed_prob = 0.95
+        else:
+            closed_prob = 0.05
+        self.n_calls += 1
+        _sleep_until(started + self.latency)
+        return closed_prob
+
+    def warmup(self, frame: np.ndarray, iterations: int) -> None:
+        # Nothing to warm up, and scripted outputs shouldn't be shifted
+        return
+
+
+def _load_script(script: str) -> dict:
+    """
+    Script is a JSON file with per-call outputs of mock models:
+        {"boxes": [[[x1, y1, x2, y2], ...], ...], "door": [0.9, 0.1, ...]}
+    Both keys are optional, synthetic outputs are used for missing ones.
+    """
+    if script is None:
+        return {}
+    with open(script, "r", encoding="utf-8") as script_file:
+        return json.load(script_file)
+
+
+def _sleep_until(deadline: float) -> None:
+    delay = deadline - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+    return
+
+
+def load_detect_model(
+    backend: str,
+    weights: str,
+    conf: float,
+    iou: float,
+    device: str,
+    script: str=None,
+    latency: float=0.0,
+    n_boxes: int=5,
+    seed: int=0,
+    model: object=None,
+    compile_cache: bool=False,
+    imgsz: Tuple[int]=None
+):
+    if backend == "mock":
+        return MockDetectModel(script, latency, n_boxes, seed)
+    return UltralyticsDetectModel(weights, conf, iou, device, model, compile_cache, imgsz)
+
+
+def load_cls_model(
+    backend: str,
+    weights: str,
+    half: bool,
+    mode: str,
+    script: str=None,
+    latency: float=0.0,
+    model: object=None,
+    compile_cache: bool=False,
+    imgsz: Tuple[int]=None,
+    device: str=None
+):
+    if backend == "mock":
+        return MockClsModel(script, latency)
+    return UltralyticsClsModel(weights, half, mode, model, compile_cache, imgsz, device)
+
+
+def load_compiled_model(
+    weights: str,
+    task: str,
+    imgsz: Tuple[int],
+    half: bool,
+    device: str
+) -> object:
+    """
+    Load YOLO, exported to TorchScript for input size 'imgsz' (h, w),
+    from a cache next to the weights. Missing cache is exported first.
+    NN processes of all cameras start at once, so export is guarded
+    by a lock file: one process exports, the others wait and load it.
+    Returns None, if the model can't be exported or loaded.
+    """
+    from ultralytics import YOLO
+    root, _ = os.path.splitext(weights)
+    height, width = imgsz
+    cache_path = f"{root}_{width}x{height}{'_half' if half else ''}.torchscript"
+    try:
+        with open(f"{cache_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(cache_path):
+                exported = YOLO(weights, task=task).export(
+                    format="torchscript",
+                    imgsz=[height, width],
+                    half=half,
+                    device=device,
+                )
+                # Exported file is named after the weights, so rename it under the lock
+                os.replace(exported, cache_path)
+                debug_model_compiled(cache_path)
+        return YOLO(cache_path, task=task)
+    except Exception as e:
+        debug_fail_compile_model(weights, e)
+        return None
+
+
+def load_shared_model(backend: str, weights: str, task: str) -> object:
+    """
+    Load YOLO once (in supervisor) to pass it to NN processes of all cameras.
+    The model is fused in advance and its tensors are moved into shared memory,
+    so spawned processes attach to the same pages instead of reading
+    and keeping their own copies of the weights. Mock models are not shared.
+    """
+    if backend != "ultralytics":
+        return None
+    from ultralytics import YOLO
+    # Registers reductions, that pickle tensors as handles to shared memory
+    import torch.multiprocessing  # noqa: F401
+    model = YOLO(weights, task=task)
+    # Inference processes would fuse their own copies otherwise
+    model.fuse()
+    model.model.eval()
+    model.model.share_memory()
+    return model
@@ -1,22 +1,23 @@
 import time
 
-from ultralytics import YOLO
 import cv2
 import numpy as np
-import torch
 
 from loggers import Log, create_log
 from utils.debug import (
     debug_classifier_init,
     debug_classify_frame,
     debug_fail_classify_frame,
+    debug_model_warmup,
 )
+from nn.backends import load_cls_model
+from utils.metrics import LatencyRecorder
 from utils.types import StreamManager
 
 
 class Classifier:
 
-    def __init__(self, manager: StreamManager):
+    def __init__(self, manager: StreamManager, model: object=None):
         # Store a reference to StreamManager as an attribute
         self.manager = manager
 
@@ -28,19 +29,50 @@ class Classifier:
             cls_mode,
             cls_shape,
             device,
+            inference_backend,
+            mock_script,
+            mock_latency,
+            warmup_iterations,
+            compile_cache,
         ) = self.manager.classifier_tuple
 
         # Set required attributes for door classifier
         self.type = "classifier"
         self.device = device
-        self.cls_model = YOLO(cls_weights, task="classify")
+        self.inference_backend = inference_backend
+        self.cls_model = load_cls_model(
+            inference_backend,
+            cls_weights,
+            cls_half,
+            cls_mode,
+            mock_script,
+            mock_latency,
+            model=model,
+            compile_cache=compile_cache,
+            imgsz=cls_shape[::-1],
+            device=device,
+        )
         self.cls_threshold = cls_threshold
         self.cls_half = cls_half
         self.cls_mode = cls_mode
         self.cls_shape = cls_shape
+        self.latency = LatencyRecorder(self.manager, "classifier")
 
         # Print debug info
         debug_classifier_init(self)
+
+        # Run NN on synthetic frames, so the first real frames are not slow
+        self.warmup(cls_shape, warmup_iterations)
+        return
+
+    def warmup(self, shape: tuple, iterations: int) -> None:
+        """Warm up the model on blank frames of 'shape' (w, h) and report readiness."""
+        started = time.perf_counter()
+        width, height = shape
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.cls_model.warmup(frame, iterations)
+        self.manager.classifier_ready.value = 1
+        debug_model_warmup(self, time.perf_counter() - started)
         return
 
     def classify(self) -> None:
@@ -50,14 +82,18 @@ class Classifier:
             return
 
         # Get preprocessed frame to perform detection on
-        frame = self.manager.preprocess_door_storage.get()
-        door = self.get_door_state(frame)
+        packet = self.manager.preprocess_door_storage.get()
+        started = time.perf_counter()
+        door = self.get_door_state(packet.data)
 
         # Put data into a shared storage (or report about issue)
         try:
-            self.manager.door_storage.put(door)
+            self.manager.door_storage.put(packet.forward(door))
+            self.manager.metrics.observe("classifier", time.perf_counter() - started)
+            self.latency.record(packet)
             debug_classify_frame(self, door)
         except Exception as e:
+            self.manager.metrics.drop("classifier")
             debug_fail_classify_frame(self, door, e)
             log = create_log(self.manager, "classifier_put_error", e)
             try:
@@ -67,32 +103,17 @@ class Classifier:
         return
 
     def get_door_state(self, frame: np.ndarray) -> int:
-        # Get frame shape (h, w)
-        imgsz = frame.shape[:2]
-        # Convert to torch.tensor if necessary
-        if self.cls_mode == "torch":
-            frame = (
-                torch.from_numpy(frame)
-                .permute((2, 0, 1))
-                .unsqueeze(0)
-                .cuda()
-                .type(torch.float16)/255
-            )
-        # Run classification on image
-        res = self.cls_model(
-            frame,
-            verbose=False,
-            half=self.cls_half,
-            imgsz=imgsz
-        )
-        r = res[0]
-        closed_prob = r.probs.data[0]
+        closed_prob = self.get_door_probability(frame)
         if closed_prob > self.cls_threshold:
             door = 0 # Closed
         else:
             door = 1 # Open
         return door
 
+    def get_door_probability(self, frame: np.ndarray) -> float:
+        """Get probability of the door being closed."""
+        return self.cls_model.predict(frame)
+
     def process(self, *args, **kwargs) -> None:
         return self.classify(*args, **kwargs)
 
@@ -1,22 +1,23 @@
 import time
 
-from ultralytics import YOLO
 import cv2
 import numpy as np
-import torch
 
 from loggers import Log, create_log
 from utils.debug import (
     debug_detector_init,
     debug_detect_frame,
     debug_fail_detect_frame,
+    debug_model_warmup,
 )
+from nn.backends import load_detect_model
+from utils.metrics import LatencyRecorder
 from utils.types import StreamManager
 
 
 class Detector:
 
-    def __init__(self, manager: StreamManager):
+    def __init__(self, manager: StreamManager, model: object=None):
         # Store a reference to StreamManager as an attribute
         self.manager = manager
 
@@ -29,20 +30,55 @@ class Detector:
             device,
             min_detection_square,
             max_bbox_sides_relation,
+            inference_backend,
+            mock_script,
+            mock_latency,
+            mock_n_boxes,
+            warmup_iterations,
+            compile_cache,
         ) = self.manager.detector_tuple
+        (detect_shape, _, _) = self.manager.preprocessor_tuple
 
         # Set required attributes for person detector
         self.type = "detector"
-        self.detect_model = YOLO(detect_weights, task="detect")
+        self.inference_backend = inference_backend
+        self.detect_model = load_detect_model(
+            inference_backend,
+            detect_weights,
+            detect_conf,
+            detect_iou,
+            device,
+            mock_script,
+            mock_latency,
+            mock_n_boxes,
+            seed=self.manager.camera,
+            model=model,
+            compile_cache=compile_cache,
+            imgsz=detect_shape[::-1],
+        )
         self.detect_conf = detect_conf
         self.detect_iou = detect_iou
         self.detect_half = detect_half
         self.device = device
         self.min_square = min_detection_square
         self.max_sides_relation = max_bbox_sides_relation
+        self.latency = LatencyRecorder(self.manager, "detector")
 
         # Print debug info
         debug_detector_init(self)
+
+        # Run NN on synthetic frames, so the first real frames are not slow
+        self.warmup(detect_shape, warmup_iterations)
+        return
+
+    def warmup(self, shape: tuple, iterations: int) -> None:
+        """Warm up the model on blank frames of 'shape' (w, h) and report readiness."""
+        started = time.perf_counter()
+        width, height = shape
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.detect_model.warmup(frame, iterations)
+        self.manager.detector_ready.value = 1
+        debug_model_warmup(self, time.perf_counter() - started)
         return
 
     def detect(self) -> None:
@@ -52,14 +88,18 @@ class Detector:
             return
 
         # Get preprocessed frame to perform detection on
-        frame = self.manager.preprocess_storage.get()
-        detections = self.get_detections(frame)
+        packet = self.manager.preprocess_storage.get()
+        started = time.perf_counter()
+        detections = self.get_detections(packet.data)
 
         # Put data into a shared storage (or report about issue)
         try:
-            self.manager.detect_storage.put(detections)
+            self.manager.detect_storage.put(packet.forward(detections))
+            self.manager.metrics.observe("detector", time.perf_counter() - started)
+            self.latency.record(packet)
             debug_detect_frame(self, detections)
         except Exception as e:
+            self.manager.metrics.drop("detector")
             debug_fail_detect_frame(self, detections, e)
             log = create_log(self.manager, "detector_put_error", e)
             try:
@@ -70,21 +110,10 @@ class Detector:
 
     def get_detections(self, frame: np.ndarray) -> np.ndarray:
         # Perform detection
-        with torch.no_grad():
-            results = self.detect_model(
-                frame,
-                conf=self.detect_conf,
-                device=self.device,
-                iou=self.detect_iou,
-                verbose=False,
-            )
-            # Results is a list with 1 element
-            r = results[0]
+        xyxy = self.detect_model.predict(frame)
 
         # Initialize storage for detections
         detections = np.empty((0, 4))
-        # Convert to numpy array of floats
-        xyxy = r.boxes.xyxy.cpu().numpy()
         w = xyxy[:, 2] - xyxy[:, 0]
         h = xyxy[:, 3] - xyxy[:, 1]
         # Keep only big enough detections with 'square-like' forms
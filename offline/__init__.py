@@ -0,0 +1 @@
+from .runner import ReplayRunner, parse_video_name
\ No newline at end of file
@@ -0,0 +1,198 @@
+"""
+Batch re-processing of archived videos, e.g. after a model update.
+
+Videos are spread across a pool of worker processes, each of which loads
+its own Detector and Classifier once. Every video gets an event log in the
+regular format with timestamps, restored from the video filename.
+Finished videos are recorded in a done-file, so an interrupted run resumes
+from where it stopped.
+
+Usage:
+    IEC_CONFIG=config/main.json python -m offline.batch /archive --out-dir recount --workers 8
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import json
+import multiprocessing as mp
+import os
+import time
+from typing import List
+
+import cv2
+
+from offline.replay import load_session
+from offline.runner import ReplayRunner, VIDEO_NAME_PATTERN, parse_video_name
+
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv")
+DONE_FILENAME = ".done"
+
+# ReplayRunner of the worker process (see '_init_worker')
+_runner: ReplayRunner = None
+
+
+def find_videos(source: str) -> List[str]:
+    """
+    Get videos from a directory (recursively, by writer's filename pattern)
+    or from a manifest: JSON list or a text file with a path per line.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, filenames in os.walk(source):
+            for filename in filenames:
+                if (
+                    filename.endswith(VIDEO_EXTENSIONS)
+                    and VIDEO_NAME_PATTERN.search(filename) is not None
+                ):
+                    paths.append(os.path.join(root, filename))
+    elif source.endswith(".json"):
+        with open(source, "r", encoding="utf-8") as manifest_file:
+            paths = json.load(manifest_file)
+    else:
+        with open(source, "r", encoding="utf-8") as manifest_file:
+            paths = [line.strip() for line in manifest_file if line.strip()]
+    # Process the oldest videos first
+    return sorted(paths, key=_sort_key)
+
+
+def _sort_key(path: str) -> tuple:
+    start, camera = parse_video_name(path)
+    return (start or datetime.min, camera or 0, path)
+
+
+def get_log_path(out_dir: str, video_path: str) -> str:
+    name, _ = os.path.splitext(os.path.basename(video_path))
+    return os.path.join(out_dir, f"log_{name}.json")
+
+
+def read_done(out_dir: str) -> set:
+    try:
+        with open(os.path.join(out_dir, DONE_FILENAME), "r", encoding="utf-8") as done_file:
+            return set(line.rstrip("\n") for line in done_file)
+    except OSError:
+        return set()
+
+
+def mark_done(out_dir: str, video_path: str) -> None:
+    with open(os.path.join(out_dir, DONE_FILENAME), "a", encoding="utf-8") as done_file:
+        done_file.write(f"{video_path}\n")
+        done_file.flush()
+        os.fsync(done_file.fileno())
+    return
+
+
+def _init_worker(config_path: str, devices: List[str], counter, threads: int) -> None:
+    global _runner
+    # Avoid oversubscription: every worker gets its share of cores
+    cv2.setNumThreads(threads)
+    overrides = {}
+    if devices:
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        overrides["device"] = devices[index % len(devices)]
+    session = load_session(config_path, ["batch"], **overrides)
+    # torch is imported by the real NN backend only
+    (_, _, _, inference_backend) = session.resource_tuple
+    if inference_backend == "ultralytics":
+        import torch
+        torch.set_num_threads(threads)
+    # Nobody consumes retention registrations of event logs here,
+    # so don't block the worker exit on flushing them
+    session.retention_storage.cancel_join_thread()
+    _runner = ReplayRunner(session)
+    return
+
+
+def process_video(video_path: str, out_dir: str) -> dict:
+    """Count passengers in a video and write its event log."""
+    log_path = get_log_path(out_dir, video_path)
+    # Log is written under a temporary name, so a partial log never looks finished
+    part_path = f"{log_path}.part"
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    _, camera = parse_video_name(video_path)
+    if camera is not None:
+        _runner.manager.camera = camera
+    _runner.reset(part_path)
+    started = time.perf_counter()
+    report = _runner.replay([video_path])
+    if os.path.exists(part_path):
+        os.replace(part_path, log_path)
+    return {
+        "path": video_path,
+        "log": log_path if report["events"] else None,
+        "frames": report["frames"],
+        "count_in": report["count_in"],
+        "count_out": report["count_out"],
+        "elapsed": time.perf_counter() - started,
+    }
+
+
+def run_batch(
+    config_path: str,
+    paths: List[str],
+    out_dir: str,
+    workers: int,
+    devices: List[str]=None,
+    threads: int=None
+) -> List[dict]:
+    os.makedirs(out_dir, exist_ok=True)
+    done = read_done(out_dir)
+    paths = [path for path in paths if path not in done]
+    print(f"{len(done)} videos are already processed, {len(paths)} are left.")
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+    ctx = mp.get_context("spawn")
+    counter = ctx.Value("i", 0)
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(config_path, devices or [], counter, threads),
+    ) as executor:
+        futures = {
+            executor.submit(process_video, path, out_dir): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Failed to process {path}: {e}")
+                continue
+            with open(os.path.join(out_dir, "summary.jsonl"), "a", encoding="utf-8") as summary_file:
+                summary_file.write(json.dumps(result) + "\n")
+            mark_done(out_dir, path)
+            results.append(result)
+            print(
+                f"[{len(results)}/{len(paths)}] {path}: in={result['count_in']}, "
+                f"out={result['count_out']}, {result['frames'] / result['elapsed']:.1f} FPS."
+            )
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("source", help="directory with videos or manifest (JSON list or text file)")
+    parser.add_argument("--config", default=os.environ.get("IEC_CONFIG"), help="path to config")
+    parser.add_argument("--out-dir", default="batch_logs", help="directory to save event logs")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--devices", default=None, help="comma-separated devices for workers, e.g. cuda:0,cuda:1")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per worker")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    devices = args.devices.split(",") if args.devices else None
+    paths = [os.path.abspath(path) for path in find_videos(args.source)]
+    results = run_batch(args.config, paths, args.out_dir, args.workers, devices, args.threads)
+    print(
+        f"Processed {len(results)} videos: "
+        f"in={sum(r['count_in'] for r in results)}, out={sum(r['count_out'] for r in results)}."
+    )
@@ -0,0 +1,293 @@
+"""
+Detection cache: per-frame detections and door probabilities of a video,
+stored in a columnar memory-mappable format. Counting logic can be replayed
+and tuned on it without any NN compute.
+
+Usage:
+    IEC_CONFIG=config/main.json python -m offline.cache build --cache-dir cache video_*.mp4
+    IEC_CONFIG=config/main.json python -m offline.cache replay cache/video_2024-05-01_hour8_cam1
+"""
+import argparse
+from datetime import datetime
+import json
+import os
+import time
+from typing import List
+
+import cv2
+import numpy as np
+
+from offline.replay import load_session, print_report
+from offline.runner import ReplayRunner, parse_video_name
+from frame_processing.gating import MotionGate
+from utils.debug import debug_cache_saved
+from utils.types import Session, StreamManager
+
+
+class DetectionCache:
+    """
+    Cache of a single video. It's a directory with:
+        meta.json   - video path, fps, start, number of frames and settings,
+                      which the cached values depend on (see 'get_cache_settings');
+        offsets.npy - int64 (frames + 1,): boxes of frame i are boxes[offsets[i]:offsets[i + 1]];
+        boxes.npy   - float32 (n_boxes, 4): detections in xyxy format;
+        door.npy    - float32 (frames,): probability of the door being closed;
+        motion.npy  - float32 (frames,): ego-motion, estimated by the motion gate.
+    Every frame is run through NN stages, so gating can be applied on replay.
+    Arrays are memory-mapped, so opening even hours of video is instant.
+    """
+
+    version = 2
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as meta_file:
+            self.meta = json.load(meta_file)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.boxes = np.load(os.path.join(path, "boxes.npy"), mmap_mode="r")
+        self.door = np.load(os.path.join(path, "door.npy"), mmap_mode="r")
+        self.motion = np.load(os.path.join(path, "motion.npy"), mmap_mode="r")
+        return
+
+    def __len__(self) -> int:
+        return len(self.door)
+
+    def get_boxes(self, frame: int) -> np.ndarray:
+        return self.boxes[self.offsets[frame]:self.offsets[frame + 1]]
+
+    def get_door_probability(self, frame: int) -> float:
+        return float(self.door[frame])
+
+    def get_motion(self, frame: int) -> float:
+        return float(self.motion[frame])
+
+    @property
+    def fps(self) -> float:
+        return self.meta["fps"]
+
+    @property
+    def start(self) -> datetime:
+        start = self.meta.get("start")
+        return None if start is None else datetime.fromisoformat(start)
+
+
+class DetectionCacheWriter:
+    """Accumulates per-frame results of a video and saves them as DetectionCache."""
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = dict(meta, version=DetectionCache.version)
+        self.boxes: List[np.ndarray] = []
+        self.door: List[float] = []
+        self.motion: List[float] = []
+        return
+
+    def append(self, boxes: np.ndarray, door_probability: float, motion: float) -> None:
+        self.boxes.append(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))
+        self.door.append(door_probability)
+        self.motion.append(motion)
+        return
+
+    def save(self) -> DetectionCache:
+        os.makedirs(self.path, exist_ok=True)
+        counts = [len(boxes) for boxes in self.boxes]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        boxes = (
+            np.concatenate(self.boxes)
+            if self.boxes else np.empty((0, 4), dtype=np.float32)
+        )
+        np.save(os.path.join(self.path, "offsets.npy"), offsets)
+        np.save(os.path.join(self.path, "boxes.npy"), boxes)
+        np.save(os.path.join(self.path, "door.npy"), np.asarray(self.door, dtype=np.float32))
+        np.save(os.path.join(self.path, "motion.npy"), np.asarray(self.motion, dtype=np.float32))
+        # Meta is written last, so an interrupted build is not mistaken for a cache
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as meta_file:
+            json.dump(dict(self.meta, frames=len(self.door)), meta_file, indent=4)
+        return DetectionCache(self.path)
+
+
+def get_cache_path(cache_dir: str, video_path: str) -> str:
+    """Caches are keyed by video filename."""
+    name, _ = os.path.splitext(os.path.basename(video_path))
+    return os.path.join(cache_dir, name)
+
+
+def get_cache_settings(manager: StreamManager) -> dict:
+    """
+    Get settings, which cached values depend on: preprocessing, NN models
+    and ego-motion estimation. Settings, applied on replay (e.g. 'cls_threshold'
+    or gate thresholds), and ones, that don't change results, are not included.
+    """
+    (
+        detect_weights,
+        detect_conf,
+        detect_iou,
+        detect_half,
+        device,
+        min_detection_square,
+        max_bbox_sides_relation,
+        inference_backend,
+        mock_script,
+        _,
+        mock_n_boxes,
+        _,
+        compile_cache,
+    ) = manager.detector_tuple
+    (cls_weights, _, cls_half, cls_mode, *_) = manager.classifier_tuple
+    (detect_shape, cls_shape, _) = manager.preprocessor_tuple
+    gate = MotionGate(manager)
+    settings = {
+        "detector": [
+            detect_weights,
+            detect_conf,
+            detect_iou,
+            detect_half,
+            min_detection_square,
+            max_bbox_sides_relation,
+            mock_n_boxes,
+        ],
+        "classifier": [cls_weights, cls_half, cls_mode],
+        "shapes": [detect_shape, cls_shape],
+        "backend": [inference_backend, device, mock_script, compile_cache],
+        "motion": [gate.thumbnail_shape, gate.grid, gate.alpha],
+    }
+    # Settings are compared with the ones, loaded from meta.json
+    return json.loads(json.dumps(settings))
+
+
+def is_cache_valid(path: str, manager: StreamManager) -> bool:
+    """Check, whether a complete cache of the current version and settings exists."""
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return False
+    return (
+        meta.get("version") == DetectionCache.version
+        and meta.get("settings") == get_cache_settings(manager)
+    )
+
+
+def build_cache(runner: ReplayRunner, video_path: str, cache_dir: str) -> DetectionCache:
+    """
+    Run Preprocessor, Detector and Classifier over every frame of a video
+    and cache results. Motion gate only estimates ego-motion here.
+    """
+    cap = cv2.VideoCapture(video_path)
+    start, _ = parse_video_name(video_path)
+    manager = runner.manager
+    writer = DetectionCacheWriter(
+        get_cache_path(cache_dir, video_path),
+        {
+            "video": os.path.abspath(video_path),
+            "fps": cap.get(cv2.CAP_PROP_FPS) or runner.default_fps,
+            "start": None if start is None else start.isoformat(),
+            "settings": get_cache_settings(manager),
+        }
+    )
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            motion = runner.preprocessor.gate.estimate_motion(frame)
+            detect_frame = runner.preprocessor.get_detect_frame(frame)
+            cls_frame = runner.preprocessor.get_cls_frame(frame)
+            writer.append(
+                runner.detector.get_detections(detect_frame),
+                runner.classifier.get_door_probability(cls_frame),
+                motion,
+            )
+    finally:
+        cap.release()
+    cache = writer.save()
+    debug_cache_saved(cache)
+    return cache
+
+
+class CachedReplayRunner(ReplayRunner):
+    """
+    Feeds cached detections and door probabilities straight into Tracker.
+    Door state is derived from probability with current 'cls_threshold',
+    so it can be tuned together with counting parameters. If 'gate' is set,
+    frames are gated by cached ego-motion with current gate parameters.
+    """
+
+    stages = ("tracker",)
+
+    def __init__(
+        self,
+        session: Session,
+        manager: StreamManager=None,
+        log_path: str=None,
+        gate: bool=False
+    ):
+        super().__init__(session, manager, log_path, load_models=False, gate=gate)
+        (_, cls_threshold, *_) = self.manager.classifier_tuple
+        self.cls_threshold = cls_threshold
+        self.motion_gate = MotionGate(self.manager) if gate else None
+        return
+
+    def replay_video(self, path: str, start: datetime=None) -> dict:
+        if not is_cache_valid(path, self.manager):
+            raise ValueError(f"Cache {path} is missing or was built with other settings. Rebuild it.")
+        cache = DetectionCache(path)
+        if start is None:
+            start = cache.start
+        count_in = self.manager.count_in.value
+        count_out = self.manager.count_out.value
+        metrics = self.manager.metrics
+
+        for frame in range(len(cache)):
+            if self.gate:
+                moving = cache.get_motion(frame) > self.motion_gate.motion_threshold
+                if not self.motion_gate.decide(moving):
+                    continue
+            closed_prob = cache.get_door_probability(frame)
+            door = 0 if closed_prob > self.cls_threshold else 1
+            begin = time.perf_counter()
+            self.tracker.update(cache.get_boxes(frame), door)
+            metrics.observe("tracker", time.perf_counter() - begin)
+            self.drain_logs(path, frame, frame / cache.fps, start)
+
+        video = {
+            "path": path,
+            "video": cache.meta["video"],
+            "start": None if start is None else start.isoformat(),
+            "frames": len(cache),
+            "fps": cache.fps,
+            "duration": len(cache) / cache.fps,
+            "count_in": self.manager.count_in.value - count_in,
+            "count_out": self.manager.count_out.value - count_out,
+        }
+        self.videos.append(video)
+        return video
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("command", choices=("build", "replay"))
+    parser.add_argument("paths", nargs="+", help="videos to build caches for or caches to replay")
+    parser.add_argument("--config", default=os.environ.get("IEC_CONFIG"), help="path to config")
+    parser.add_argument("--cache-dir", default="cache", help="directory to save caches")
+    parser.add_argument("--report", default=None, help="path to save JSON report of replay")
+    parser.add_argument("--log", default=None, help="path to save event log of replay")
+    parser.add_argument("--gate", action="store_true", help="skip frames by cached ego-motion on replay")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    session = load_session(args.config, args.paths)
+    if args.command == "build":
+        runner = ReplayRunner(session)
+        for path in args.paths:
+            build_cache(runner, path, args.cache_dir)
+    else:
+        runner = CachedReplayRunner(session, log_path=args.log, gate=args.gate)
+        report = runner.replay(args.paths)
+        print_report(report)
+        if args.report is not None:
+            with open(args.report, "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=4)
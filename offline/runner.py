@@ -0,0 +1,217 @@
+from datetime import datetime, timedelta
+import os
+import queue
+import re
+import time
+from typing import Iterable, List
+
+import cv2
+import numpy as np
+
+# Must be imported before other packages, which import 'utils' themselves
+from utils.debug import debug_replay_finish, debug_replay_start
+from frame_processing import Preprocessor
+from loggers import Logger
+from nn import Classifier, Detector
+from tracker import Tracker
+from utils.types import Session, StreamManager
+
+
+# Filenames of recorded videos: video_{date}_hour{H}_cam{N}[_{M}-{S}]
+VIDEO_NAME_PATTERN = re.compile(
+    r"video_(\d{4}-\d{2}-\d{2})_hour(\d{1,2})_cam(\d+)(?:_(\d{2})-(\d{2}))?"
+)
+
+
+def parse_video_name(path: str) -> tuple:
+    """
+    Get start datetime and camera from a recorded video filename.
+    Returns (None, None), if the filename doesn't follow writer's pattern.
+    """
+    match = VIDEO_NAME_PATTERN.search(os.path.basename(path))
+    if match is None:
+        return None, None
+    date, hour, camera, minute, second = match.groups()
+    start = datetime.strptime(date, "%Y-%m-%d") + timedelta(
+        hours=int(hour),
+        minutes=int(minute or 0),
+        seconds=int(second or 0),
+    )
+    return start, int(camera)
+
+
+class ReplayRunner:
+    """
+    Runs Preprocessor -> Detector/Classifier -> Tracker chain on recorded
+    videos in a single process. Stages are called one after another for
+    every frame, so no frames are dropped, the order is the same on every
+    run and the replay is as fast as the hardware allows.
+    Videos are treated as consecutive recordings of the same camera.
+    Motion gate is bypassed, unless 'gate' is set: there are no live GPS
+    fixes in replay, and counts shouldn't depend on gating by default.
+    """
+
+    # Stages, which are timed by replay
+    stages = ("reader", "preprocessor", "detector", "classifier", "tracker")
+
+    def __init__(
+        self,
+        session: Session,
+        manager: StreamManager=None,
+        log_path: str=None,
+        load_models: bool=True,
+        gate: bool=False
+    ):
+        # Store references to session and manager as attributes
+        self.session = session
+        self.manager = manager if manager is not None else self.session.managers[0]
+
+        # Logs are drained by the runner after every frame,
+        # so a local queue keeps them in order with frames
+        self.manager.logs_storage = queue.Queue()
+
+        # Initialize pipeline stages (NN stages are not needed for cached detections)
+        self.preprocessor = None
+        self.detector = None
+        self.classifier = None
+        if load_models:
+            self.preprocessor = Preprocessor(self.manager)
+            self.detector = Detector(self.manager)
+            self.classifier = Classifier(self.manager)
+
+        # Initialize replay state
+        self.gate = gate
+        (_, fps, _, _) = self.manager.writer_tuple
+        self.default_fps = fps
+        self.reset(log_path)
+        return
+
+    def reset(self, log_path: str=None) -> None:
+        """
+        Start counting from scratch, e.g. for an unrelated video.
+        Event log is written only if 'log_path' is provided.
+        """
+        self.tracker = Tracker(self.manager)
+        self.manager.count_in.value = 0
+        self.manager.count_out.value = 0
+        self.events: List[dict] = []
+        self.videos: List[dict] = []
+        self.logger = None
+        if log_path is not None:
+            self.session.event_log_path = log_path
+            self.logger = Logger(self.session)
+        return
+
+    def replay(self, paths: Iterable[str]) -> dict:
+        started = time.perf_counter()
+        for path in paths:
+            self.replay_video(path)
+        return self.report(time.perf_counter() - started)
+
+    def replay_video(self, path: str, start: datetime=None) -> dict:
+        if start is None:
+            start, _ = parse_video_name(path)
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or self.default_fps
+        count_in = self.manager.count_in.value
+        count_out = self.manager.count_out.value
+        debug_replay_start(self, path)
+
+        n_frames = 0
+        try:
+            while True:
+                begin = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                self.manager.metrics.observe("reader", time.perf_counter() - begin)
+                self.process_frame(frame)
+                self.drain_logs(path, n_frames, n_frames / fps, start)
+                n_frames += 1
+        finally:
+            cap.release()
+
+        video = {
+            "path": path,
+            "start": None if start is None else start.isoformat(),
+            "frames": n_frames,
+            "fps": fps,
+            "duration": n_frames / fps,
+            "count_in": self.manager.count_in.value - count_in,
+            "count_out": self.manager.count_out.value - count_out,
+        }
+        self.videos.append(video)
+        debug_replay_finish(self, video)
+        return video
+
+    def process_frame(self, frame: np.ndarray) -> None:
+        metrics = self.manager.metrics
+
+        # Preprocess the frame, skipping NN stages like the live pipeline does (if gated)
+        begin = time.perf_counter()
+        if self.gate and not self.preprocessor.gate.update(frame):
+            metrics.observe("preprocessor", time.perf_counter() - begin)
+            return
+        detect_frame = self.preprocessor.get_detect_frame(frame)
+        cls_frame = self.preprocessor.get_cls_frame(frame)
+        metrics.observe("preprocessor", time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        boxes = self.detector.get_detections(detect_frame)
+        metrics.observe("detector", time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        door = self.classifier.get_door_state(cls_frame)
+        metrics.observe("classifier", time.perf_counter() - begin)
+
+        begin = time.perf_counter()
+        self.tracker.update(boxes, door)
+        metrics.observe("tracker", time.perf_counter() - begin)
+        return
+
+    def drain_logs(
+        self,
+        path: str,
+        frame: int,
+        video_time: float,
+        start: datetime=None
+    ) -> None:
+        """Collect events of the frame and attach video time to them."""
+        while not self.manager.logs_storage.empty():
+            log = self.manager.logs_storage.get()
+            if start is not None:
+                log.timestamp = start + timedelta(seconds=video_time)
+            self.events.append({
+                "path": path,
+                "frame": frame,
+                "video_time": video_time,
+                "event": log.event,
+            })
+            if self.logger is not None:
+                self.logger.write_log(log)
+        return
+
+    def report(self, elapsed: float) -> dict:
+        snapshot = self.manager.metrics.snapshot()
+        frames = sum(video["frames"] for video in self.videos)
+        duration = sum(video["duration"] for video in self.videos)
+        return {
+            "videos": self.videos,
+            "frames": frames,
+            "elapsed": elapsed,
+            "fps": frames / elapsed if elapsed else None,
+            "realtime_factor": duration / elapsed if elapsed else None,
+            "stages": {
+                stage: {
+                    "processed": snapshot[stage]["processed"],
+                    "seconds": snapshot[stage]["seconds"],
+                    "fps": (
+                        snapshot[stage]["processed"] / snapshot[stage]["seconds"]
+                        if snapshot[stage]["seconds"] else None
+                    ),
+                } for stage in self.stages
+            },
+            "count_in": self.manager.count_in.value,
+            "count_out": self.manager.count_out.value,
+            "events": self.events,
+        }
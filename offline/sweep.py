@@ -0,0 +1,204 @@
+"""
+Parallel sweep of counting and tracker parameters.
+
+Detection and classification are run once per video (see 'offline.cache'),
+then a grid or a random sample of parameters is replayed on the caches
+in a process pool and ranked by count error against ground truth.
+Caches hold every frame, so with '--gate' gate parameters can be tuned too.
+
+Videos are described in the same manifest format, as for 'benchmarks.accuracy'
+("configs" are not used). Search space maps parameters to candidate values:
+    {"line_height": [110, 130, 150], "tracker_iou": [0.01, 0.02, 0.05]}
+
+Usage:
+    IEC_CONFIG=config/main.json python -m offline.sweep manifest.json space.json --out sweep.json
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+from typing import Dict, List
+
+from offline.cache import CachedReplayRunner, build_cache, get_cache_path, is_cache_valid
+from offline.replay import load_session
+from offline.runner import ReplayRunner
+from managers import Session
+from utils import set_environment
+
+
+# Parameters, which don't require NN compute to be re-evaluated
+TUNABLE = (
+    "line_height",
+    "tracker_iou",
+    "tracker_max_age",
+    "tracker_min_hits",
+    "num_frames_to_average",
+    "min_frames_to_count",
+    "cls_threshold",
+    "gate_moving_stride",
+    "gate_motion_threshold",
+)
+
+
+def make_candidates(space: Dict[str, list], samples: int=None, seed: int=0) -> List[dict]:
+    """Make all combinations of the space or 'samples' random unique ones."""
+    unknown = set(space) - set(TUNABLE)
+    if unknown:
+        raise ValueError(f"Parameters {sorted(unknown)} can't be tuned on cached detections.")
+    names = sorted(space)
+    # Duplicate values would make distinct combinations fewer, than counted
+    space = {name: list(dict.fromkeys(space[name])) for name in names}
+    if samples is None:
+        return [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    rng = random.Random(seed)
+    n_combinations = 1
+    for name in names:
+        n_combinations *= len(space[name])
+    candidates = {}
+    while len(candidates) < min(samples, n_combinations):
+        values = tuple(rng.choice(space[name]) for name in names)
+        candidates[values] = dict(zip(names, values))
+    return list(candidates.values())
+
+
+def build_caches(config_path: str, videos: List[dict], cache_dir: str) -> Dict[str, List[str]]:
+    """Build missing caches and get cache paths for every video."""
+    caches = {
+        video["name"]: [get_cache_path(cache_dir, path) for path in video["paths"]]
+        for video in videos
+    }
+    # Caches of other NN settings are rebuilt as well
+    paths = [path for video in videos for path in video["paths"]]
+    session = load_session(config_path, paths)
+    missing = [
+        path for path in paths
+        if not is_cache_valid(get_cache_path(cache_dir, path), session.managers[0])
+    ]
+    if missing:
+        runner = ReplayRunner(session)
+        for path in missing:
+            build_cache(runner, path, cache_dir)
+    return caches
+
+
+def _init_worker(logs_dir: str, out_video_dir: str) -> None:
+    set_environment(logs_dir=logs_dir, out_video_dir=out_video_dir)
+    # Tracker prints debug info on every event
+    sys.stdout = open(os.devnull, "w")
+    return
+
+
+def evaluate(
+    kwargs: dict,
+    params: dict,
+    videos: List[dict],
+    caches: Dict[str, List[str]],
+    gate: bool=False
+) -> dict:
+    """Replay caches of every video with parameters and compare counts with ground truth."""
+    count_error = 0
+    expected = 0
+    results = {}
+    for video in videos:
+        paths = caches[video["name"]]
+        session = Session(**dict(kwargs, **params, streams=paths[:1], n_cameras=1))
+        report = CachedReplayRunner(session, gate=gate).replay(paths)
+        error = (
+            abs(report["count_in"] - video["count_in"])
+            + abs(report["count_out"] - video["count_out"])
+        )
+        count_error += error
+        expected += video["count_in"] + video["count_out"]
+        results[video["name"]] = {
+            "count_in": report["count_in"],
+            "count_out": report["count_out"],
+            "count_error": error,
+        }
+    return {
+        "params": params,
+        "count_error": count_error,
+        "count_rel_error": count_error / expected if expected else None,
+        "videos": results,
+    }
+
+
+def run_sweep(
+    config_path: str,
+    videos: List[dict],
+    candidates: List[dict],
+    cache_dir: str,
+    workers: int=None,
+    gate: bool=False
+) -> List[dict]:
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        kwargs = json.load(config_file)
+    logs_dir = kwargs.pop("logs_dir", ".")
+    out_video_dir = kwargs.pop("out_video_dir", ".")
+    kwargs["api_port"] = None
+
+    caches = build_caches(config_path, videos, cache_dir)
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(logs_dir, out_video_dir),
+    ) as executor:
+        futures = [
+            executor.submit(evaluate, kwargs, params, videos, caches, gate)
+            for params in candidates
+        ]
+        for i, future in enumerate(as_completed(futures), 1):
+            results.append(future.result())
+            print(f"Evaluated {i}/{len(futures)} configurations.", end="\r")
+    print()
+    results.sort(key=lambda result: result["count_error"])
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("manifest", help="path to manifest with annotated videos")
+    parser.add_argument("space", help="path to JSON with candidate values of parameters")
+    parser.add_argument("--config", default=os.environ.get("IEC_CONFIG"), help="path to base config")
+    parser.add_argument("--cache-dir", default="cache", help="directory with detection caches")
+    parser.add_argument("--samples", type=int, default=None, help="number of random configurations (grid if not set)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for random search")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--gate", action="store_true", help="gate frames by cached ego-motion")
+    parser.add_argument("--top", type=int, default=10, help="number of best configurations to print")
+    parser.add_argument("--out", default="sweep_report.json", help="path to save JSON report")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    base_dir = os.path.dirname(os.path.abspath(args.manifest))
+    with open(args.manifest, "r", encoding="utf-8") as manifest_file:
+        videos = json.load(manifest_file)["videos"]
+    for video in videos:
+        video["paths"] = [os.path.join(base_dir, path) for path in video["paths"]]
+    with open(args.space, "r", encoding="utf-8") as space_file:
+        space = json.load(space_file)
+
+    candidates = make_candidates(space, args.samples, args.seed)
+    print(f"Evaluating {len(candidates)} configurations on {len(videos)} videos.")
+    results = run_sweep(args.config, videos, candidates, args.cache_dir, args.workers, args.gate)
+    with open(args.out, "w", encoding="utf-8") as report_file:
+        json.dump(
+            {
+                "created": datetime.now().isoformat(),
+                "config": args.config,
+                "space": space,
+                "results": results,
+            },
+            report_file,
+            indent=4,
+        )
+    for result in results[:args.top]:
+        print(f"error={result['count_error']:<6} {json.dumps(result['params'])}")
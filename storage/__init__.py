@@ -0,0 +1 @@
+from .retention import RetentionManager, register_file, register_segment_list
\ No newline at end of file
@@ -0,0 +1,255 @@
+import heapq
+import os
+import time
+from typing import Dict
+
+from utils.debug import (
+    debug_retention_delete,
+    debug_retention_init,
+    debug_retention_fail_delete,
+)
+from utils.types import Session
+
+
+class RetentionManager:
+    """
+    Keeps 'out_video_dir' and 'logs_dir' within byte quota and maximal age.
+    Directories are scanned only once at startup. After that, the index is
+    updated with files, registered by writers through 'register_file' and
+    'register_segment_list', so large directories are never rescanned.
+    The oldest files are deleted first.
+
+    Only files, created by the session, are managed: top-level files of the
+    directories (and profile dumps), named like videos, clips and archive
+    segments or like event logs, traces and profiles. Limits are applied
+    to each kind of files separately, so both directories may be the same.
+    """
+
+    # Name prefixes of the files, created by writers, archiver and loggers
+    prefixes = {
+        "video": ("video_", "clip_", "archive_"),
+        "logs": ("log_", "trace_", "profile_"),
+    }
+
+    def __init__(self, session: Session):
+        # Store reference to session as an attribute
+        self.session = session
+
+        # Unpack parameters
+        (
+            video_quota_gb,
+            video_max_age_days,
+            logs_quota_gb,
+            logs_max_age_days,
+            interval,
+        ) = self.session.retention_tuple
+
+        # Never fall back to a shared directory, files there aren't ours
+        for key in ("out_video_dir", "logs_dir"):
+            if not os.environ.get(key):
+                raise ValueError(f"'{key}' environment variable is required for retention.")
+
+        # Initialize managed directories: directory -> kinds of files in it
+        self.locations: Dict[str, tuple] = {}
+        for kind, directory in (
+            ("video", os.environ["out_video_dir"]),
+            ("logs", os.environ["logs_dir"]),
+            ("logs", self.session.profile_dir),
+        ):
+            directory = os.path.abspath(directory)
+            self.locations[directory] = self.locations.get(directory, ()) + (kind,)
+
+        # Initialize limits for each kind of files: (quota in bytes, max age in seconds)
+        self.limits = {
+            "video": (
+                self._to_bytes(video_quota_gb),
+                self._to_seconds(video_max_age_days),
+            ),
+            "logs": (
+                self._to_bytes(logs_quota_gb),
+                self._to_seconds(logs_max_age_days),
+            ),
+        }
+        self.interval = interval
+        self.type = "retention"
+
+        # Initialize index: path -> (mtime, size), per-kind totals and
+        # per-kind heaps of (mtime, path) to find the oldest file quickly.
+        self.files: Dict[str, tuple] = {}
+        self.totals = {kind: 0 for kind in self.limits}
+        self.heaps = {kind: [] for kind in self.limits}
+        # Files, which may still be written to, and their last known mtime
+        self.active: Dict[str, float] = {}
+        # ffmpeg segment lists and read offsets
+        self.segment_lists: Dict[str, int] = {}
+
+        # Index existing files
+        for directory in self.locations:
+            self._scan(directory)
+
+        # Print debug info
+        debug_retention_init(self)
+        return
+
+    def _to_bytes(self, gigabytes: float) -> float:
+        return float("inf") if gigabytes is None else gigabytes * 1024 ** 3
+
+    def _to_seconds(self, days: float) -> float:
+        return float("inf") if days is None else days * 24 * 3600
+
+    def _scan(self, directory: str) -> None:
+        """Index top-level files in directory. Called once at startup."""
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            # Subdirectories (e.g. '.git' or per-process traces) are never managed
+            if entry.is_file(follow_symlinks=False):
+                self._add(entry.path)
+        return
+
+    def _kind(self, path: str) -> str:
+        """Get the kind of a managed file or None, if the file isn't ours."""
+        kinds = self.locations.get(os.path.dirname(path), ())
+        filename = os.path.basename(path)
+        for kind in kinds:
+            if filename.startswith(self.prefixes[kind]):
+                return kind
+        return None
+
+    def _add(self, path: str) -> bool:
+        """Add file to the index or update its size. Returns False if it's missing."""
+        path = os.path.abspath(path)
+        kind = self._kind(path)
+        if kind is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        previous = self.files.get(path)
+        if previous is not None:
+            self.totals[kind] -= previous[1]
+        # Modified file gets a new heap entry, the old one becomes stale
+        if previous is None or previous[0] != stat.st_mtime:
+            heapq.heappush(self.heaps[kind], (stat.st_mtime, path))
+        self.files[path] = (stat.st_mtime, stat.st_size)
+        self.totals[kind] += stat.st_size
+        return True
+
+    def _remove(self, path: str) -> None:
+        self.active.pop(path, None)
+        if path not in self.files:
+            return
+        _, size = self.files.pop(path)
+        self.totals[self._kind(path)] -= size
+        return
+
+    def update(self) -> None:
+        """Update the index and delete files, which exceed the limits."""
+        self._receive()
+        self._read_segment_lists()
+        self._refresh_active()
+        for kind in self.limits:
+            self._enforce(kind)
+        time.sleep(self.interval)
+        return
+
+    def _receive(self) -> None:
+        """Get newly created files and segment lists from writers."""
+        storage = self.session.retention_storage
+        while not storage.empty():
+            kind, path = storage.get()
+            if kind == "list":
+                self.segment_lists.setdefault(path, 0)
+            elif self._add(path):
+                self.active[os.path.abspath(path)] = time.time()
+        return
+
+    def _read_segment_lists(self) -> None:
+        """Index segments, which ffmpeg has finished since the last update."""
+        for list_path, offset in self.segment_lists.items():
+            try:
+                # ffmpeg truncates the list on restart
+                if os.path.getsize(list_path) < offset:
+                    offset = 0
+                with open(list_path, "r", encoding="utf-8") as segment_list:
+                    segment_list.seek(offset)
+                    lines = segment_list.readlines()
+                    self.segment_lists[list_path] = segment_list.tell()
+            except OSError:
+                continue
+            # Each line of csv list is "filename,start,end"
+            directory = os.path.dirname(list_path)
+            for line in lines:
+                filename = line.split(",")[0].strip()
+                if filename:
+                    self._add(os.path.join(directory, filename))
+        return
+
+    def _refresh_active(self) -> None:
+        """
+        Update sizes of the files, which may still grow.
+        A file is considered finished, if it wasn't modified
+        for two update intervals.
+        """
+        now = time.time()
+        for path in list(self.active):
+            if not self._add(path):
+                self._remove(path)
+                continue
+            mtime = self.files[path][0]
+            if now - mtime > 2 * self.interval:
+                self.active.pop(path)
+        return
+
+    def _enforce(self, kind: str) -> None:
+        quota, max_age = self.limits[kind]
+        heap = self.heaps[kind]
+        now = time.time()
+        while heap:
+            mtime, path = heap[0]
+            # Skip stale heap entries (removed or updated files)
+            if path not in self.files or self.files[path][0] != mtime:
+                heapq.heappop(heap)
+                continue
+            if self.totals[kind] <= quota and now - mtime <= max_age:
+                break
+            # Never delete files, which are still being written
+            if path in self.active:
+                break
+            heapq.heappop(heap)
+            try:
+                os.remove(path)
+                debug_retention_delete(self, path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                debug_retention_fail_delete(self, path, e)
+            self._remove(path)
+        return
+
+    def run(self, *args, **kwargs) -> None:
+        return self.update(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs) -> None:
+        return self.update(*args, **kwargs)
+
+
+def register_file(session: Session, path: str) -> None:
+    """Notify RetentionManager about a newly created file."""
+    try:
+        session.retention_storage.put(("file", path))
+    except Exception:
+        pass
+    return
+
+
+def register_segment_list(session: Session, path: str) -> None:
+    """Notify RetentionManager about a csv segment list, written by ffmpeg."""
+    try:
+        session.retention_storage.put(("list", path))
+    except Exception:
+        pass
+    return
\ No newline at end of file
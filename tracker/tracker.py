@@ -1,6 +1,8 @@
 from collections import deque
 import time
 
+import numpy as np
+
 from loggers import Log, create_log
 from tracker.sort import Sort
 from utils.debug import (
@@ -9,6 +11,7 @@ from utils.debug import (
     debug_track_empty,
     debug_track_event,
 )
+from utils.metrics import LatencyRecorder
 from utils.types import StreamManager
 
 
@@ -62,7 +65,11 @@ class Tracker:
         self.previous_low_y = {}
         self.previous_high_y = {}
         self.frame_counter = 0
+        self.door = 0
+        # Capture time of the current frame, events are logged with it
+        self.captured = None
         self.min_frames_to_count = min_frames_to_count
+        self.latency = LatencyRecorder(self.manager, "tracker")
 
         # Print debug info
         debug_tracker_init(self)
@@ -77,14 +84,36 @@ class Tracker:
             time.sleep(0.01)
             return
 
-        # Update frame counter
-        self.frame_counter += 1
-
         # Get bboxes of detected objects
-        boxes = self.manager.detect_storage.get()
+        boxes_packet = self.manager.detect_storage.get()
 
         # Get door state
-        door = self.manager.door_storage.get()
+        door_packet = self.manager.door_storage.get()
+        started = time.perf_counter()
+
+        # Update counters with the frame data
+        self.update(boxes_packet.data, door_packet.data, boxes_packet.captured)
+        self.manager.metrics.observe("tracker", time.perf_counter() - started)
+        # Latency is measured from the slower of NN stages
+        if door_packet.emitted > boxes_packet.emitted:
+            self.latency.record(door_packet)
+        else:
+            self.latency.record(boxes_packet)
+        return
+
+    def update(self, boxes: np.ndarray, door: int, captured: float=None) -> None:
+        """
+        Update tracks and counters with detections and door state of a frame.
+        Doesn't read shared storages, so it's also used for offline replay.
+        """
+        # Update frame counter
+        self.frame_counter += 1
+        self.captured = captured
+
+        # Request a clip recording, when the door opens
+        if door and not self.door:
+            self.manager.clip_trigger.value = time.time()
+        self.door = door
 
         # Update Sort tracker
         tracker_data = self.tracker.update(boxes)
@@ -224,8 +253,9 @@ class Tracker:
             self.manager.count_out.value += 1
         status = f"{event_name}_{event_type}"
         self.last_direction[obj_id] = [status, self.frame_counter]
+        self.manager.clip_trigger.value = time.time()
         try:
-            log = create_log(self.manager, event_name)
+            log = create_log(self.manager, event_name, captured=self.captured)
             self.manager.logs_storage.put(log)
             debug_track_event(self, event_name)
         except Exception as e:
@@ -244,7 +274,7 @@ class Tracker:
             self.manager.count_out.value = max(0, self.manager.count_out.value-1)
         status = f"cancel_{event_name}"
         try:
-            log = create_log(self.manager, status)
+            log = create_log(self.manager, status, captured=self.captured)
             self.manager.logs_storage.put(log)
             debug_track_event(self, event_name)
         except Exception as e:
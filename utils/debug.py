@@ -1,15 +1,25 @@
 from datetime import datetime
-from typing import Callable
+from typing import Callable, Union
 
 import numpy as np
 
 from utils.types import (
     Classifier,
+    ClipWriter,
+    DetectionCache,
     Detector,
     GPS,
+    GPSStream,
+    LatencyRecorder,
     Logger,
     Preprocessor,
+    ReplayRunner,
+    ResourcePlanner,
+    RetentionManager,
     Session,
+    StageProfiler,
+    StreamArchiver,
+    StatusServer,
     StreamManager,
     Tracker,
     VideoReader,
@@ -53,6 +63,10 @@ def debug_session_init(session: Session) -> str:
 def debug_processes_init(processes: dict) -> str:
     return f"Processes: {processes}."
 
+@_debug_wrapper
+def debug_process_startup(name: str, seconds: float) -> str:
+    return f"Process {name} started in {seconds * 1000:.0f} ms."
+
 @_debug_wrapper
 def debug_processes_start(processes: dict) -> str:
     return f"Session started."
@@ -61,6 +75,79 @@ def debug_processes_start(processes: dict) -> str:
 def debug_processes_finish(processes: dict) -> str:
     return f"Session finished."
 
+@_debug_wrapper
+def debug_model_shared(weights: str, task: str) -> str:
+    return f"Shared {task} model loaded from {weights}."
+
+@_debug_wrapper
+def debug_model_compiled(path: str) -> str:
+    return f"Compiled model saved to {path}."
+
+@_debug_fail_wrapper
+def debug_fail_compile_model(weights: str, e: Exception) -> str:
+    return f"Failed to compile model {weights}, loading weights as is: {e}."
+
+@_debug_wrapper
+def debug_model_warmup(worker: Union[Detector, Classifier], seconds: float) -> str:
+    return f"{worker.type.capitalize()} for CAM{worker.manager.camera} warmed up in {seconds:.2f}s."
+
+@_debug_wrapper
+def debug_models_ready(session: Session, seconds: float) -> str:
+    return f"NN stages of {len(session.managers)} cameras are ready in {seconds:.1f}s. Starting readers."
+
+@_debug_fail_wrapper
+def debug_fail_models_ready(session: Session, seconds: float) -> str:
+    return f"NN stages are not ready in {seconds:.1f}s. Starting readers anyway."
+
+@_debug_wrapper
+def debug_resources_plan(planner: ResourcePlanner) -> str:
+    layout = "\n".join(f"    {line}" for line in planner.layout())
+    return f"Resource plan ({planner.mode}, {len(planner.cores)} cores):\n{layout}"
+
+@_debug_wrapper
+def debug_resources_apply(planner: ResourcePlanner, group: str, name: str) -> str:
+    return f"Resources of {group}/{name} applied: {planner.plan[(group, name)]}."
+
+@_debug_fail_wrapper
+def debug_fail_resources_apply(planner: ResourcePlanner, group: str, name: str, e: Exception) -> str:
+    return f"Failed to apply resources of {group}/{name}: {e}."
+
+@_debug_fail_wrapper
+def debug_fail_resources_pinning(planner: ResourcePlanner, n_processes: int) -> str:
+    return f"{n_processes} NN stages don't fit into {len(planner.cores)} cores. Cores aren't pinned."
+
+@_debug_wrapper
+def debug_trace_saved(path: str, n_events: int) -> str:
+    return f"Saved {n_events} trace events to {path}."
+
+@_debug_wrapper
+def debug_profile_saved(profiler: StageProfiler, path: str) -> str:
+    return f"Saved {profiler.mode} profile of {profiler.label} to {path}."
+
+@_debug_wrapper
+def debug_replay_start(runner: ReplayRunner, path: str) -> str:
+    return f"Replaying {path} for CAM{runner.manager.camera}."
+
+@_debug_wrapper
+def debug_replay_finish(runner: ReplayRunner, video: dict) -> str:
+    return (
+        f"Replayed {video['frames']} frames of {video['path']}: "
+        f"in={video['count_in']}, out={video['count_out']}."
+    )
+
+@_debug_wrapper
+def debug_cache_saved(cache: DetectionCache) -> str:
+    return f"Saved detection cache of {len(cache)} frames to {cache.path}."
+
+@_debug_wrapper
+def debug_status_server_init(server: StatusServer) -> str:
+    host, port = server.server.server_address[:2]
+    return f"Status API is listening on http://{host}:{port}/status."
+
+@_debug_fail_wrapper
+def debug_fail_status_server(host: str, port: int, e: Exception) -> str:
+    return f"Status API failed to listen on {host}:{port}: {e}. Continuing without it."
+
 @_debug_wrapper
 def debug_manager_init(manager: StreamManager) -> str:
     return f"Manager for CAM{manager.camera} initialized: stream={manager.reader_tuple}."
@@ -173,6 +260,18 @@ def debug_gps_get_geolocation(gps: GPS, geolocation: dict) -> str:
 def debug_gps_fail_get_location(gps: GPS, e: Exception) -> str:
     return f"Failed to obtain geolocation: {e}"
 
+@_debug_wrapper
+def debug_gps_stream_init(stream: GPSStream) -> str:
+    return f"GPSStream initialized: gpsd={stream.client.host}:{stream.client.port}."
+
+@_debug_wrapper
+def debug_gps_stream_connect(stream: GPSStream) -> str:
+    return f"GPSStream connected to gpsd."
+
+@_debug_fail_wrapper
+def debug_gps_stream_fail(stream: GPSStream, e: Exception) -> str:
+    return f"GPSStream failed to read from gpsd: {e}"
+
 @_debug_wrapper
 def debug_logger_init(logger: Logger) -> str:
     return "Logger initialized."
@@ -183,7 +282,11 @@ def debug_writer_init(writer: VideoWriter) -> str:
 
 @_debug_wrapper
 def debug_writer_create(writer: VideoWriter) -> str:
-    return f"Created cv2.VideoWriter for CAM{writer.manager.camera} and hour {writer.start_hour}."
+    return f"Created {writer.backend} writer for CAM{writer.manager.camera} and hour {writer.start_hour}."
+
+@_debug_wrapper
+def debug_writer_backlog(writer: VideoWriter, backlog: int) -> str:
+    return f"Writer backlog for CAM{writer.manager.camera}: {backlog} frames."
 
 @_debug_wrapper
 def debug_write_empty(writer: VideoWriter) -> str:
@@ -195,4 +298,45 @@ def debug_write_frame(writer: VideoWriter) -> str:
 
 @_debug_fail_wrapper
 def debug_fail_write_frame(writer: VideoWriter, e: Exception) -> str:
-    return f"Failed to write frame from CAM{writer.manager.camera} to {writer.out_path}: {e}"
\ No newline at end of file
+    return f"Failed to write frame from CAM{writer.manager.camera} to {writer.out_path}: {e}"
+
+@_debug_wrapper
+def debug_clip_start(writer: ClipWriter) -> str:
+    return f"Started clip for CAM{writer.manager.camera}: {writer.out_path}."
+
+@_debug_wrapper
+def debug_clip_finish(writer: ClipWriter) -> str:
+    return f"Finished clip for CAM{writer.manager.camera}: {writer.out_path}."
+
+@_debug_wrapper
+def debug_archiver_init(archiver: StreamArchiver) -> str:
+    return f"Archiver for CAM{archiver.manager.camera} initialized."
+
+@_debug_wrapper
+def debug_archiver_start(archiver: StreamArchiver) -> str:
+    return f"Started ffmpeg stream copy for CAM{archiver.manager.camera} to {archiver.out_path}."
+
+@_debug_fail_wrapper
+def debug_archiver_restart(archiver: StreamArchiver, code: int) -> str:
+    return f"ffmpeg stream copy for CAM{archiver.manager.camera} exited with code {code}. Restarting..."
+
+@_debug_wrapper
+def debug_retention_init(retention: RetentionManager) -> str:
+    return f"RetentionManager initialized: indexed {len(retention.files)} files, totals={retention.totals}."
+
+@_debug_wrapper
+def debug_retention_delete(retention: RetentionManager, path: str) -> str:
+    return f"Deleted {path} to keep storage limits."
+
+@_debug_fail_wrapper
+def debug_retention_fail_delete(retention: RetentionManager, path: str, e: Exception) -> str:
+    return f"Failed to delete {path}: {e}"
+
+@_debug_wrapper
+def debug_stage_latency(recorder: LatencyRecorder, hop: list, e2e: list) -> str:
+    hop_str = "/".join(f"{value * 1000:.0f}" for value in hop)
+    e2e_str = "/".join(f"{value * 1000:.0f}" for value in e2e)
+    return (
+        f"Latency of {recorder.stage} for CAM{recorder.manager.camera} (p50/p95/p99, ms): "
+        f"hop={hop_str}, end-to-end={e2e_str}."
+    )
\ No newline at end of file
@@ -0,0 +1,203 @@
+from bisect import bisect_left
+from collections import deque
+import time
+from typing import Iterable, List, Tuple
+
+from utils.debug import debug_stage_latency
+from utils.packet import Packet
+from utils.types import StreamManager
+
+
+class StageMetrics:
+    """
+    Per-stage counters in shared memory: processed items, dropped items,
+    a histogram of processing time and latency percentiles.
+    Each stage is updated by a single process only, so counters are
+    stored without locks and can be read by supervisor at any time.
+    """
+
+    # Upper bounds of processing time histogram buckets (in seconds).
+    # The last bucket (+Inf) is implicit.
+    buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    # Latency quantiles, published by LatencyRecorder
+    quantiles = (0.5, 0.95, 0.99)
+
+    # Layout of stage counters: processed, dropped, time sum,
+    # per-hop latency quantiles, end-to-end latency quantiles, bucket counts
+    _processed = 0
+    _dropped = 1
+    _seconds = 2
+    _hop = 3
+    _e2e = _hop + len(quantiles)
+    _buckets = _e2e + len(quantiles)
+
+    def __init__(self, ctx, stages: Iterable[str]):
+        self.stages = tuple(stages)
+        self._index = {stage: i for i, stage in enumerate(self.stages)}
+        self._width = self._buckets + len(self.buckets) + 1
+        self.data = ctx.Array("d", len(self.stages) * self._width, lock=False)
+        return
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """Register an item, processed by the stage in 'seconds'."""
+        offset = self._index[stage] * self._width
+        self.data[offset + self._processed] += 1
+        self.data[offset + self._seconds] += seconds
+        self.data[offset + self._buckets + bisect_left(self.buckets, seconds)] += 1
+        return
+
+    def set_latency(self, stage: str, hop: List[float], e2e: List[float]) -> None:
+        """Store per-hop and end-to-end latency quantiles of the stage."""
+        offset = self._index[stage] * self._width
+        n = len(self.quantiles)
+        self.data[offset + self._hop:offset + self._hop + n] = hop
+        self.data[offset + self._e2e:offset + self._e2e + n] = e2e
+        return
+
+    def processed(self, stage: str) -> int:
+        return int(self.data[self._index[stage] * self._width + self._processed])
+
+    def totals(self, stage: str) -> Tuple[int, float]:
+        """Get the number of processed items and total processing time."""
+        offset = self._index[stage] * self._width
+        return int(self.data[offset + self._processed]), self.data[offset + self._seconds]
+
+    def drop(self, stage: str, n: int=1) -> None:
+        """Register 'n' items, dropped by the stage."""
+        self.data[self._index[stage] * self._width + self._dropped] += n
+        return
+
+    def snapshot(self) -> dict:
+        data = self.data[:]
+        snapshot = {}
+        for i, stage in enumerate(self.stages):
+            offset = i * self._width
+            snapshot[stage] = {
+                "processed": int(data[offset + self._processed]),
+                "dropped": int(data[offset + self._dropped]),
+                "seconds": data[offset + self._seconds],
+                "latency": {
+                    "hop": dict(zip(
+                        map(str, self.quantiles),
+                        data[offset + self._hop:offset + self._e2e]
+                    )),
+                    "e2e": dict(zip(
+                        map(str, self.quantiles),
+                        data[offset + self._e2e:offset + self._buckets]
+                    )),
+                },
+                "buckets": [
+                    int(count) for count in
+                    data[offset + self._buckets:offset + self._width]
+                ],
+            }
+        return snapshot
+
+
+class LatencyRecorder:
+    """
+    Collects per-hop (since the previous stage has emitted the packet)
+    and end-to-end (since the frame was captured) latency of a stage.
+    Quantiles over recent samples are periodically logged and
+    published into StageMetrics.
+    """
+
+    def __init__(self, manager: StreamManager, stage: str, size: int=1000):
+        self.manager = manager
+        self.stage = stage
+        self.interval = self.manager.session.latency_interval
+        self.hop = deque(maxlen=size)
+        self.e2e = deque(maxlen=size)
+        self.frame_id = None
+        self._published = time.time()
+        return
+
+    def record(self, packet: Packet) -> None:
+        now = time.time()
+        self.frame_id = packet.frame_id
+        self.hop.append(now - packet.emitted)
+        self.e2e.append(now - packet.captured)
+        if now - self._published >= self.interval:
+            self.publish()
+            self._published = now
+        return
+
+    def publish(self) -> None:
+        hop = self._quantiles(self.hop)
+        e2e = self._quantiles(self.e2e)
+        self.manager.metrics.set_latency(self.stage, hop, e2e)
+        debug_stage_latency(self, hop, e2e)
+        return
+
+    def _quantiles(self, samples: Iterable[float]) -> List[float]:
+        samples = sorted(samples)
+        if not samples:
+            return [0.0] * len(StageMetrics.quantiles)
+        return [
+            samples[min(len(samples) - 1, int(q * len(samples)))]
+            for q in StageMetrics.quantiles
+        ]
+
+
+def queue_size(queue) -> int:
+    """Get approximate queue size or None, if it's not supported by platform."""
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return None
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """Render session snapshot (see Session.snapshot) in Prometheus text format."""
+    processed = []
+    dropped = []
+    latency = []
+    histogram = []
+    queues = []
+    counts = []
+    pipelines = [({"camera": camera}, data) for camera, data in snapshot["cameras"].items()]
+    pipelines.append(({}, snapshot["session"]))
+    for labels, data in pipelines:
+        for stage, metrics in data["stages"].items():
+            stage_labels = _labels(**labels, stage=stage)
+            processed.append(f"iec_stage_processed_total{{{stage_labels}}} {metrics['processed']}")
+            dropped.append(f"iec_stage_dropped_total{{{stage_labels}}} {metrics['dropped']}")
+            for kind, quantiles in metrics["latency"].items():
+                for quantile, value in quantiles.items():
+                    latency.append(
+                        f"iec_stage_latency_seconds{{{stage_labels},kind=\"{kind}\",quantile=\"{quantile}\"}} {value}"
+                    )
+            cumulative = 0
+            bounds = [str(bound) for bound in StageMetrics.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, metrics["buckets"]):
+                cumulative += count
+                histogram.append(
+                    f"iec_stage_processing_seconds_bucket{{{stage_labels},le=\"{bound}\"}} {cumulative}"
+                )
+            histogram.append(f"iec_stage_processing_seconds_sum{{{stage_labels}}} {metrics['seconds']}")
+            histogram.append(f"iec_stage_processing_seconds_count{{{stage_labels}}} {metrics['processed']}")
+        for queue, size in data["queues"].items():
+            if size is not None:
+                queues.append(f"iec_queue_depth{{{_labels(**labels, queue=queue)}}} {size}")
+        if "count_in" in data:
+            counts.append(f"iec_passengers{{{_labels(**labels, direction='in')}}} {data['count_in']}")
+            counts.append(f"iec_passengers{{{_labels(**labels, direction='out')}}} {data['count_out']}")
+
+    lines: List[str] = []
+    for name, kind, description, samples in (
+        ("iec_stage_processed_total", "counter", "Items processed by pipeline stage.", processed),
+        ("iec_stage_dropped_total", "counter", "Items dropped by pipeline stage.", dropped),
+        ("iec_stage_latency_seconds", "gauge", "Per-hop and end-to-end frame latency quantiles.", latency),
+        ("iec_stage_processing_seconds", "histogram", "Processing time of a single item.", histogram),
+        ("iec_queue_depth", "gauge", "Number of items waiting in a queue.", queues),
+        ("iec_passengers", "gauge", "Registered passengers per camera and direction.", counts),
+    ):
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
\ No newline at end of file
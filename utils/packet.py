@@ -0,0 +1,23 @@
+import time
+from typing import Any
+
+
+class Packet:
+    """
+    Item, passed between pipeline stages through shared storages.
+    Carries frame id and capture timestamp through every stage,
+    so each stage can measure per-hop and end-to-end latency.
+    """
+
+    __slots__ = ("frame_id", "captured", "emitted", "data")
+
+    def __init__(self, frame_id: int, captured: float, data: Any, emitted: float=None):
+        self.frame_id = frame_id
+        self.captured = captured
+        self.data = data
+        self.emitted = captured if emitted is None else emitted
+        return
+
+    def forward(self, data: Any) -> "Packet":
+        """Make a packet for the next stage with the same frame id."""
+        return Packet(self.frame_id, self.captured, data, time.time())
\ No newline at end of file
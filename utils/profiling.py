@@ -0,0 +1,145 @@
+from collections import Counter
+import cProfile
+from datetime import datetime
+import os
+import signal
+import time
+
+from storage import register_file
+from utils.debug import debug_profile_saved
+from utils.types import Session
+
+
+class StageProfiler:
+    """
+    Profiles a worker process from the inside, so there is no need
+    to attach external tools to processes, whose PIDs change on restarts.
+    In "sample" mode the main thread's stack is sampled on SIGPROF timer
+    and dumped in folded format (for flamegraph.pl or speedscope).
+    In "cprofile" mode cProfile is enabled for 'window' seconds only,
+    because of its overhead, and dumped in pstats format.
+    Profiles are dumped every 'interval' seconds and on SIGUSR1.
+    """
+
+    def __init__(self, session: Session, label: str):
+        # Store reference to session as an attribute
+        self.session = session
+
+        # Unpack parameters
+        (
+            _,
+            mode,
+            interval,
+            window,
+            sample_interval,
+        ) = self.session.profile_tuple
+
+        # Set profiling parameters
+        self.label = label
+        self.mode = mode
+        self.interval = interval
+        self.window = window
+        self.sample_interval = sample_interval
+        self.pid = os.getpid()
+        self.out_dir = self.session.profile_dir
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        # Initialize profiling state
+        self.samples = Counter()
+        self.profile = None
+        self._started = time.time()
+        self._requested = False
+        self.n_dumps = 0
+        return
+
+    def __enter__(self) -> "StageProfiler":
+        signal.signal(signal.SIGUSR1, self._request)
+        # Supervisor terminates workers, so dump the profile on SIGTERM
+        signal.signal(signal.SIGTERM, self._terminate)
+        if self.mode == "sample":
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.sample_interval, self.sample_interval)
+        else:
+            self._enable()
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.mode == "sample":
+            signal.setitimer(signal.ITIMER_PROF, 0)
+        self.dump()
+        return
+
+    def _request(self, signum, frame) -> None:
+        # Dump is done by the worker loop, not inside the signal handler
+        self._requested = True
+        return
+
+    def _terminate(self, signum, frame) -> None:
+        raise SystemExit(0)
+
+    def _sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(
+                f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+        return
+
+    def _enable(self) -> None:
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self._started = time.time()
+        return
+
+    def tick(self) -> None:
+        """Called by the worker loop after every iteration."""
+        elapsed = time.time() - self._started
+        if self._requested:
+            self._requested = False
+            self.dump()
+        elif self.mode == "sample" and elapsed >= self.interval:
+            self.dump()
+        elif self.mode == "cprofile":
+            if self.profile is not None and elapsed >= self.window:
+                self.dump()
+            elif self.profile is None and elapsed >= self.interval:
+                self._enable()
+        return
+
+    def dump(self) -> None:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        filename = f"profile_{self.label}_{self.pid}_{timestamp}_{self.n_dumps}"
+        if self.mode == "sample":
+            if not self.samples:
+                return
+            samples, self.samples = self.samples, Counter()
+            path = os.path.join(self.out_dir, f"{filename}.folded")
+            with open(path, "w", encoding="utf-8") as profile_file:
+                for stack, count in samples.most_common():
+                    profile_file.write(f"{stack} {count}\n")
+            self._started = time.time()
+        else:
+            if self.profile is None:
+                # Dump requested between windows: profile the next window
+                self._enable()
+                return
+            self.profile.disable()
+            path = os.path.join(self.out_dir, f"{filename}.prof")
+            self.profile.dump_stats(path)
+            self.profile = None
+            self._started = time.time()
+        self.n_dumps += 1
+        register_file(self.session, path)
+        debug_profile_saved(self, path)
+        return
+
+
+def make_profiler(session: Session, stage: str, label: str) -> StageProfiler:
+    """Make a profiler for the worker loop or None, if the stage is not profiled."""
+    stages, *_ = session.profile_tuple
+    if stage not in stages:
+        return None
+    return StageProfiler(session, label)
@@ -0,0 +1,141 @@
+import glob
+import json
+import os
+import shutil
+import signal
+import time
+from typing import Any, List
+
+from utils.metrics import StageMetrics
+from utils.types import Session
+
+
+# Names of spans, recorded for pipeline stages
+SPAN_NAMES = {
+    "reader": "read",
+    "preprocessor": "preprocess",
+    "detector": "detect",
+    "classifier": "classify",
+    "tracker": "track",
+    "writer": "write",
+    "logger": "log",
+}
+
+
+class StageTracer:
+    """
+    Records a span for every item, processed by a worker loop.
+    Span duration is taken from the stage metrics (see StageMetrics.observe),
+    so waiting for input and idle iterations are not traced and show up
+    as gaps on the timeline. Spans are buffered in memory and periodically
+    appended to a per-process file in the session trace directory.
+    """
+
+    def __init__(
+        self,
+        trace_dir: str,
+        metrics: StageMetrics,
+        stage: str,
+        process_name: str,
+        flush_interval: float=1.0
+    ):
+        self.metrics = metrics
+        self.stage = stage
+        self.span = SPAN_NAMES.get(stage, stage)
+        self.pid = os.getpid()
+        self.flush_interval = flush_interval
+        os.makedirs(trace_dir, exist_ok=True)
+        self.path = os.path.join(trace_dir, f"{self.pid}.jsonl")
+        self.events: List[dict] = [{
+            "name": "process_name",
+            "ph": "M",
+            "pid": self.pid,
+            "args": {"name": process_name},
+        }]
+        self._flushed = time.time()
+        return
+
+    def __enter__(self) -> "StageTracer":
+        # Supervisor terminates workers, so flush the buffer on SIGTERM
+        signal.signal(signal.SIGTERM, self._terminate)
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+        return
+
+    def _terminate(self, signum, frame) -> None:
+        raise SystemExit(0)
+
+    def run(self, worker: Any) -> None:
+        processed, seconds = self.metrics.totals(self.stage)
+        worker.run()
+        new_processed, new_seconds = self.metrics.totals(self.stage)
+        if new_processed == processed:
+            return
+        end = time.time()
+        latency = getattr(worker, "latency", None)
+        self.add_span(
+            end - (new_seconds - seconds),
+            end,
+            frame_id=getattr(latency, "frame_id", None)
+        )
+        if end - self._flushed >= self.flush_interval:
+            self.flush()
+        return
+
+    def add_span(self, start: float, end: float, **args) -> None:
+        self.events.append({
+            "name": self.span,
+            "cat": self.stage,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": self.pid,
+            "args": args,
+        })
+        return
+
+    def flush(self) -> None:
+        if self.events:
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                for event in self.events:
+                    trace_file.write(json.dumps(event) + "\n")
+            self.events = []
+        self._flushed = time.time()
+        return
+
+
+def make_tracer(
+    session: Session,
+    metrics: StageMetrics,
+    stage: str,
+    process_name: str
+) -> StageTracer:
+    """Make a tracer for the worker loop or None, if tracing is disabled."""
+    if session.trace_dir is None:
+        return None
+    return StageTracer(session.trace_dir, metrics, stage, process_name)
+
+
+def merge_traces(trace_dir: str, out_path: str) -> int:
+    """
+    Merge per-process trace files into a single Chrome trace JSON,
+    which can be opened in Perfetto or chrome://tracing.
+    Returns the number of merged events.
+    """
+    events = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, "*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as trace_file:
+            for line in trace_file:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # The last line of a killed process may be incomplete
+                    continue
+    events.sort(key=lambda event: event.get("ts", 0))
+    with open(out_path, "w", encoding="utf-8") as out_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, out_file)
+    shutil.rmtree(trace_dir, ignore_errors=True)
+    return len(events)
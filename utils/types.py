@@ -33,4 +33,34 @@ class GPS(BaseType):
     pass
 
 class VideoWriter(BaseType):
+    pass
+
+class ClipWriter(BaseType):
+    pass
+
+class StreamArchiver(BaseType):
+    pass
+
+class RetentionManager(BaseType):
+    pass
+
+class GPSStream(BaseType):
+    pass
+
+class StatusServer(BaseType):
+    pass
+
+class LatencyRecorder(BaseType):
+    pass
+
+class StageProfiler(BaseType):
+    pass
+
+class ResourcePlanner(BaseType):
+    pass
+
+class ReplayRunner(BaseType):
+    pass
+
+class DetectionCache(BaseType):
     pass
\ No newline at end of file
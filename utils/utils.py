@@ -1,22 +1,40 @@
+from contextlib import ExitStack
 from datetime import datetime
 import multiprocessing as mp
 import os
+import signal
 import time
+from typing import Callable
 
 from frame_processing import (
+    ClipWriter,
     Preprocessor,
+    StreamArchiver,
     VideoReader,
     VideoWriter
 )
-from gps import GPS
+from gps import GPS, GPSStream
 from loggers import Logger
+from managers.status import StatusServer
+from storage import RetentionManager
 from nn import Classifier, Detector
+from nn.backends import load_shared_model
 from tracker import Tracker
 from utils.debug import (
     debug_processes_finish,
     debug_processes_init,
     debug_processes_start,
+    debug_process_startup,
+    debug_model_shared,
+    debug_models_ready,
+    debug_fail_models_ready,
+    debug_fail_status_server,
+    debug_resources_plan,
+    debug_trace_saved,
 )
+from utils.metrics import StageMetrics
+from utils.profiling import make_profiler
+from utils.tracing import make_tracer, merge_traces
 from utils.types import Log, Session, StreamManager
 
 
@@ -27,120 +45,361 @@ def set_environment(**kwargs) -> None:
     return
 
 def run_read(manager: StreamManager) -> None:
+    manager.session.resources.apply(manager.camera, "reader")
     reader = VideoReader(manager)
-    while True:
-        reader.run()
+    _run_loop(reader, manager.session, manager.metrics, "reader", f"CAM{manager.camera} reader")
     return
 
 def run_preprocess(manager: StreamManager) -> None:
+    manager.session.resources.apply(manager.camera, "preprocessor")
     preprocessor = Preprocessor(manager)
-    while True:
-        preprocessor.run()
+    _run_loop(
+        preprocessor,
+        manager.session,
+        manager.metrics,
+        "preprocessor",
+        f"CAM{manager.camera} preprocessor"
+    )
     return
 
-def run_detect(manager: StreamManager) -> None:
-    detector = Detector(manager)
-    while True:
-        detector.run()
+def run_detect(manager: StreamManager, model: object=None) -> None:
+    manager.session.resources.apply(manager.camera, "detector")
+    detector = Detector(manager, model)
+    _run_loop(detector, manager.session, manager.metrics, "detector", f"CAM{manager.camera} detector")
     return
 
-def run_classify(manager: StreamManager) -> None:
-    classifier = Classifier(manager)
-    while True:
-        classifier.run()
+def run_classify(manager: StreamManager, model: object=None) -> None:
+    manager.session.resources.apply(manager.camera, "classifier")
+    classifier = Classifier(manager, model)
+    _run_loop(
+        classifier,
+        manager.session,
+        manager.metrics,
+        "classifier",
+        f"CAM{manager.camera} classifier"
+    )
     return
 
 def run_track(manager: StreamManager) -> None:
+    manager.session.resources.apply(manager.camera, "tracker")
     tracker = Tracker(manager)
-    while True:
-        tracker.run()
+    _run_loop(tracker, manager.session, manager.metrics, "tracker", f"CAM{manager.camera} tracker")
     return
 
 def run_log(session: Session) -> None:
+    session.resources.apply("logger", "log")
     logger = Logger(session)
-    while True:
-        logger.run()
+    # Logs, waiting for GPS fixes, are written on stop
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        _run_loop(logger, session, session.metrics, "logger", "logger")
+    finally:
+        logger.flush()
     return
 
 def run_gps(session: Session) -> None:
+    session.resources.apply("gps", "gps")
     gps = GPS(session)
+    # Batched geolocation cache entries are saved on stop
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        while True:
+            gps.run()
+    finally:
+        gps.cache.flush(force=True)
+    return
+
+def run_gps_stream(session: Session) -> None:
+    session.resources.apply("gps", "gps_stream")
+    gps_stream = GPSStream(session)
+    while True:
+        gps_stream.run()
+    return
+
+def run_retention(session: Session) -> None:
+    session.resources.apply("storage", "retention")
+    retention = RetentionManager(session)
     while True:
-        gps.run()
+        retention.run()
     return
 
 def run_write(manager: StreamManager) -> None:
-    writer = VideoWriter(manager)
+    manager.session.resources.apply(manager.camera, "writer")
+    if manager.record_mode == "events":
+        writer = ClipWriter(manager)
+    else:
+        writer = VideoWriter(manager)
+    _run_loop(writer, manager.session, manager.metrics, "writer", f"CAM{manager.camera} writer")
+    return
+
+def run_archive(manager: StreamManager) -> None:
+    manager.session.resources.apply(manager.camera, "archiver")
+    archiver = StreamArchiver(manager)
     while True:
-        writer.run()
+        archiver.run()
+    return
+
+def _terminate(signum, frame) -> None:
+    # Unwind the stack, so 'finally' blocks run on stop
+    raise SystemExit(0)
+
+def _run_loop(
+    worker: object,
+    session: Session,
+    metrics: StageMetrics,
+    stage: str,
+    process_name: str
+) -> None:
+    # Run worker forever, recording timeline spans and profiles if enabled
+    tracer = make_tracer(session, metrics, stage, process_name)
+    profiler = make_profiler(session, stage, process_name.lower().replace(" ", "_"))
+    if tracer is None and profiler is None:
+        while True:
+            worker.run()
+    with ExitStack() as stack:
+        if tracer is not None:
+            stack.enter_context(tracer)
+        if profiler is not None:
+            stack.enter_context(profiler)
+        while True:
+            if tracer is not None:
+                tracer.run(worker)
+            else:
+                worker.run()
+            if profiler is not None:
+                profiler.tick()
     return
 
 def run_session(session: Session) -> None:
-    processes = _make_processes(session)
-    _start_processes(processes)
-    _join_processes(processes, session)
+    if session.resources.plan:
+        debug_resources_plan(session.resources)
+    models = _load_shared_models(session)
+    processes = _make_processes(session, models)
+    # Server is bound before workers start, so a busy port can't orphan them
+    status_server = _make_status_server(session)
+    # Stop signal unwinds the supervisor too, so workers are always
+    # stopped and their traces are merged
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        _start_processes(processes, session, status_server)
+        _join_processes(processes, session, status_server)
+    finally:
+        _stop_processes(processes)
+        if status_server is not None:
+            status_server.close()
+        if session.trace_dir is not None:
+            _save_trace(session)
+    return
+
+def _save_trace(session: Session) -> None:
+    # Merge per-process spans into a single timeline
+    n_events = merge_traces(session.trace_dir, session.trace_path)
+    debug_trace_saved(session.trace_path, n_events)
     return
 
-def _make_processes(session: Session) -> dict:
+def _make_status_server(session: Session) -> StatusServer:
+    # Local status API is optional
+    host, port = session.api_tuple
+    if port is None:
+        return None
+    try:
+        return StatusServer(session)
+    except OSError as e:
+        debug_fail_status_server(host, port, e)
+        return None
+
+def _load_shared_models(session: Session) -> dict:
+    # Models are loaded once and attached by NN processes of every camera
+    (share_models, inference_backend, detect_weights, cls_weights) = session.model_tuple
+    models = {"detector": None, "classifier": None}
+    if not share_models:
+        return models
+    models["detector"] = load_shared_model(inference_backend, detect_weights, "detect")
+    models["classifier"] = load_shared_model(inference_backend, cls_weights, "classify")
+    if models["detector"] is not None:
+        debug_model_shared(detect_weights, "detect")
+    if models["classifier"] is not None:
+        debug_model_shared(cls_weights, "classify")
+    return models
+
+def _make_process(ctx, name: str, target: Callable, *args) -> mp.Process:
+    # Workers are started right after creation, so creation time is passed
+    # to measure how long the process takes to start (see '_launch')
+    return ctx.Process(
+        target=_launch,
+        args=(target, name, time.time(), *args),
+        name=name,
+    )
+
+def _launch(target: Callable, name: str, launched: float, *args) -> None:
+    # Interpreter startup and imports (spawn) or just fork (forkserver)
+    debug_process_startup(name, time.time() - launched)
+    # Forked workers inherit the supervisor handler, but set their own if needed
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    return target(*args)
+
+def _make_processes(session: Session, models: dict) -> dict:
     # Initialize processes for session
     processes = {
         manager.camera: {
-            "reader": manager.ctx.Process(
-                target=run_read,
-                args=(manager,)
-            ),
-            "preprocessor": manager.ctx.Process(
-                target=run_preprocess,
-                args=(manager,)
+            "reader": _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} reader",
+                run_read,
+                manager
             ),
-            "detector": manager.ctx.Process(
-                target=run_detect,
-                args=(manager,)
+            "preprocessor": _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} preprocessor",
+                run_preprocess,
+                manager
             ),
-            "classifier": manager.ctx.Process(
-                target=run_classify,
-                args=(manager,)
+            "detector": _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} detector",
+                run_detect,
+                manager,
+                models["detector"]
             ),
-            "tracker": manager.ctx.Process(
-                target=run_track,
-                args=(manager,)
+            "classifier": _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} classifier",
+                run_classify,
+                manager,
+                models["classifier"]
             ),
-            "writer": manager.ctx.Process(
-                target=run_write,
-                args=(manager,)
+            "tracker": _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} tracker",
+                run_track,
+                manager
             ),
         } for manager in session.managers
     }
+    for manager in session.managers:
+        # Stream copy runs independently of the analytics pipeline
+        if manager.record_mode == "copy":
+            processes[manager.camera]["archiver"] = _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} archiver",
+                run_archive,
+                manager
+            )
+        else:
+            processes[manager.camera]["writer"] = _make_process(
+                manager.ctx,
+                f"CAM{manager.camera} writer",
+                run_write,
+                manager
+            )
     processes["logger"] = {
-        "log": session.ctx.Process(
-            target=run_log,
-            args=(session,)
+        "log": _make_process(
+            session.ctx,
+            "logger",
+            run_log,
+            session
         )
     }
     processes["gps"] = {
-        "gps": session.ctx.Process(
-            target=run_gps,
-            args=(session,)
+        "gps": _make_process(
+            session.ctx,
+            "gps",
+            run_gps,
+            session
+        )
+    }
+    if session.gps_mode == "stream":
+        processes["gps"]["gps_stream"] = _make_process(
+            session.ctx,
+            "gps_stream",
+            run_gps_stream,
+            session
+        )
+    processes["storage"] = {
+        "retention": _make_process(
+            session.ctx,
+            "retention",
+            run_retention,
+            session
         )
     }
     debug_processes_init(processes)
     return processes
 
-def _start_processes(processes: dict) -> None:
-    # Start all processes
+def _start_processes(
+    processes: dict,
+    session: Session,
+    status_server: StatusServer=None
+) -> None:
+    # Start all processes, but readers
     for dct in processes.values():
-        for process in dct.values():
-            process.start()
+        for name, process in dct.items():
+            if name != "reader":
+                process.start()
+    # Start readers, when NN stages are warmed up, so frames don't pile up in queues
+    _wait_ready(processes, session, status_server)
+    for manager in session.managers:
+        manager.read_timestamp.value = time.time()
+        processes[manager.camera]["reader"].start()
     debug_processes_start(processes)
     return
 
-def _join_processes(processes: dict, session:Session) -> None:
+def _wait_ready(
+    processes: dict,
+    session: Session,
+    status_server: StatusServer=None
+) -> None:
+    """
+    Wait until Detector and Classifier of every camera are warmed up.
+    Status snapshot is refreshed meanwhile, as in '_join_processes'.
+    """
+    started = time.time()
+    updated = started
+    while time.time() - started < session.ready_timeout:
+        # Session may end before the models are ready
+        if session.is_over:
+            return
+        ready = all(
+            manager.detector_ready.value and manager.classifier_ready.value
+            for manager in session.managers
+        )
+        if ready:
+            debug_models_ready(session, time.time() - started)
+            return
+        # Don't wait for NN processes, which have already crashed
+        if any(
+            processes[manager.camera][name].exitcode is not None
+            for manager in session.managers
+            for name in ("detector", "classifier")
+        ):
+            break
+        if status_server is not None and time.time() - updated >= 1:
+            status_server.update()
+            updated = time.time()
+        time.sleep(0.1)
+    debug_fail_models_ready(session, time.time() - started)
+    return
+
+def _join_processes(
+    processes: dict,
+    session: Session,
+    status_server: StatusServer=None
+) -> None:
     # Wait for a session stop hour (sleep to lower CPU usage)
     while not session.is_over:
         _inspect_processes(processes, session)
+        if status_server is not None:
+            status_server.update()
         time.sleep(1)
+    return
+
+def _stop_processes(processes: dict) -> None:
     # Kill all the remaining processes and join them
     for dct in processes.values():
         for process in dct.values():
+            # Readers aren't started, if the supervisor is stopped early
+            if process.pid is None:
+                continue
             process.terminate()
             process.join()
     debug_processes_finish(processes)
@@ -153,9 +412,11 @@ def _inspect_processes(processes: dict, session: Session):
             continue
         processes[manager.camera]["reader"].kill() # Reader is not responding
         processes[manager.camera]["reader"].join()
-        processes[manager.camera]["reader"] = manager.ctx.Process(
-            target=run_read,
-            args=(manager,)
+        processes[manager.camera]["reader"] = _make_process(
+            manager.ctx,
+            f"CAM{manager.camera} reader",
+            run_read,
+            manager
         )
         manager.read_timestamp.value = time.time()
         processes[manager.camera]["reader"].start()